@@ -80,17 +80,26 @@ data_files = [
     'src/logs;logs'        # 添加日志文件夹
 ]
 
+# 如果项目目录中放置了ffmpeg，一并打包（视频水印功能需要）
+if os.path.isdir(os.path.join(script_dir, 'ffmpeg')):
+    data_files.append('ffmpeg;ffmpeg')
+    print("检测到ffmpeg目录，将打包到程序中")
+else:
+    print("警告：未找到ffmpeg目录，视频水印功能将依赖系统PATH中的ffmpeg")
+
 # 构建隐藏导入模块列表
 hidden_imports = [
     'PyPDF2', 
     'reportlab', 
     'PIL', 
     'fitz',
+    'numpy',
     'PyQt5',
     'PyQt5.QtCore',
     'PyQt5.QtGui', 
     'PyQt5.QtWidgets',
     'src.pdf_watermark_tab',
+    'src.image_watermark_tab',
     'src.video_watermark_tab',
     'src.about_tab',
     'src.workbench_app',
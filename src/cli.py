@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+命令行入口，提供不需要图形界面的服务和工具
+
+用法:
+    python src/cli.py watch 收件目录 发件目录 [--workers N] [--poll]
+    python src/cli.py serve [--host 127.0.0.1] [--port 8765] [--workers N] [--queue-size 32]
+    python src/cli.py trace 可疑文件.pdf [--password 密码] [--ledger 台账文件]
+    python src/cli.py ledger (--student 张三 | --source 课件.pdf | --output 输出.pdf | --from 日期 [--to 日期])
+    python src/cli.py verify 输出目录 [--source-dir 源文件目录] [--workers N]
+    python src/cli.py shard-submit 队列目录 输出目录 PDF或目录... --student 张三 [--dpi 150]
+    python src/cli.py shard-worker 队列目录 [--workers N] [--exit-when-idle]
+    python src/cli.py preflight PDF或目录... [--dpi 150] [--format flat|mrc] [--output-dir 输出目录]
+"""
+
+import os
+import sys
+import signal
+import argparse
+import multiprocessing
+
+# 同时支持 "src.xxx" 和 "config" 两种导入方式（与打包时的 --paths=src 一致）
+_src_dir = os.path.dirname(os.path.abspath(__file__))
+for _path in (os.path.dirname(_src_dir), _src_dir):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+
+def cmd_watch(args):
+    """监控收件目录，自动处理放入的PDF"""
+    from src.pdf_watermark_tab.watch_folder import WatchFolderService
+
+    service = WatchFolderService(
+        args.inbox, args.outbox,
+        max_workers=args.workers,
+        settle_seconds=args.settle,
+        poll_interval=args.interval,
+        use_inotify=not args.poll,
+    )
+
+    # Ctrl+C 或 kill 时等待正在处理的文件完成后退出
+    def handle_signal(signum, frame):
+        print("收到退出信号，等待当前任务完成...")
+        service.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    service.run()
+    return 0
+
+
+def cmd_serve(args):
+    """启动本地HTTP水印服务"""
+    from src.pdf_watermark_tab.http_service import run_service
+
+    run_service(args.host, args.port, max_workers=args.workers,
+                queue_size=args.queue_size, allowed_roots=args.allow_path)
+    return 0
+
+
+def cmd_trace(args):
+    """识别泄露文件的来源"""
+    import time
+    from src.pdf_watermark_tab.fingerprint import trace_pdf, format_fingerprint
+    from src.pdf_watermark_tab.ledger import DistributionLedger
+
+    with open(args.pdf, "rb") as f:
+        data = f.read()
+    started = time.perf_counter()
+    with DistributionLedger(args.ledger) as ledger:
+        try:
+            result = trace_pdf(data, ledger, args.password)
+        except ValueError as e:
+            print(f"追踪失败: {str(e)}")
+            return 1
+    elapsed = time.perf_counter() - started
+
+    if result.fingerprint is None:
+        print(f"没有找到指纹（{elapsed:.3f} 秒）")
+        return 1
+    print(f"指纹: {format_fingerprint(result.fingerprint)}（识别方式: {result.method}，{elapsed:.3f} 秒）")
+    if result.record is None:
+        print("台账中没有这个指纹的发放记录")
+        return 1
+    for label, key in (("学生", "student"), ("源文件", "source"), ("输出文件", "output"), ("发放时间", "issued_at")):
+        print(f"{label}: {result.record[key]}")
+    return 0
+
+
+def cmd_ledger(args):
+    """查询发放台账"""
+    from datetime import datetime
+    from src.pdf_watermark_tab.fingerprint import format_fingerprint
+    from src.pdf_watermark_tab.ledger import DistributionLedger, file_sha256
+
+    def content_hash(value):
+        # 参数是存在的文件时按内容计算哈希，否则当作哈希值本身
+        return file_sha256(value) if os.path.isfile(value) else value.lower()
+
+    with DistributionLedger(args.ledger) as ledger:
+        if args.student:
+            rows = ledger.copies_for_student(args.student, args.limit)
+        elif args.source:
+            rows = ledger.recipients_of_source(content_hash(args.source), args.limit)
+        elif args.output:
+            row = ledger.lookup_hash(content_hash(args.output))
+            rows = [row] if row else []
+        elif args.date_from:
+            date_to = args.date_to or datetime.now().strftime("%Y-%m-%d")
+            rows = ledger.copies_between(args.date_from, date_to, args.limit)
+        else:
+            print("请指定 --student、--source、--output 或 --from 之一")
+            return 1
+
+    for row in rows:
+        fingerprint = format_fingerprint(row["fingerprint"]) if row["fingerprint"] is not None else "-"
+        print(f"{row['issued_at']}  {row['student']}  {row['source']} -> {row['output']}"
+              f"  密码: {row['password']}  指纹: {fingerprint}")
+    print(f"共 {len(rows)} 条记录")
+    return 0
+
+
+def cmd_verify(args):
+    """校验输出目录中的加密PDF，并更新校验清单"""
+    import time
+    from src.pdf_watermark_tab.verify import verify_directory
+
+    started = time.perf_counter()
+    results = verify_directory(args.output_dir, args.source_dir, args.workers)
+    failed = [result for result in results if not result.ok]
+    for result in failed:
+        print(f"未通过: {result.output}（{result.error}）")
+    cached = sum(1 for result in results if result.cached)
+    print(f"校验完成: {len(results)} 个文件，未通过 {len(failed)} 个，"
+          f"{cached} 个未变化沿用清单结果（{time.perf_counter() - started:.1f} 秒）")
+    return 1 if failed else 0
+
+
+def _dpi_arg(value):
+    """命令行 --dpi 参数：与库接口使用相同的范围检查"""
+    from src.pdf_watermark_tab.pipeline import check_dpi
+
+    try:
+        return check_dpi(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def _collect_pdfs(paths):
+    """展开命令行中的PDF文件和目录（目录中的PDF按文件名排序）"""
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            inputs.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                          if name.lower().endswith(".pdf"))
+        else:
+            inputs.append(path)
+    return inputs
+
+
+def cmd_shard_submit(args):
+    """把一批PDF写入共享目录中的任务队列，等待各主机上的工作节点处理完成"""
+    import time
+    from datetime import datetime
+    from src.pdf_watermark_tab.shard_queue import ShardCoordinator
+    from src.pdf_watermark_tab.watermark_core import build_watermark_text
+    from src.pdf_watermark_tab.fingerprint import new_fingerprint
+    from src.pdf_watermark_tab.ledger import DistributionLedger, IssuedCopy
+    import config
+
+    inputs = _collect_pdfs(args.pdf)
+    if not inputs:
+        print("没有找到PDF文件")
+        return 1
+
+    watermark_text = build_watermark_text(args.student, args.datetime or datetime.now().strftime("%Y-%m-%d %H:%M"))
+    ledger = DistributionLedger(args.ledger) if config.LEDGER_ENABLED else None
+    try:
+        fingerprints = {path: new_fingerprint(ledger) for path in inputs} if config.FINGERPRINT_ENABLED else {}
+        coordinator = ShardCoordinator(args.queue_dir, lease_seconds=args.lease)
+        job_ids = coordinator.submit(inputs, args.output_dir, args.student, watermark_text, args.dpi,
+                                     fingerprints=fingerprints)
+        print(f"已写入 {len(job_ids)} 个任务，等待工作节点处理...")
+
+        started = time.perf_counter()
+        issued = []
+        per_worker = {}
+
+        def on_done(result):
+            source = coordinator.from_queue_path(result.job.get("input", ""))
+            per_worker[result.worker] = per_worker.get(result.worker, 0) + 1
+            if result.success:
+                issued.append(IssuedCopy(args.student, source, result.output, result.output_hash, result.password,
+                                         watermark_text, result.source_hash, result.job.get("fingerprint")))
+            done = sum(per_worker.values())
+            state = "完成" if result.success else "失败"
+            print(f"[{done}/{len(job_ids)}] {state}: {os.path.basename(source)}（节点 {result.worker or '-'}）")
+
+        results = coordinator.wait(job_ids, on_done)
+        if ledger is not None:
+            ledger.record(issued)
+    finally:
+        if ledger is not None:
+            ledger.close()
+
+    failed = sum(1 for result in results if not result.success)
+    print(f"处理完成: 成功 {len(results) - failed} 个，失败 {failed} 个（{time.perf_counter() - started:.1f} 秒）")
+    for worker, count in sorted(per_worker.items()):
+        print(f"  {worker or '-'}: {count} 个")
+    return 1 if failed else 0
+
+
+def cmd_shard_worker(args):
+    """在本机运行工作节点，从共享目录队列领取并处理任务"""
+    from src.pdf_watermark_tab.shard_queue import ShardWorker
+
+    worker = ShardWorker(args.queue_dir, max_workers=args.workers, worker_id=args.name)
+
+    # Ctrl+C 或 kill 时处理完已领取的任务后退出
+    def handle_signal(signum, frame):
+        print("收到退出信号，处理完已领取的任务后退出...")
+        worker.stop()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    worker.run(exit_when_idle=args.exit_when_idle)
+    return 0
+
+
+def cmd_preflight(args):
+    """预估一批PDF的耗时、内存、临时磁盘和输出大小，以JSON输出"""
+    import json
+    from contextlib import redirect_stdout
+
+    inputs = _collect_pdfs(args.pdf)
+    if not inputs:
+        print("没有找到PDF文件", file=sys.stderr)
+        return 1
+    # 标准输出只保留JSON，分析过程中的提示改写到标准错误
+    with redirect_stdout(sys.stderr):
+        from src.pdf_watermark_tab.preflight import preflight
+        from src.pdf_watermark_tab.size_target import max_bytes_from_mb
+        report = preflight(inputs, args.dpi, args.format, args.output_dir, args.workers,
+                           max_bytes=max_bytes_from_mb(args.max_size_mb))
+    print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+    return 0
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="DOTRIX Workbench 命令行工具")
+    subparsers = parser.add_subparsers(dest="command")
+
+    watch = subparsers.add_parser("watch", help="监控文件夹，自动为新放入的PDF加水印、加密")
+    watch.add_argument("inbox", help="收件目录，子目录中的 dotrix.json 配置学生名和DPI")
+    watch.add_argument("outbox", help="发件目录")
+    watch.add_argument("--workers", type=int, default=None, help="工作进程数，默认与CPU核心数一致")
+    watch.add_argument("--settle", type=float, default=1.0, help="文件稳定多少秒后开始处理（去抖动）")
+    watch.add_argument("--interval", type=float, default=2.0, help="轮询扫描间隔（秒）")
+    watch.add_argument("--poll", action="store_true", help="强制使用轮询（网络共享目录建议开启）")
+    watch.set_defaults(func=cmd_watch)
+
+    serve = subparsers.add_parser("serve", help="启动本地HTTP水印服务，按需生成加密PDF")
+    serve.add_argument("--host", default="127.0.0.1", help="监听地址，默认只监听本机")
+    serve.add_argument("--port", type=int, default=8765, help="监听端口")
+    serve.add_argument("--workers", type=int, default=None, help="工作进程数，默认与CPU核心数一致")
+    serve.add_argument("--queue-size", type=int, default=32, help="排队任务上限，超出时返回503")
+    serve.add_argument("--allow-path", action="append", default=[],
+                       help="允许按服务器路径请求的目录，可多次指定")
+    serve.set_defaults(func=cmd_serve)
+
+    trace = subparsers.add_parser("trace", help="从泄露的PDF中读取指纹，查出发放给了哪个学生")
+    trace.add_argument("pdf", help="可疑的PDF文件")
+    trace.add_argument("--password", action="append", default=[],
+                       help="打开加密文件的密码，可多次指定；不指定时依次尝试索引中的密码")
+    trace.add_argument("--ledger", default=None, help="发放台账文件，默认使用用户数据目录下的台账")
+    trace.set_defaults(func=cmd_trace)
+
+    ledger = subparsers.add_parser("ledger", help="查询发放台账：发给某个学生的文件、某个课件发给了谁")
+    ledger.add_argument("--student", help="列出发给该学生的所有文件")
+    ledger.add_argument("--source", help="列出该源文件（文件路径或SHA-256）发给了哪些学生")
+    ledger.add_argument("--output", help="查询某个输出文件（文件路径或SHA-256）的发放记录")
+    ledger.add_argument("--from", dest="date_from", help="列出从该日期（YYYY-MM-DD）起发放的文件")
+    ledger.add_argument("--to", dest="date_to", help="与 --from 一起使用的结束日期（含），默认今天")
+    ledger.add_argument("--limit", type=int, default=None, help="最多显示的记录数")
+    ledger.add_argument("--ledger", default=None, help="发放台账文件，默认使用用户数据目录下的台账")
+    ledger.set_defaults(func=cmd_ledger)
+
+    verify = subparsers.add_parser("verify", help="校验输出目录中的加密PDF：密码、页数、完整性，并写出校验清单")
+    verify.add_argument("output_dir", help="输出目录")
+    verify.add_argument("--source-dir", default=None, help="源文件目录，提供时比较输出与源文件的页数")
+    verify.add_argument("--workers", type=int, default=None, help="进程数，默认与CPU核心数一致")
+    verify.set_defaults(func=cmd_verify)
+
+    shard_submit = subparsers.add_parser("shard-submit", help="多机分片：把一批PDF写入共享目录队列并等待完成")
+    shard_submit.add_argument("queue_dir", help="共享目录中的队列目录，各工作节点使用同一个目录")
+    shard_submit.add_argument("output_dir", help="输出目录，应位于各主机都能访问的共享目录中")
+    shard_submit.add_argument("pdf", nargs="+", help="PDF文件或包含PDF的目录")
+    shard_submit.add_argument("--student", required=True, help="学生姓名（用于水印和拼音密码）")
+    shard_submit.add_argument("--dpi", type=_dpi_arg, default=150, help="安全转换的渲染分辨率")
+    shard_submit.add_argument("--datetime", default=None, help="水印中的日期时间，默认为当前时间")
+    shard_submit.add_argument("--lease", type=float, default=None,
+                              help="工作节点多少秒没有续约视为失联，默认使用配置中的值")
+    shard_submit.add_argument("--ledger", default=None, help="发放台账文件，默认使用用户数据目录下的台账")
+    shard_submit.set_defaults(func=cmd_shard_submit)
+
+    shard_worker = subparsers.add_parser("shard-worker", help="多机分片：在本机运行工作节点")
+    shard_worker.add_argument("queue_dir", help="共享目录中的队列目录")
+    shard_worker.add_argument("--workers", type=int, default=None, help="本机进程数，默认与CPU核心数一致")
+    shard_worker.add_argument("--name", default=None, help="节点名称，默认为 主机名-进程号")
+    shard_worker.add_argument("--exit-when-idle", action="store_true", help="队列中没有等待的任务时退出")
+    shard_worker.set_defaults(func=cmd_shard_worker)
+
+    preflight = subparsers.add_parser("preflight", help="预估一批PDF的处理耗时、内存、临时磁盘和输出大小（JSON）")
+    preflight.add_argument("pdf", nargs="+", help="PDF文件或包含PDF的目录")
+    preflight.add_argument("--dpi", type=_dpi_arg, default=150, help="安全转换的渲染分辨率")
+    preflight.add_argument("--format", choices=("flat", "mrc"), default=None,
+                           help="安全输出格式，默认使用配置中的值")
+    preflight.add_argument("--output-dir", default=None, help="输出目录，提供时检查剩余磁盘空间")
+    preflight.add_argument("--workers", type=int, default=None, help="进程数上限，默认与CPU核心数一致")
+    preflight.add_argument("--max-size-mb", type=float, default=None, help="输出文件大小上限（MB）")
+    preflight.set_defaults(func=cmd_preflight)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not getattr(args, "func", None):
+        parser.print_help()
+        return 1
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
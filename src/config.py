@@ -5,6 +5,8 @@
 配置文件，存储应用程序的各种设置
 """
 
+import os
+
 # 应用程序名称和版本
 APP_VERSION = "1.0.1"
 APP_NAME = f"DOTRIX Workbench V{APP_VERSION} 点线成面软件工程部 "
@@ -31,6 +33,7 @@ PROGRESS_BAR_HEIGHT = 15
 # 选项卡设置
 TAB_NAMES = {
     "pdf": "PDF水印",
+    "image": "图片水印",
     "video": "视频水印",
     "about": "关于点线成面DOTRIX"
 }
@@ -99,8 +102,91 @@ UI_STYLES = {
 # 文件筛选器设置
 FILE_FILTERS = {
     "pdf": "PDF文件 (*.pdf)",
-    "image": "图片文件 (*.png *.jpg *.jpeg *.gif *.bmp)"
+    "image": "图片文件 (*.png *.jpg *.jpeg *.gif *.bmp)",
+    "video": "视频文件 (*.mp4 *.mov *.mkv *.avi *.flv *.wmv)"
 }
 
 # 支持的图片格式
-SUPPORTED_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp') 
\ No newline at end of file
+SUPPORTED_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp') 
+
+# 支持的视频格式
+SUPPORTED_VIDEO_EXTENSIONS = ('.mp4', '.mov', '.mkv', '.avi', '.flv', '.wmv')
+
+# 视频水印设置
+FFMPEG_BINARY = "ffmpeg"        # ffmpeg可执行文件名，优先使用打包目录下的ffmpeg
+VIDEO_BATCH_FRAMES = 8          # 每批混合的帧数，决定内存占用上限
+VIDEO_OVERLAY_DPI = 150         # 视频像素与水印PDF点的换算分辨率
+VIDEO_CRF = 23                  # x264质量参数，越小画质越好
+VIDEO_PRESET = "veryfast"       # x264编码速度预设
+
+# 图片水印设置
+IMAGE_OVERLAY_DPI = 150         # 图片没有DPI信息时，像素与水印PDF点的换算分辨率
+IMAGE_JPEG_QUALITY = 92         # 输出JPEG的质量
+IMAGE_WORKERS = 0               # 解码/编码线程数，0表示按CPU核心数自动设置
+
+# 用户数据目录，保存吞吐量统计等运行数据
+USER_DATA_DIR = os.path.join(os.path.expanduser("~"), ".dotrix_workbench")
+
+# 批处理调度设置
+THROUGHPUT_STATS_FILE = "throughput_stats.json"  # 各步骤历史吞吐量，用于估算剩余时间
+SCHEDULE_STRATEGY = "shortest"  # 默认处理顺序: shortest 小文件优先 / longest 大文件优先 / list 列表顺序
+MEMORY_BUDGET_FRACTION = 0.7    # 批处理最多使用当前可用内存的比例，超出时减少同时处理的文件数
+WORKER_BASE_MB = 150            # 每个工作进程自身（Python、PyMuPDF、NumPy）占用的内存
+PREFLIGHT_SAMPLE_PAGES = 8      # 预估时每个文件抽取多少页统计图片占比
+JOB_TIMEOUT_SECONDS = 600       # 单个文件的处理时间上限，超时记为失败，0表示不限制
+JOB_KILL_GRACE_SECONDS = 30     # 超时或取消后工作进程仍未停下（卡在解析或渲染中）时，再等多久强制结束
+JOB_MEMORY_LIMIT_MB = 4096      # 单个文件在工作进程中可以额外使用的内存，超出时记为失败，0表示不限制（仅Linux/macOS）
+WORKER_RECYCLE_JOBS = 200       # 常驻进程池中平均每个工作进程处理多少个文件后换用新进程，限制内存增长，0表示不替换
+WORKER_HEALTH_TIMEOUT_SECONDS = 30  # 开始新批次前检查常驻进程池，工作进程多久没有响应视为异常并重新创建
+
+# 安全转换设置
+SECURE_RENDER_MODE = "raster"   # raster: 原页面渲染（可缓存）后混合水印图层 / vector: 先合并矢量水印再整页渲染
+RASTER_CACHE_DIR = "raster_cache"  # 页面栅格缓存目录（位于用户数据目录下）
+RASTER_CACHE_MAX_MB = 2048      # 页面栅格缓存容量上限，0表示不使用缓存（缓存的是不含水印的页面，按页面内容加密保存）
+RASTER_CACHE_MAX_AGE_DAYS = 7   # 页面栅格缓存中多少天没有使用的页面被删除，0表示不限制
+RASTER_OVERLAY_VARIANTS = 0     # 栅格模式下随机位置水印的变体数量，各页轮流使用；0表示每页各自随机（与vector模式相同）
+SECURE_MAX_DPI = 600            # 安全转换允许的最高渲染分辨率（DPI必须大于0且不超过此值）
+SECURE_OUTPUT_FORMAT = "flat"   # flat: 整页RGB图像 / mrc: 高分辨率1位文字层 + 低分辨率JPEG背景
+RENDER_COLORSPACE = "auto"      # auto: 黑白页面按单通道灰度渲染 / rgb / gray（仅flat格式）
+GRAY_PROBE_DPI = 36             # 检测页面颜色时试渲染的分辨率
+GRAY_MAX_CHROMA = 16            # 通道最大差值不超过此值的像素视为灰色
+BLANK_PAGE_TOLERANCE = 6        # 各通道最大最小值之差不超过此值的页面视为空白，用纯色代替图像；-1表示不检测
+TILE_PIXEL_THRESHOLD = 20000000 # 渲染后超过此像素数的页面（海报、工程图纸）分块渲染，0表示不分块
+TILE_SIZE = 2048                # 分块渲染时每块的边长（像素），决定单页渲染的内存峰值
+
+# 文件大小上限设置（按大小上限自动降低DPI和JPEG质量）
+MAX_OUTPUT_MB = 0               # 默认的输出文件大小上限（MB），0表示不限制
+SIZE_MIN_DPI = 72               # 搜索时DPI的下限
+SIZE_MIN_JPEG_QUALITY = 25      # 搜索时MRC背景JPEG质量的下限
+SIZE_SAMPLE_PAGES = 4           # 抽取多少页估算整个文件的大小
+SIZE_SEARCH_STEPS = 5           # 二分查找的次数
+SIZE_TARGET_MARGIN = 0.95       # 估算大小不超过上限的这个比例，给外推误差留出余量
+SIZE_CORRECTIONS = 2            # 整个文件实际超出上限时最多再降低几次设置
+SIZE_TUNING_DIR = "size_tuning" # 按源文件缓存找到的设置（位于用户数据目录下）
+
+# 泄露追踪设置
+FINGERPRINT_ENABLED = True      # 每份输出嵌入唯一的指纹（文件标识和页边距点阵），用于追踪泄露来源
+
+# 快速网页查看设置
+LINEARIZE_OUTPUT = True         # 加密输出同时线性化，浏览器边下载边显示第一页（需要安装pikepdf，没有时按普通方式保存）
+
+# 发放台账设置
+LEDGER_ENABLED = True           # 记录每份发出的文件（学生、源文件、水印文字、密码、输出哈希）
+LEDGER_FILE = "ledger.sqlite3"  # 发放台账数据库（位于用户数据目录下）
+
+# 输出校验设置
+VERIFY_OUTPUTS = True           # 批处理完成后重新打开每个输出，检查密码、页数和完整性
+VERIFY_MANIFEST_FILE = "dotrix_manifest.json"  # 输出目录中的校验清单（SHA-256、页数、校验结果）
+
+# 多机分片设置（共享目录任务队列）
+SHARD_LEASE_SECONDS = 60        # 领取的任务多久没有续约视为工作节点失联，放回队列由其他节点处理
+SHARD_RENEW_SECONDS = 10        # 工作节点续约（更新租约文件修改时间）的间隔
+SHARD_MAX_ATTEMPTS = 3          # 同一任务因节点失联最多分配的次数，超过后记为失败
+SHARD_POLL_SECONDS = 1.0        # 扫描共享目录的间隔（秒）
+
+# MRC安全输出设置
+MRC_MASK_DPI = 300              # 文字层（1位蒙版）分辨率
+MRC_BACKGROUND_DPI = 100        # 背景JPEG分辨率
+MRC_JPEG_QUALITY = 60           # 背景JPEG质量
+MRC_TEXT_THRESHOLD = 140        # 亮度低于此值的像素归入文字层
+MRC_MAX_CHROMA = 60             # 颜色饱和度高于此值的像素保留在背景中（彩色文字保持颜色）
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图片水印核心模块，为截图、扫描件等图片批量添加与PDF相同的LOGO、网格文字和水平文字水印
+
+每种分辨率的水印图层只渲染一次并缓存，混合使用NumPy向量化计算，
+图片的解码和编码在线程池中并行执行（Pillow和NumPy在这些操作中会释放GIL）
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+from src.pdf_watermark_tab.raster_overlay import get_cached_overlay
+import config
+
+
+def _image_dpi(img):
+    """读取图片自带的DPI，扫描件通常为300，截图一般没有"""
+    dpi = img.info.get("dpi")
+    if dpi and dpi[0] and float(dpi[0]) >= 36:
+        return int(round(float(dpi[0])))
+    return config.IMAGE_OVERLAY_DPI
+
+
+def watermark_image_file(input_path, output_path, watermark_image, watermark_text,
+                         jpeg_quality=config.IMAGE_JPEG_QUALITY):
+    """
+    为单张图片添加水印
+
+    参数:
+        input_path: 输入图片路径
+        output_path: 输出图片路径，格式由扩展名决定
+        watermark_image: 中心水印图片路径
+        watermark_text: 水印文字内容
+        jpeg_quality: 输出JPEG的质量
+    """
+    with Image.open(input_path) as img:
+        img.load()
+        dpi = _image_dpi(img)
+        save_kwargs = {"dpi": (dpi, dpi)}
+
+        # 保留透明通道，其余格式统一转换为RGB进行混合
+        alpha = None
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            alpha = rgba.getchannel("A")
+            rgb = rgba.convert("RGB")
+        else:
+            rgb = img.convert("RGB")
+
+    pixels = np.array(rgb, dtype=np.uint8)
+    overlay = get_cached_overlay(pixels.shape[1], pixels.shape[0], dpi, watermark_image, watermark_text)
+    overlay.blend(pixels)
+
+    result = Image.fromarray(pixels, "RGB")
+    if alpha is not None:
+        result.putalpha(alpha)
+
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext in (".jpg", ".jpeg"):
+        if result.mode != "RGB":
+            result = result.convert("RGB")
+        save_kwargs.update(quality=jpeg_quality, optimize=False)
+    elif ext == ".bmp" and result.mode == "RGBA":
+        result = result.convert("RGB")
+
+    result.save(output_path, **save_kwargs)
+
+
+def batch_watermark_images(input_files, output_dir, watermark_image, watermark_text, student_name,
+                           max_workers=None, progress_callback=None):
+    """
+    批量为图片添加水印
+
+    参数:
+        input_files: 输入图片路径列表
+        output_dir: 输出目录
+        watermark_image: 中心水印图片路径
+        watermark_text: 水印文字内容
+        student_name: 学生姓名，用作输出文件名后缀
+        max_workers: 线程数，默认按CPU核心数设置
+        progress_callback: 进度回调 callback(已完成数, 总数)
+
+    返回:
+        tuple: (成功数, 失败数)
+    """
+    if not max_workers:
+        max_workers = config.IMAGE_WORKERS or min(32, (os.cpu_count() or 1) + 4)
+
+    successful = 0
+    failed = 0
+    total = len(input_files)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for input_path in input_files:
+            name, ext = os.path.splitext(os.path.basename(input_path))
+            output_path = os.path.join(output_dir, f"{name}_{student_name}{ext}")
+            future = executor.submit(watermark_image_file, input_path, output_path,
+                                     watermark_image, watermark_text)
+            futures[future] = input_path
+
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                future.result()
+                successful += 1
+            except Exception as e:
+                print(f"处理图片 {futures[future]} 时出错: {str(e)}")
+                failed += 1
+            if progress_callback:
+                progress_callback(done, total)
+
+    print(f"图片水印处理完成，成功 {successful} 张，失败 {failed} 张，输出目录: {output_dir}")
+    return successful, failed
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+图片水印选项卡模块，为截图、扫描件等图片批量添加与PDF相同的LOGO和学生文字水印
+"""
+
+import os
+from PyQt5.QtWidgets import QWidget, QApplication, QMessageBox, QFileDialog, QListWidgetItem
+from PyQt5.QtCore import Qt
+
+from src.pdf_watermark_tab.watermark_core import get_application_path, build_watermark_text
+from src.image_watermark_tab.image_core import batch_watermark_images
+from src.workbench_app.ui_image_watermark_tab import ImageWatermarkUI
+import config
+
+class ImageWatermarkTab(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.image_files = []
+        # 与PDF水印使用相同的中文LOGO
+        app_path = get_application_path()
+        self.watermark_image = os.path.join(app_path, config.PICTURES_DIR, "dotrix_logo_chn.png")
+        self.output_dir = ""
+        self.watermark_text = config.DEFAULT_WATERMARK_TEXT
+
+        # 初始化UI
+        self.ui = ImageWatermarkUI()
+        self.ui.setup_ui(self)
+
+    def add_image_files(self, filepaths):
+        """将图片文件加入列表（拖入文件夹时递归查找其中的图片），返回新增数量"""
+        # 如果有占位符，先清除
+        if self.has_placeholder:
+            self.image_list.clear()
+            self.has_placeholder = False
+
+        # 展开文件夹，扫描件和截图通常整目录提供
+        candidates = []
+        for filepath in filepaths:
+            if os.path.isdir(filepath):
+                for root, _, names in os.walk(filepath):
+                    candidates.extend(os.path.join(root, n) for n in sorted(names))
+            else:
+                candidates.append(filepath)
+
+        new_files_added = 0
+        known = set(self.image_files)
+        for filepath in candidates:
+            if filepath.lower().endswith(config.SUPPORTED_IMAGE_EXTENSIONS) and filepath not in known:
+                known.add(filepath)
+                self.image_files.append(filepath)
+                self.image_list.addItem(os.path.basename(filepath))
+                new_files_added += 1
+
+        if new_files_added > 0:
+            self.update_file_count()
+            self.status_label.setText(f"已添加 {new_files_added} 个新图片文件")
+            self.status_label.setStyleSheet("color: green;")
+
+            # 如果还没选择输出目录，自动设置为第一张图片所在的目录
+            if not self.output_dir:
+                self.output_dir = os.path.dirname(self.image_files[0])
+                self.output_label.setText(self.output_dir)
+        else:
+            self.status_label.setText("未发现新的图片文件或文件已存在")
+            self.status_label.setStyleSheet("color: orange;")
+        return new_files_added
+
+    def drag_image(self, files):
+        """处理图片文件拖放，支持多个文件和文件夹"""
+        self.add_image_files(files)
+
+    def select_image_files(self):
+        """选择多个图片文件"""
+        filepaths, _ = QFileDialog.getOpenFileNames(
+            self,
+            "选择图片文件",
+            "",
+            config.FILE_FILTERS["image"]
+        )
+        if filepaths:
+            self.add_image_files(filepaths)
+
+    def remove_selected_image(self):
+        """移除选中的图片文件"""
+        selected_items = self.image_list.selectedItems()
+        if not selected_items:
+            QMessageBox.information(self, "提示", "请先选择要删除的文件")
+            return
+
+        for item in selected_items:
+            index = self.image_list.row(item)
+            del self.image_files[index]
+            self.image_list.takeItem(index)
+
+        self.update_file_count()
+
+    def clear_image_list(self):
+        """清空图片文件列表"""
+        if not self.image_files:
+            return
+
+        reply = QMessageBox.question(
+            self, '确认', '确定要清空所有文件吗？',
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+
+        if reply == QMessageBox.Yes:
+            self.image_files.clear()
+            self.image_list.clear()
+            self.update_file_count()
+
+            # 添加回占位符
+            placeholder = QListWidgetItem('将图片文件拖放到此处或点击"添加图片"按钮')
+            placeholder.setFlags(Qt.NoItemFlags)
+            placeholder.setForeground(Qt.gray)
+            self.image_list.addItem(placeholder)
+            self.has_placeholder = True
+
+            self.status_label.setText("已清空文件列表")
+            self.status_label.setStyleSheet("color: blue;")
+
+    def update_file_count(self):
+        """更新文件计数"""
+        count = len(self.image_files)
+        self.file_count_label.setText(f"已选择: {count} 个文件")
+
+    def select_output_dir(self):
+        """选择输出目录"""
+        dirpath = QFileDialog.getExistingDirectory(
+            self,
+            "选择输出目录"
+        )
+        if dirpath:
+            self.output_dir = dirpath
+            self.output_label.setText(self.output_dir)
+
+    def batch_process(self):
+        """批量处理图片文件"""
+        if not self.image_files:
+            QMessageBox.critical(self, "错误", "请添加至少一个图片文件")
+            return
+        if not os.path.exists(self.watermark_image):
+            QMessageBox.critical(self, "错误", "水印图片不存在")
+            return
+        if not self.output_dir:
+            QMessageBox.critical(self, "错误", "请选择输出目录")
+            return
+
+        student_name = self.student_input.text().strip()
+        if not student_name:
+            QMessageBox.critical(self, "错误", "请输入该图片将要交付给的学生实名")
+            return
+
+        try:
+            self.generate_btn.setEnabled(False)
+            self.generate_btn.setText("处理中...")
+            self.status_label.setText("正在处理，请稍候...")
+            self.status_label.setStyleSheet("color: orange;")
+            QApplication.processEvents()
+
+            total_files = len(self.image_files)
+            self.progress_bar.setMaximum(total_files)
+
+            def on_progress(done, total):
+                self.progress_bar.setValue(done)
+                self.status_label.setText(f"处理中: 已完成 {done}/{total} 张图片")
+                QApplication.processEvents()
+
+            successful, failed = batch_watermark_images(
+                self.image_files, self.output_dir, self.watermark_image,
+                self.watermark_text, student_name, progress_callback=on_progress
+            )
+
+            self.progress_bar.setValue(total_files)
+
+            status_color = "green" if failed == 0 else "orange"
+            self.status_label.setText(f"处理完成! 成功: {successful}, 失败: {failed}")
+            self.status_label.setStyleSheet(f"color: {status_color};")
+
+            QMessageBox.information(
+                self,
+                "处理完成",
+                f"批量处理完成!\n成功: {successful} 个文件\n失败: {failed} 个文件\n输出目录: {self.output_dir}"
+            )
+
+        except Exception as e:
+            self.status_label.setText(f"错误: {str(e)}")
+            self.status_label.setStyleSheet("color: red;")
+            QMessageBox.critical(self, "错误", f"处理时出错: {str(e)}")
+        finally:
+            self.generate_btn.setEnabled(True)
+            self.generate_btn.setText("批量处理")
+
+    def update_watermark_text(self):
+        """根据输入参数更新水印文本"""
+        datetime = self.date_input.dateTime().toString("yyyy-MM-dd HH:mm")
+        student = self.student_input.text().strip()
+
+        if student:
+            self.watermark_text = build_watermark_text(student, datetime)
+            self.status_label.setText(f"水印文本已更新: {self.watermark_text}")
+            self.status_label.setStyleSheet("color: green;")
+        else:
+            self.status_label.setText("请输入该图片将要交付给的学生实名")
+            self.status_label.setStyleSheet("color: orange;")
@@ -3,6 +3,12 @@ PDF Watermark Tab Package
 Contains all code related to PDF watermarking functionality
 """
 
-from .pdf_watermark_tab import PDFWatermarkTab
+__all__ = ['PDFWatermarkTab']
 
-__all__ = ['PDFWatermarkTab'] 
\ No newline at end of file
+
+def __getattr__(name):
+    # 延迟导入Qt选项卡，核心水印模块可以在没有GUI的环境中单独导入
+    if name == 'PDFWatermarkTab':
+        from .pdf_watermark_tab import PDFWatermarkTab
+        return PDFWatermarkTab
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
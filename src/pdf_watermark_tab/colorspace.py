@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+页面颜色检测模块，黑白页面按单通道灰度渲染
+
+大部分讲义是白底黑字，按RGB渲染时三个通道的值完全相同。先以很低的分辨率试渲染一次，
+没有彩色像素的页面改用 csGRAY 渲染和插入，渲染、混合水印和压缩的数据量都只有RGB的三分之一。
+水印本身是灰色的，混合后仍然是灰度图像
+"""
+
+import fitz  # PyMuPDF
+import numpy as np
+
+import config
+from src.pdf_watermark_tab.image_dedup import count_metric
+
+
+COLORSPACE_AUTO = "auto"
+COLORSPACE_RGB = "rgb"
+COLORSPACE_GRAY = "gray"
+
+
+def is_grayscale_page(page, probe_dpi=None, max_chroma=None):
+    """
+    以低分辨率试渲染页面，判断页面是否只含灰色
+
+    参数:
+        page: fitz.Page
+        probe_dpi: 试渲染分辨率，默认 config.GRAY_PROBE_DPI
+        max_chroma: 最大通道差不超过此值的像素视为灰色，默认 config.GRAY_MAX_CHROMA
+
+    返回:
+        bool: 没有任何彩色像素时返回True
+    """
+    probe_dpi = probe_dpi or config.GRAY_PROBE_DPI
+    max_chroma = config.GRAY_MAX_CHROMA if max_chroma is None else max_chroma
+    zoom = probe_dpi / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False)
+    samples = np.frombuffer(pix.samples, dtype=np.uint8).reshape(-1, pix.n)
+    r, g, b = samples[:, 0], samples[:, 1], samples[:, 2]
+    chroma = np.maximum(np.maximum(r, g), b) - np.minimum(np.minimum(r, g), b)
+    return not np.any(chroma > max_chroma)
+
+
+def resolve_colorspace(page, requested=None):
+    """
+    决定页面的渲染颜色空间
+
+    参数:
+        requested: "auto" 自动检测 / "rgb" / "gray"，默认 config.RENDER_COLORSPACE
+
+    返回:
+        str: "rgb" 或 "gray"
+    """
+    requested = requested or config.RENDER_COLORSPACE
+    if requested in (COLORSPACE_RGB, COLORSPACE_GRAY):
+        return requested
+    try:
+        return COLORSPACE_GRAY if is_grayscale_page(page) else COLORSPACE_RGB
+    except Exception as e:
+        print(f"检测页面颜色时出错，按RGB渲染: {str(e)}")
+        return COLORSPACE_RGB
+
+
+def fitz_colorspace(colorspace):
+    """把 "rgb"/"gray" 转换为PyMuPDF的颜色空间对象"""
+    return fitz.csGRAY if colorspace == COLORSPACE_GRAY else fitz.csRGB
+
+
+def count_page(metrics, colorspace):
+    """在调用方提供的统计字典中累计各颜色空间的页数（gray_pages / rgb_pages）"""
+    count_metric(metrics, f"{colorspace}_pages")
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+泄露追踪：为每份输出嵌入机器可读的指纹，并从可疑文件中快速识别来源
+
+每份输出分配一个随机的48位指纹，连同16位校验码以两种形式嵌入:
+- 文件标识（trailer中的/ID）：加密时不加密，不需要密码就能读取
+- 页面左下角页边距中的一小块灰色点阵：每一位用一对方格表示，前深后浅为1，前浅后深为0。
+  点阵在安全转换时直接写入页面像素（stamp_pattern_pixels），与页面内容是同一张图像，
+  删除内容流或改写/ID都去不掉；文件被另存、打印成PDF或截图后仍然可以读取
+发放的每份文件连同指纹记录在发放台账（ledger.DistributionLedger）中。
+
+追踪时依次尝试：按整个文件的SHA-256查台账（原样转发的文件）、读取文件标识、
+以低分辨率只渲染点阵所在的小块区域，用NumPy一次取出所有方格的亮度并解码。
+"""
+
+import hashlib
+import secrets
+import binascii
+
+import fitz  # PyMuPDF
+import numpy as np
+
+
+FINGERPRINT_BITS = 48
+_CHECK_BITS = 16
+_ROWS = 4
+_COLS = 2 * (FINGERPRINT_BITS + _CHECK_BITS) // _ROWS
+_ID_PREFIX_BYTES = (FINGERPRINT_BITS + _CHECK_BITS) // 8
+# 点阵方格的边长占页面短边的比例，A4页面上约2.5点
+_CELL_FRACTION = 1 / 240
+# 深色方格的灰度（0黑 ~ 1白）
+_DARK_GRAY = 0.55
+_DARK_LEVEL = round(_DARK_GRAY * 255)
+# 追踪时每个方格渲染成的像素数，以及一对方格之间至少要有的亮度差
+_SCAN_CELL_PIXELS = 4
+_MIN_CONTRAST = 24
+# 追踪时最多检查的页数，前几页被遮挡时继续检查后面的页面
+_SCAN_MAX_PAGES = 8
+
+
+def format_fingerprint(fingerprint):
+    """指纹的十六进制表示，用于日志和命令行输出"""
+    return f"{fingerprint:012X}"
+
+
+def new_fingerprint(index=None):
+    """生成一个新的随机指纹，提供发放台账时避开已发放的指纹"""
+    while True:
+        fingerprint = secrets.randbits(FINGERPRINT_BITS)
+        if fingerprint and (index is None or index.lookup(fingerprint) is None):
+            return fingerprint
+
+
+def _encode_value(fingerprint):
+    """指纹在高位、CRC16校验码在低位的64位整数"""
+    payload = fingerprint.to_bytes(FINGERPRINT_BITS // 8, "big")
+    return (fingerprint << _CHECK_BITS) | binascii.crc_hqx(payload, 0xFFFF)
+
+
+def _decode_value(value):
+    """64位整数还原为指纹，校验失败时返回None"""
+    fingerprint = value >> _CHECK_BITS
+    payload = fingerprint.to_bytes(FINGERPRINT_BITS // 8, "big")
+    if fingerprint == 0 or binascii.crc_hqx(payload, 0xFFFF) != value & ((1 << _CHECK_BITS) - 1):
+        return None
+    return fingerprint
+
+
+def _encode_bits(fingerprint):
+    """指纹和校验码按从高到低的顺序展开为位数组"""
+    value = _encode_value(fingerprint)
+    total = FINGERPRINT_BITS + _CHECK_BITS
+    return [(value >> (total - 1 - i)) & 1 for i in range(total)]
+
+
+def _decode_bits(bits):
+    """位数组还原为指纹，校验失败时返回None"""
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return _decode_value(value)
+
+
+def _id_bytes(fingerprint):
+    """文件标识的内容：指纹和校验码在前，其余为随机字节"""
+    return _encode_value(fingerprint).to_bytes(_ID_PREFIX_BYTES, "big") + secrets.token_bytes(8)
+
+
+def _read_id(doc):
+    """从文件标识中读取指纹，没有或校验失败时返回None"""
+    kind, value = doc.xref_get_key(-1, "ID")
+    if kind != "array" or not value.startswith("[<"):
+        return None
+    try:
+        data = bytes.fromhex(value[2:value.index(">")])
+    except ValueError:
+        return None
+    if len(data) < _ID_PREFIX_BYTES:
+        return None
+    return _decode_value(int.from_bytes(data[:_ID_PREFIX_BYTES], "big"))
+
+
+def _pattern_layout(rect):
+    """点阵在页面上的位置: (左上角x, 左上角y, 方格边长)，按页面尺寸等比例放置"""
+    cell = min(rect.width, rect.height) * _CELL_FRACTION
+    x0 = rect.x0 + rect.width * 0.02
+    y0 = rect.y1 - rect.height * 0.01 - _ROWS * cell
+    return x0, y0, cell
+
+
+def _pattern_cells(fingerprint, dark):
+    """点阵中深色（dark为True）或浅色方格的 (行, 列)"""
+    for i, bit in enumerate(_encode_bits(fingerprint)):
+        # 1: 前一格深色，0: 后一格深色
+        yield divmod(2 * i + (0 if bit == dark else 1), _COLS)
+
+
+def stamp_fingerprint(doc, fingerprint, draw_pattern=False):
+    """
+    把指纹写入文件标识
+
+    点阵通常已在安全转换时由 stamp_pattern_pixels 写入页面像素；
+    没有栅格化的文档（安全转换失败时的退回输出）传入draw_pattern，以矢量方格绘制点阵
+
+    参数:
+        doc: 安全转换后（加密前）的fitz.Document
+        fingerprint: new_fingerprint 生成的指纹
+        draw_pattern: 是否在每一页的左下角绘制矢量点阵
+    """
+    identifier = _id_bytes(fingerprint).hex().upper()
+    doc.xref_set_key(-1, "ID", f"[<{identifier}><{identifier}>]")
+    if not draw_pattern:
+        return
+
+    for page in doc:
+        x0, y0, cell = _pattern_layout(page.rect)
+        shape = page.new_shape()
+        # 浅色方格也画出来（白色），页面内容延伸到页边距时点阵仍然可以读取
+        for dark in (False, True):
+            for row, col in _pattern_cells(fingerprint, dark):
+                shape.draw_rect(fitz.Rect(x0 + col * cell, y0 + row * cell,
+                                          x0 + (col + 1) * cell, y0 + (row + 1) * cell))
+            shape.finish(color=None, fill=(_DARK_GRAY if dark else 1.0,) * 3, width=0)
+        shape.commit()
+
+
+def stamp_pattern_pixels(pixels, fingerprint, page_size, origin=(0, 0)):
+    """
+    把指纹点阵直接写入页面图像的像素（在混合水印之后、编码之前调用）
+
+    参数:
+        pixels: 形状为 (H, W, C) 的uint8数组，原地修改
+        fingerprint: new_fingerprint 生成的指纹
+        page_size: 整页的像素尺寸 (宽, 高)，点阵位置按整页计算
+        origin: pixels 左上角在整页中的像素坐标，分块渲染时为块的位置
+    """
+    x0, y0, cell = _pattern_layout(fitz.Rect(0, 0, *page_size))
+    ox, oy = origin
+    height, width = pixels.shape[:2]
+    for dark in (False, True):
+        level = _DARK_LEVEL if dark else 255
+        for row, col in _pattern_cells(fingerprint, dark):
+            left = max(round(x0 + col * cell) - ox, 0)
+            right = min(round(x0 + (col + 1) * cell) - ox, width)
+            top = max(round(y0 + row * cell) - oy, 0)
+            bottom = min(round(y0 + (row + 1) * cell) - oy, height)
+            if left < right and top < bottom:
+                pixels[top:bottom, left:right] = level
+
+
+def read_fingerprint(page):
+    """
+    从页面中读取指纹点阵
+
+    返回:
+        int: 指纹，没有点阵或校验失败时返回None
+    """
+    x0, y0, cell = _pattern_layout(page.rect)
+    zoom = _SCAN_CELL_PIXELS / cell
+    clip = fitz.Rect(x0, y0, x0 + _COLS * cell, y0 + _ROWS * cell)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=fitz.csGRAY, alpha=False)
+    image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    image = image.astype(np.float32)
+
+    # 各方格中心的2×2像素取平均，所有方格一次取出
+    centers_x = np.floor((x0 + (np.arange(_COLS) + 0.5) * cell) * zoom).astype(int) - pix.x
+    centers_y = np.floor((y0 + (np.arange(_ROWS) + 0.5) * cell) * zoom).astype(int) - pix.y
+    xs = np.clip(np.stack([centers_x - 1, centers_x]), 0, pix.width - 1)
+    ys = np.clip(np.stack([centers_y - 1, centers_y]), 0, pix.height - 1)
+    means = sum(image[np.ix_(ys[a], xs[b])] for a in (0, 1) for b in (0, 1)) / 4
+
+    pairs = means.reshape(-1, 2)
+    contrast = pairs[:, 1] - pairs[:, 0]
+    if np.min(np.abs(contrast)) < _MIN_CONTRAST:
+        return None
+    return _decode_bits(contrast > 0)
+
+
+class TraceResult:
+    """
+    追踪结果
+
+    属性:
+        fingerprint: 读取到的指纹，没有读取到时为None
+        record: 台账中对应的发放记录（字典），没有找到时为None
+        method: 识别方式 "hash"（文件未被修改）/ "id"（从文件标识读取）/ "pattern"（从点阵读取）
+        page: 读取到点阵的页码（从0开始）
+    """
+
+    def __init__(self, fingerprint=None, record=None, method="", page=None):
+        self.fingerprint = fingerprint
+        self.record = record
+        self.method = method
+        self.page = page
+
+
+def trace_pdf(data, index, passwords=None):
+    """
+    识别可疑PDF的来源
+
+    参数:
+        data: 可疑PDF的内容（bytes）
+        index: 发放台账 ledger.DistributionLedger
+        passwords: 需要读取点阵时打开加密文件所用的密码，之后再依次尝试台账中的所有密码
+
+    返回:
+        TraceResult
+    """
+    output_hash = hashlib.sha256(data).hexdigest()
+    record = index.lookup_hash(output_hash)
+    if record is not None:
+        return TraceResult(record["fingerprint"], record, "hash")
+
+    doc = fitz.open(stream=data, filetype="pdf")
+    try:
+        fingerprint = _read_id(doc)
+        if fingerprint is not None:
+            record = index.lookup(fingerprint)
+            if record is not None:
+                return TraceResult(fingerprint, record, "id")
+        if doc.needs_pass:
+            candidates = list(passwords or []) + index.passwords()
+            if not any(doc.authenticate(password) for password in candidates):
+                raise ValueError("无法打开加密的PDF，请提供密码")
+        for page_index in range(min(doc.page_count, _SCAN_MAX_PAGES)):
+            fingerprint = read_fingerprint(doc[page_index])
+            if fingerprint is not None:
+                return TraceResult(fingerprint, index.lookup(fingerprint), "pattern", page_index)
+        return TraceResult()
+    finally:
+        doc.close()
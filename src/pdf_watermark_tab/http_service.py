@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地HTTP水印服务模块（仅使用标准库asyncio）
+
+供LMS等系统按需请求带水印的加密PDF，不需要预先批量生成。请求先进入有界队列，
+再由固定数量的调度协程交给共享的进程池执行 水印 -> 安全转换 -> 密码保护，
+所有请求复用同一批已启动的工作进程。处理超时的请求返回504，工作进程卡住时被强制结束，不影响其他请求。
+工作进程把加密结果直接写入临时文件（protect_pdf_to），不经进程间管道传回完整内容，
+响应从临时文件分块读出发给客户端；发放台账的读写在单独的线程中进行，不阻塞事件循环。
+
+接口:
+    POST /watermark?student=张三&dpi=150&filename=讲义.pdf   请求体为PDF文件内容
+                                              可选 max_size_mb=20 限制输出文件大小
+    POST /watermark  (application/json)       {"path": "服务器上的PDF路径", "student": "张三", "dpi": 150}
+    GET  /stats                               队列深度、处理中任务数和延迟统计
+    GET  /health                              健康检查
+"""
+
+import os
+import hashlib
+import json
+import time
+import asyncio
+import tempfile
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs, quote
+
+from src.pdf_watermark_tab.watermark_core import build_watermark_text
+from src.pdf_watermark_tab.pipeline import get_output_paths, check_dpi
+from src.pdf_watermark_tab.protect import ProtectOptions, protect_pdf_to
+from src.pdf_watermark_tab.loader import PdfSource
+from src.pdf_watermark_tab.fingerprint import new_fingerprint
+from src.pdf_watermark_tab.size_target import max_bytes_from_mb
+from src.pdf_watermark_tab.ledger import DistributionLedger, IssuedCopy, file_sha256
+from src.pdf_watermark_tab.job_guard import GuardedPool, JobTimeout
+from src.pdf_watermark_tab.worker_pool import warm_up
+import config
+
+
+# 上传PDF的大小上限
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+# 返回结果时每次从临时文件读出并写出的块大小
+STREAM_CHUNK_SIZE = 256 * 1024
+
+_STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error",
+    503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+
+class HttpError(Exception):
+    """返回给客户端的HTTP错误"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _protect_job(input_pdf, pdf_bytes, upload_name, student_name, watermark_text, dpi, fingerprint=None,
+                 max_bytes=None):
+    """
+    工作进程：执行完整流水线，把加密后的PDF直接写入临时文件
+
+    参数:
+        input_pdf: 服务器上的PDF路径，为空时使用pdf_bytes
+        pdf_bytes: 上传的PDF内容
+        upload_name: 上传文件的文件名，决定输出文件名
+        其余参数同 ProtectOptions
+
+    返回:
+        tuple: (输出文件名, 临时文件路径, 密码, 输出内容的SHA-256, 输入内容的SHA-256)，
+               临时文件由调用方发送后删除
+    """
+    if input_pdf is None:
+        input_pdf = upload_name
+        source = PdfSource(data=pdf_bytes)
+    else:
+        source = PdfSource(input_pdf)
+    source_hash = hashlib.sha256(source.buffer).hexdigest()
+    options = ProtectOptions(student_name, watermark_text, dpi=dpi, fingerprint=fingerprint, max_bytes=max_bytes)
+    filename = os.path.basename(get_output_paths(input_pdf, "", student_name)[2])
+    fd, spool_path = tempfile.mkstemp(prefix="dotrix_http_", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            protect_pdf_to(source, f, options)
+        return filename, spool_path, options.password, file_sha256(spool_path), source_hash
+    except BaseException:
+        os.remove(spool_path)
+        raise
+
+
+class WatermarkHttpService:
+    """
+    基于asyncio的本地水印服务
+
+    参数:
+        host: 监听地址，默认只监听本机
+        port: 监听端口
+        max_workers: 工作进程数，默认与CPU核心数一致
+        queue_size: 排队任务上限，队列满时返回503
+        allowed_roots: 允许通过路径读取的目录列表，为空时不允许按路径请求
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, max_workers=None, queue_size=32, allowed_roots=None):
+        self.host = host
+        self.port = port
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        # 解析符号链接后再比较，允许的目录中指向外部的链接不能用来读取其他文件
+        self.allowed_roots = [os.path.realpath(p) for p in (allowed_roots or [])]
+
+        self._queue = None
+        self._pool = None
+        self._ledger = None
+        # sqlite连接只能在创建它的线程中使用，台账的全部操作都交给这一个线程
+        self._ledger_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dotrix-ledger")
+        self._in_flight = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._latencies = deque(maxlen=1000)    # 从接收请求到结果就绪（秒）
+        self._queue_waits = deque(maxlen=1000)  # 在队列中等待的时间（秒）
+        self._started_at = time.time()
+
+    # ---------- 任务调度 ----------
+
+    async def _ledger_call(self, fn, *args):
+        """在台账线程中执行fn，不阻塞事件循环"""
+        return await asyncio.get_running_loop().run_in_executor(self._ledger_executor, fn, *args)
+
+    async def _dispatcher(self):
+        """从队列取任务交给进程池，调度协程数与工作进程数相同，保证进程池始终满载"""
+        while True:
+            job, future, enqueued_at = await self._queue.get()
+            self._queue_waits.append(time.monotonic() - enqueued_at)
+            self._in_flight += 1
+            try:
+                result = await asyncio.wrap_future(self._pool.submit(_protect_job, *job))
+                if future.done():
+                    # 请求已经放弃等待，没有人会发送并删除临时文件
+                    os.remove(result[1])
+                else:
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    def stats(self):
+        """返回队列深度和延迟统计"""
+        def summarize(values):
+            if not values:
+                return {"count": 0, "avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+            ordered = sorted(values)
+            return {
+                "count": len(ordered),
+                "avg": round(sum(ordered) / len(ordered), 3),
+                "p50": round(ordered[len(ordered) // 2], 3),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+                "max": round(ordered[-1], 3),
+            }
+
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "in_flight": self._in_flight,
+            "workers": self.max_workers,
+            "completed": self._completed,
+            "failed": self._failed,
+            "rejected": self._rejected,
+            "uptime": round(time.time() - self._started_at, 1),
+            "latency": summarize(self._latencies),
+            "queue_wait": summarize(self._queue_waits),
+        }
+
+    # ---------- HTTP处理 ----------
+
+    async def _read_request(self, reader):
+        """读取请求行、请求头和请求体"""
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").strip().split(" ", 2)
+        except ValueError:
+            raise HttpError(400, "请求行格式错误")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if method == "POST":
+            if "content-length" not in headers:
+                raise HttpError(411, "需要Content-Length")
+            try:
+                length = int(headers["content-length"])
+            except ValueError:
+                raise HttpError(400, "Content-Length格式错误")
+            if length < 0:
+                raise HttpError(400, "Content-Length格式错误")
+            if length > MAX_UPLOAD_BYTES:
+                raise HttpError(413, "上传文件过大")
+            body = await reader.readexactly(length)
+        return method, target, headers, body
+
+    def _write_head(self, writer, status, content_length, content_type, extra_headers=None):
+        head = [f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}",
+                f"Content-Type: {content_type}",
+                f"Content-Length: {content_length}",
+                "Connection: close"]
+        for name, value in (extra_headers or {}).items():
+            head.append(f"{name}: {value}")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+
+    async def _send(self, writer, status, body=b"", content_type="application/json; charset=utf-8", extra_headers=None):
+        """发送完整响应"""
+        self._write_head(writer, status, len(body), content_type, extra_headers)
+        writer.write(body)
+        await writer.drain()
+
+    async def _send_file(self, writer, status, path, content_type, extra_headers=None):
+        """从文件分块读出并发送，每块写出后等待缓冲区排空，内存中只保留一块"""
+        loop = asyncio.get_running_loop()
+        with open(path, "rb") as f:
+            self._write_head(writer, status, os.fstat(f.fileno()).st_size, content_type, extra_headers)
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+
+    async def _send_json(self, writer, status, payload):
+        await self._send(writer, status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+    def _parse_job(self, target, headers, body):
+        """把请求解析为流水线任务参数"""
+        query = {k: v[-1] for k, v in parse_qs(urlsplit(target).query).items()}
+        content_type = headers.get("content-type", "")
+
+        input_pdf = None
+        pdf_bytes = None
+        if content_type.startswith("application/json"):
+            try:
+                params = json.loads(body.decode("utf-8"))
+            except ValueError:
+                raise HttpError(400, "JSON格式错误")
+            query.update({k: str(v) for k, v in params.items()})
+            input_pdf = query.get("path")
+            if not input_pdf:
+                raise HttpError(400, "缺少path参数")
+            input_pdf = os.path.realpath(input_pdf)
+            if not any(os.path.commonpath([input_pdf, root]) == root for root in self.allowed_roots):
+                raise HttpError(400, "不允许读取该路径")
+            if not os.path.isfile(input_pdf):
+                raise HttpError(404, "文件不存在")
+        else:
+            if not body.startswith(b"%PDF"):
+                raise HttpError(400, "请求体不是PDF文件")
+            pdf_bytes = body
+
+        # 只取文件名部分，防止路径穿越
+        upload_name = os.path.basename(query.get("filename", "").replace("\\", "/")) or "upload.pdf"
+        if not upload_name.lower().endswith(".pdf"):
+            upload_name += ".pdf"
+
+        student_name = query.get("student", "").strip()
+        if not student_name:
+            raise HttpError(400, "缺少student参数")
+        try:
+            dpi = check_dpi(query.get("dpi", 150))
+        except ValueError as e:
+            raise HttpError(400, f"dpi参数错误: {str(e)}")
+        try:
+            max_bytes = max_bytes_from_mb(query.get("max_size_mb"))
+        except ValueError:
+            raise HttpError(400, "max_size_mb参数错误")
+        datetime_text = query.get("datetime") or datetime.now().strftime("%Y-%m-%d %H:%M")
+        watermark_text = build_watermark_text(student_name, datetime_text)
+        return input_pdf, pdf_bytes, upload_name, student_name, watermark_text, dpi, max_bytes
+
+    async def _handle_watermark(self, writer, target, headers, body, received_at):
+        input_pdf, pdf_bytes, upload_name, student_name, watermark_text, dpi, max_bytes = self._parse_job(
+            target, headers, body)
+        fingerprint = None
+        if config.FINGERPRINT_ENABLED:
+            fingerprint = await self._ledger_call(new_fingerprint, self._ledger)
+        job = (input_pdf, pdf_bytes, upload_name, student_name, watermark_text, dpi, fingerprint, max_bytes)
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((job, future, time.monotonic()))
+        except asyncio.QueueFull:
+            self._rejected += 1
+            raise HttpError(503, "队列已满，请稍后重试")
+
+        try:
+            filename, spool_path, password, output_hash, source_hash = await future
+        except JobTimeout as e:
+            self._failed += 1
+            raise HttpError(504, str(e))
+        except Exception as e:
+            self._failed += 1
+            raise HttpError(500, f"处理失败: {str(e)}")
+
+        try:
+            if self._ledger is not None:
+                await self._ledger_call(self._ledger.record, [
+                    IssuedCopy(student_name, input_pdf or upload_name, filename, output_hash, password,
+                               watermark_text, source_hash, fingerprint)])
+
+            self._completed += 1
+            self._latencies.append(time.monotonic() - received_at)
+            await self._send_file(writer, 200, spool_path, content_type="application/pdf", extra_headers={
+                "Content-Disposition": f"attachment; filename=\"output.pdf\"; filename*=UTF-8''{quote(filename)}",
+            })
+        finally:
+            os.remove(spool_path)
+
+    async def _handle_connection(self, reader, writer):
+        received_at = time.monotonic()
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            method, target, headers, body = request
+            path = urlsplit(target).path
+
+            if path == "/watermark":
+                if method != "POST":
+                    raise HttpError(405, "只支持POST")
+                await self._handle_watermark(writer, target, headers, body, received_at)
+            elif path == "/stats":
+                await self._send_json(writer, 200, self.stats())
+            elif path == "/health":
+                await self._send_json(writer, 200, {"status": "ok"})
+            else:
+                raise HttpError(404, "接口不存在")
+        except HttpError as e:
+            await self._send_json(writer, e.status, {"error": e.message})
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            print(f"处理HTTP请求时出错: {str(e)}")
+            try:
+                await self._send_json(writer, 500, {"error": str(e)})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    # ---------- 启动 ----------
+
+    async def serve(self):
+        """启动服务并一直运行"""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        # fork出的工作进程会继承当时打开的客户端连接，服务端关闭后客户端仍收不到连接结束；
+        # 支持时使用forkserver，工作进程不持有这些连接
+        mp_context = (multiprocessing.get_context("forkserver")
+                      if "forkserver" in multiprocessing.get_all_start_methods() else None)
+        self._pool = GuardedPool(self.max_workers, initializer=warm_up, mp_context=mp_context)
+        if config.LEDGER_ENABLED:
+            self._ledger = await self._ledger_call(DistributionLedger)
+        dispatchers = [asyncio.create_task(self._dispatcher()) for _ in range(self.max_workers)]
+
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        print(f"水印服务已启动: http://{self.host}:{self.port}（工作进程 {self.max_workers} 个，队列上限 {self.queue_size}）")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in dispatchers:
+                task.cancel()
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            if self._ledger is not None:
+                await self._ledger_call(self._ledger.close)
+            self._ledger_executor.shutdown(wait=True)
+
+
+def run_service(host="127.0.0.1", port=8765, max_workers=None, queue_size=32, allowed_roots=None):
+    """阻塞运行HTTP服务，Ctrl+C退出"""
+    service = WatermarkHttpService(host, port, max_workers, queue_size, allowed_roots)
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        print("水印服务已停止")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+安全输出中的图像去重
+
+栅格化后内容完全相同的页面（空白分隔页、重复的封面）只保存一份图像，其他页面按引用使用；
+近乎纯色的空白页面不保存图像，直接用一个纯色矩形填充。输出文件更小，
+保存和加密时需要压缩、加密的数据也更少
+"""
+
+import hashlib
+
+import fitz  # PyMuPDF
+import numpy as np
+
+import config
+from src.pdf_watermark_tab.tiling import insert_tile
+
+
+def count_metric(metrics, key, amount=1):
+    """在调用方提供的统计字典中累计一项计数，metrics为空时忽略"""
+    if metrics is not None:
+        metrics[key] = metrics.get(key, 0) + amount
+
+
+def uniform_color(pixels, tolerance=None):
+    """
+    判断图像是否近乎纯色
+
+    参数:
+        pixels: 形状为 (H, W, C) 的uint8数组
+        tolerance: 每个通道最大值与最小值之差不超过此值时视为纯色，默认 config.BLANK_PAGE_TOLERANCE
+
+    返回:
+        tuple: 纯色时返回各通道的颜色值（0~255），否则返回None
+    """
+    tolerance = config.BLANK_PAGE_TOLERANCE if tolerance is None else tolerance
+    if tolerance < 0:
+        return None
+    color = []
+    # 逐通道计算，比沿最后一维归约快得多；发现不是纯色的通道后立即返回
+    for channel in range(pixels.shape[2]):
+        plane = pixels[..., channel]
+        low, high = int(plane.min()), int(plane.max())
+        if high - low > tolerance:
+            return None
+        color.append((low + high) // 2)
+    return tuple(color)
+
+
+class ImageDeduplicator:
+    """
+    向输出文档插入图像时按像素内容去重
+
+    同一个实例只能用于一个输出文档
+
+    参数:
+        doc: 输出的fitz.Document
+        metrics: 统计字典，累计复用的图像数（reused_images）
+    """
+
+    def __init__(self, doc, metrics=None):
+        self.doc = doc
+        self.metrics = metrics
+        self._xrefs = {}
+
+    @staticmethod
+    def content_key(pixels):
+        """按像素内容和尺寸计算的键"""
+        h = hashlib.sha1(np.ascontiguousarray(pixels).data)
+        h.update(repr(pixels.shape).encode("ascii"))
+        return h.hexdigest()
+
+    def insert(self, page, pixels, rect, key=None):
+        """
+        把像素作为图像放到页面的rect区域，相同内容的图像只保存一份
+
+        参数:
+            key: 去重用的键，默认按像素内容计算；调用方能更早确定内容相同时可以直接给出
+        """
+        key = key or self.content_key(pixels)
+        if self.place(page, rect, key):
+            return
+        self._xrefs[key] = insert_tile(page, pixels, rect)
+
+    def place(self, page, rect, key):
+        """
+        如果键对应的图像已经插入过，直接引用它
+
+        返回:
+            bool: 是否已放置
+        """
+        xref = self._xrefs.get(key)
+        if not xref:
+            return False
+        page.insert_image(fitz.Rect(*rect), xref=xref)
+        count_metric(self.metrics, "reused_images")
+        return True
+
+    def fill(self, page, rect, color):
+        """用纯色矩形代替近乎纯色的图像"""
+        fill = tuple(value / 255.0 for value in color)
+        if len(fill) == 1:
+            fill = fill * 3
+        page.draw_rect(fitz.Rect(*rect), color=None, fill=fill, width=0)
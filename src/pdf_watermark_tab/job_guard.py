@@ -0,0 +1,501 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+单个文件的时间和内存预算，以及批处理的取消
+
+个别损坏或异常巨大的PDF可能让PdfReader或get_pixmap卡住几分钟，拖住整批处理。这里分两层处理:
+- 协作式检查：处理流程在每页（超大页面在每块）之间调用 checkpoint()，
+  超过时间上限或收到取消请求时抛出 JobTimeout / JobCancelled，正常结束本文件
+- 强制结束：卡在一次解析或渲染调用中、无法到达检查点的文件，超出宽限时间后由主进程
+  结束其所在的工作进程；进程池随即重建，同时在处理的其他文件重新提交，不影响批处理继续
+
+工作进程中还可以限制单个文件的虚拟内存增量（RLIMIT_AS），超出时分配失败，记为 JobMemoryExceeded。
+
+进程池可以在整个程序运行期间保留（worker_pool.shared_pool），工作进程启动时执行一次初始化
+（导入库、注册字体、读取LOGO），之后的批次直接复用；每个进程处理一定数量的文件后替换为新进程，
+避免长期运行时内存不断增长
+"""
+
+import os
+import sys
+import time
+import signal
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+
+
+# 主进程检查超时任务的间隔（秒）
+_WATCH_INTERVAL = 0.2
+
+
+class JobAborted(Exception):
+    """文件处理被中止（超时、取消或超出内存预算），不应退回其他处理方式重试"""
+
+
+class JobTimeout(JobAborted):
+    """处理时间超过上限"""
+
+
+class JobCancelled(JobAborted):
+    """批处理已取消"""
+
+
+class JobMemoryExceeded(JobAborted):
+    """内存超出预算"""
+
+
+_local = threading.local()
+# 工作进程中由进程池初始化函数设置
+_cancel_event = None
+_started_queue = None
+
+
+def checkpoint():
+    """
+    协作式检查点，在页面之间调用
+
+    超过当前文件的时间上限时抛出JobTimeout，批处理已取消时抛出JobCancelled；
+    没有设置预算时（例如直接调用处理函数）不做任何事
+    """
+    deadline = getattr(_local, "deadline", None)
+    if deadline is not None and time.monotonic() > deadline:
+        raise JobTimeout(f"处理超时（超过 {_local.timeout:g} 秒）")
+    cancel_event = getattr(_local, "cancel_event", None) or _cancel_event
+    if cancel_event is not None and cancel_event.is_set():
+        raise JobCancelled("已取消")
+
+
+@contextmanager
+def job_deadline(timeout=None, cancel_event=None):
+    """
+    在当前线程中为一个文件设置时间上限，只在检查点生效
+
+    参数:
+        timeout: 时间上限（秒），默认 config.JOB_TIMEOUT_SECONDS，0表示不限制
+        cancel_event: threading.Event，设置后在下一个检查点抛出JobCancelled
+    """
+    timeout = config.JOB_TIMEOUT_SECONDS if timeout is None else timeout
+    previous = (getattr(_local, "deadline", None), getattr(_local, "timeout", None),
+                getattr(_local, "cancel_event", None))
+    _local.deadline = time.monotonic() + timeout if timeout else None
+    _local.timeout = timeout
+    _local.cancel_event = cancel_event
+    try:
+        yield
+    finally:
+        _local.deadline, _local.timeout, _local.cancel_event = previous
+
+
+def _virtual_memory():
+    """当前进程的虚拟内存大小（字节），无法获取时返回None"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _limit_memory(memory_mb):
+    """
+    把工作进程的虚拟内存上限设为 当前大小 + memory_mb
+
+    返回:
+        tuple: 原来的限制，用于恢复；不支持或未设置时返回None
+    """
+    if not memory_mb or sys.platform == "win32":
+        return None
+    try:
+        import resource
+    except ImportError:
+        return None
+    current = _virtual_memory()
+    if current is None:
+        return None
+    previous = resource.getrlimit(resource.RLIMIT_AS)
+    limit = current + int(memory_mb) * 1024 * 1024
+    if previous[1] != resource.RLIM_INFINITY:
+        limit = min(limit, previous[1])
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, previous[1]))
+    except (ValueError, OSError):
+        return None
+    return previous
+
+
+def _restore_memory(previous):
+    if previous is not None:
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, previous)
+
+
+def _is_out_of_memory(error):
+    """MuPDF分配失败时抛出的是普通异常，按消息判断"""
+    message = str(error)
+    return "malloc" in message or "out of memory" in message.lower()
+
+
+def memory_budget_mb(estimate):
+    """
+    单个文件的内存预算（MB）
+
+    参数:
+        estimate: 预计内存峰值（字节，memory_governor.estimate_job_memory）
+
+    返回:
+        int: config.JOB_MEMORY_LIMIT_MB，预计峰值较高的大文件放宽到预计峰值的2倍；不限制时为0
+    """
+    if not config.JOB_MEMORY_LIMIT_MB:
+        return 0
+    return max(config.JOB_MEMORY_LIMIT_MB, int(2 * estimate / (1024 * 1024)) + 1)
+
+
+def _init_worker(cancel_event, started_queue, initializer=None):
+    """进程池初始化：保存取消事件和开始通知队列，执行调用方的初始化函数"""
+    global _cancel_event, _started_queue
+    _cancel_event = cancel_event
+    _started_queue = started_queue
+    if initializer is not None:
+        # 初始化失败时进程池会整个损坏，这里只打印，任务中再按需加载
+        try:
+            initializer()
+        except Exception as e:
+            print(f"工作进程 {os.getpid()} 初始化失败: {str(e)}")
+
+
+def _ping():
+    """健康检查：返回工作进程的进程号"""
+    return os.getpid()
+
+
+def _run_guarded(job_id, func, args, timeout, memory_mb):
+    """工作进程：通知主进程本任务所在的进程，在时间和内存预算内执行func(*args)"""
+    if _cancel_event is not None and _cancel_event.is_set():
+        raise JobCancelled("已取消")
+    if _started_queue is not None:
+        _started_queue.put((job_id, os.getpid()))
+    previous = _limit_memory(memory_mb)
+    try:
+        with job_deadline(timeout):
+            return func(*args)
+    except JobAborted:
+        raise
+    except MemoryError:
+        raise JobMemoryExceeded(f"内存超出预算（{memory_mb} MB）")
+    except Exception as e:
+        if memory_mb and _is_out_of_memory(e):
+            raise JobMemoryExceeded(f"内存超出预算（{memory_mb} MB）: {str(e)}")
+        raise
+    finally:
+        _restore_memory(previous)
+
+
+class _GuardedJob:
+    """GuardedPool中的一个任务"""
+
+    def __init__(self, job_id, func, args, timeout, memory_mb):
+        self.job_id = job_id
+        self.func = func
+        self.args = args
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.future = Future()
+        self.inner = None
+        self.executor = None
+        self.pid = None
+        self.started_at = None
+        self.killed = None  # 被强制结束时的原因（JobTimeout / JobCancelled）
+
+
+class GuardedPool:
+    """
+    带时间和内存预算的进程池，接口与ProcessPoolExecutor的submit / shutdown相同
+
+    submit返回的Future在文件超时、取消、超出内存预算时以对应的JobAborted异常结束。
+    卡住的工作进程被强制结束后进程池自动重建，受牵连的其他任务重新提交，调用方无需处理BrokenProcessPool。
+    工作进程自己崩溃（例如MuPDF段错误）而无法确定是哪个文件导致时，当时正在处理的文件
+    逐个转到单独的隔离进程中重试，崩溃的文件记为失败，其他文件照常完成
+
+    参数:
+        max_workers: 工作进程数，默认与CPU核心数一致
+        timeout: 每个文件的时间上限（秒），默认 config.JOB_TIMEOUT_SECONDS，0表示不限制
+        memory_mb: 每个文件可以额外使用的内存（MB），默认 config.JOB_MEMORY_LIMIT_MB，0表示不限制
+        kill_grace: 超时或取消后等待工作进程自行停下的时间，默认 config.JOB_KILL_GRACE_SECONDS
+        initializer: 每个工作进程启动时执行一次的函数（例如 worker_pool.warm_up），必须可以pickle
+        recycle_jobs: 平均每个工作进程处理多少个文件后换用新的进程，默认 config.WORKER_RECYCLE_JOBS，0表示不替换
+        mp_context: 创建工作进程使用的multiprocessing上下文，默认与ProcessPoolExecutor相同
+    """
+
+    def __init__(self, max_workers=None, timeout=None, memory_mb=None, kill_grace=None, initializer=None,
+                 recycle_jobs=None, mp_context=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = config.JOB_TIMEOUT_SECONDS if timeout is None else timeout
+        self.memory_mb = config.JOB_MEMORY_LIMIT_MB if memory_mb is None else memory_mb
+        self.kill_grace = config.JOB_KILL_GRACE_SECONDS if kill_grace is None else kill_grace
+        self.initializer = initializer
+        self.recycle_jobs = config.WORKER_RECYCLE_JOBS if recycle_jobs is None else recycle_jobs
+        self.mp_context = mp_context
+
+        context = mp_context or multiprocessing
+        self._cancel_event = context.Event()
+        # SimpleQueue同步写入管道，工作进程随后立即崩溃时主进程也能知道它在处理哪个任务
+        self._started_queue = context.SimpleQueue()
+        self._cancelled_at = None
+        self._lock = threading.RLock()
+        self._jobs = {}
+        self._next_id = 0
+        self._closing = False
+        self._closed = False
+        self._executor = self._new_executor(self.max_workers)
+        self._executor_jobs = 0  # 已交给当前进程池的任务数，用于按数量替换工作进程
+        self._quarantine = None
+        self._break_causes = {}  # 已损坏的进程池 -> (是否由强制结束导致, 当时正在处理的任务编号)
+        self._watcher = threading.Thread(target=self._watch, name="dotrix-job-guard", daemon=True)
+        self._watcher.start()
+
+    def _new_executor(self, max_workers):
+        return ProcessPoolExecutor(max_workers=max_workers, mp_context=self.mp_context, initializer=_init_worker,
+                                   initargs=(self._cancel_event, self._started_queue, self.initializer))
+
+    def _replace_executor(self, terminate=False):
+        """
+        换用新的进程池（调用方持有锁）。旧进程池处理完已经交给它的任务后退出；
+        terminate为True时（健康检查失败）直接结束旧的工作进程，其中的任务转到新进程池重新提交
+        """
+        old = self._executor
+        self._executor = self._new_executor(self.max_workers)
+        self._executor_jobs = 0
+        if terminate:
+            # 标记为强制替换，旧进程池损坏时其中的任务重新提交而不是转到隔离进程
+            self._break_causes[old] = (True, set())
+            # ProcessPoolExecutor没有公开结束工作进程的方法
+            for process in list(getattr(old, "_processes", {}).values()):
+                process.kill()
+        old.shutdown(wait=False)
+
+    def submit(self, func, *args, timeout=None, memory_mb=None):
+        """
+        提交一个任务
+
+        参数:
+            func, args: 在工作进程中执行 func(*args)，必须可以pickle
+            timeout: 本任务的时间上限，默认使用进程池的设置
+            memory_mb: 本任务的内存预算，默认使用进程池的设置
+
+        返回:
+            concurrent.futures.Future
+        """
+        with self._lock:
+            if self._closing:
+                raise RuntimeError("进程池已关闭")
+            self._next_id += 1
+            job = _GuardedJob(self._next_id, func, args, self.timeout if timeout is None else timeout,
+                              self.memory_mb if memory_mb is None else memory_mb)
+            self._jobs[job.job_id] = job
+            # 当前进程池处理的任务数达到上限后换用新的工作进程，限制长期运行时的内存增长
+            if self.recycle_jobs and self._executor_jobs >= self.recycle_jobs * self.max_workers:
+                self._replace_executor()
+            self._executor_jobs += 1
+            self._start(job, self._executor)
+        return job.future
+
+    def _start(self, job, executor):
+        """把任务交给指定的进程池（调用方持有锁）"""
+        job.pid = None
+        job.started_at = None
+        job.executor = executor
+        try:
+            job.inner = executor.submit(_run_guarded, job.job_id, job.func, job.args, job.timeout, job.memory_mb)
+        except BrokenProcessPool:
+            # 空闲时工作进程意外退出（例如被系统结束），进程池已经损坏，换用新的进程池
+            if executor is self._quarantine:
+                self._quarantine = None
+                executor = self._quarantine_executor()
+            else:
+                self._replace_executor()
+                executor = self._executor
+            job.executor = executor
+            job.inner = executor.submit(_run_guarded, job.job_id, job.func, job.args, job.timeout, job.memory_mb)
+        job.inner.add_done_callback(lambda inner, job=job: self._on_done(job, inner))
+
+    def _finish(self, job, result=None, error=None):
+        with self._lock:
+            self._jobs.pop(job.job_id, None)
+        if job.future.done():
+            return
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(result)
+
+    def _on_done(self, job, inner):
+        """工作进程完成任务（或进程池损坏）时调用"""
+        if inner.cancelled():
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+            job.future.cancel()
+            return
+        error = inner.exception()
+        if not isinstance(error, BrokenProcessPool):
+            self._finish(job, inner.result() if error is None else None, error)
+            return
+
+        with self._lock:
+            killed, running = self._break_cause(job.executor)
+            if job.killed is not None:
+                error = job.killed
+            elif self._cancel_event.is_set():
+                error = JobCancelled("已取消")
+            elif self._closing:
+                error = RuntimeError("进程池已关闭")
+            elif not killed and job.job_id in running and (len(running) == 1 or job.executor is self._quarantine):
+                error = RuntimeError("工作进程异常退出（文件可能已损坏）")
+            elif not killed and job.job_id in running:
+                # 无法确定是哪个文件导致崩溃，转到隔离进程中逐个重试
+                self._start(job, self._quarantine_executor())
+                return
+            else:
+                # 受牵连的任务重新提交
+                self._start(job, self._executor if job.executor is not self._quarantine
+                            else self._quarantine_executor())
+                return
+        self._finish(job, error=error)
+
+    def _break_cause(self, executor):
+        """
+        第一次收到某个进程池损坏时重建它，并记录损坏时的情况（调用方持有锁）
+
+        返回:
+            tuple: (是否由强制结束导致, 当时正在处理的任务编号集合)
+        """
+        if executor not in self._break_causes:
+            self._drain_started()
+            jobs = [job for job in self._jobs.values() if job.executor is executor]
+            self._break_causes[executor] = (any(job.killed is not None for job in jobs),
+                                            {job.job_id for job in jobs if job.pid is not None})
+            if not self._closing:
+                if executor is self._executor:
+                    self._executor = self._new_executor(self.max_workers)
+                    self._executor_jobs = 0
+                elif executor is self._quarantine:
+                    self._quarantine = None
+            executor.shutdown(wait=False)
+        return self._break_causes[executor]
+
+    def _quarantine_executor(self):
+        if self._quarantine is None:
+            self._quarantine = self._new_executor(1)
+        return self._quarantine
+
+    def _drain_started(self):
+        """读取工作进程发来的任务开始通知（调用方持有锁）"""
+        while not self._started_queue.empty():
+            job_id, pid = self._started_queue.get()
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.pid = pid
+                job.started_at = time.monotonic()
+
+    def _watch(self):
+        """主进程线程：记录每个任务所在的工作进程，强制结束超时或取消后仍未停下的进程"""
+        while not self._closed:
+            time.sleep(_WATCH_INTERVAL)
+            with self._lock:
+                try:
+                    self._drain_started()
+                except (OSError, EOFError):
+                    break
+                self._kill_stuck()
+
+    def _kill_stuck(self):
+        now = time.monotonic()
+        for job in list(self._jobs.values()):
+            if job.pid is None or job.killed is not None or job.inner.done():
+                continue
+            if job.timeout and now - job.started_at > job.timeout + self.kill_grace:
+                job.killed = JobTimeout(f"处理超时（超过 {job.timeout:g} 秒），已强制结束")
+            elif self._cancelled_at is not None and now - self._cancelled_at > self.kill_grace:
+                job.killed = JobCancelled("已取消")
+            else:
+                continue
+            print(f"工作进程 {job.pid} 未能按时停下，强制结束: {job.killed}")
+            try:
+                os.kill(job.pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+            except OSError:
+                pass
+
+    def check_health(self, timeout=None):
+        """
+        健康检查：每个工作进程都应在timeout秒内响应；进程池已损坏或有进程没有响应时换用新的进程池。
+        进程池空闲时调用，同时会提前启动全部工作进程并完成初始化
+
+        参数:
+            timeout: 等待响应的时间（秒），默认 config.WORKER_HEALTH_TIMEOUT_SECONDS
+
+        返回:
+            bool: 进程池是否健康（False表示已经替换）
+        """
+        timeout = config.WORKER_HEALTH_TIMEOUT_SECONDS if timeout is None else timeout
+        with self._lock:
+            if self._closing:
+                return False
+            executor = self._executor
+        try:
+            futures = [executor.submit(_ping) for _ in range(self.max_workers)]
+            for future in futures:
+                future.result(timeout=timeout)
+            return True
+        except Exception as e:
+            print(f"工作进程健康检查失败，重新创建进程池: {str(e) or type(e).__name__}")
+            with self._lock:
+                if executor is self._executor and not self._closing:
+                    self._replace_executor(terminate=True)
+            return False
+
+    def reset(self):
+        """清除取消状态，进程池可以继续用于下一批文件"""
+        with self._lock:
+            self._cancel_event.clear()
+            self._cancelled_at = None
+
+    def cancel(self):
+        """取消所有任务：尚未开始的直接取消，正在处理的在下一个检查点停下，超出宽限时间后强制结束"""
+        with self._lock:
+            if self._cancelled_at is None:
+                self._cancelled_at = time.monotonic()
+            self._cancel_event.set()
+            for job in list(self._jobs.values()):
+                if job.pid is None and job.inner is not None:
+                    job.inner.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """关闭进程池，cancel_futures为True时取消尚未开始的任务"""
+        with self._lock:
+            self._closing = True
+            if cancel_futures:
+                for job in list(self._jobs.values()):
+                    if job.pid is None and job.inner is not None:
+                        job.inner.cancel()
+            executors = [e for e in (self._executor, self._quarantine) if e is not None]
+        for executor in executors:
+            executor.shutdown(wait=wait)
+        with self._lock:
+            self._closed = True
+        if wait:
+            self._watcher.join()
+            self._started_queue.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(wait=True)
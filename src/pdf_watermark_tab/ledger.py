@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+发放台账：记录每一份发出的文件（学生、源文件、水印文字、密码、输出文件的哈希和指纹）
+
+台账保存在用户数据目录下的SQLite数据库中，按学生、源文件哈希、发放日期、输出文件哈希和指纹建立索引，
+可以快速回答"发给张三的所有文件"、"这份课件发给了谁"、"这个泄露的文件是谁的"。
+批处理在一批文件处理完成后用一个事务批量写入，WAL模式加上不强制每次刷盘，
+几十万行时单次写入仍然只需要毫秒级，不影响处理速度
+"""
+
+import os
+import hashlib
+import sqlite3
+from datetime import datetime, timedelta
+
+import config
+
+
+_COLUMNS = ("fingerprint", "student", "source", "source_hash", "output", "output_hash",
+            "watermark_text", "password", "issued_at")
+
+
+def file_sha256(path):
+    """计算文件的SHA-256（十六进制）"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IssuedCopy:
+    """
+    一份已发放的文件
+
+    参数:
+        student: 学生姓名
+        source: 源文件路径（或上传的文件名）
+        output: 输出文件路径（或返回给客户端的文件名）
+        output_hash: 输出内容的SHA-256
+        password: 打开密码
+        watermark_text: 水印文字
+        source_hash: 源文件内容的SHA-256
+        fingerprint: 嵌入的泄露追踪指纹，未嵌入时为None
+        issued_at: 发放时间，默认为记录时的当前时间
+    """
+
+    def __init__(self, student, source, output, output_hash, password, watermark_text="", source_hash="",
+                 fingerprint=None, issued_at=None):
+        self.student = student
+        self.source = source
+        self.output = output
+        self.output_hash = output_hash
+        self.password = password
+        self.watermark_text = watermark_text
+        self.source_hash = source_hash
+        self.fingerprint = fingerprint
+        self.issued_at = issued_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    def row(self):
+        return tuple(getattr(self, name) for name in _COLUMNS)
+
+
+class DistributionLedger:
+    """
+    发放台账（SQLite）
+
+    参数:
+        path: 数据库文件路径，默认位于用户数据目录下的 config.LEDGER_FILE
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(config.USER_DATA_DIR, config.LEDGER_FILE)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.row_factory = sqlite3.Row
+        # WAL模式下GUI、监控服务和查询命令可以同时读写；WAL模式下NORMAL仍能保证数据库不损坏
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS issued_copies ("
+                " id INTEGER PRIMARY KEY, fingerprint INTEGER UNIQUE, student TEXT NOT NULL, source TEXT,"
+                " source_hash TEXT, output TEXT, output_hash TEXT, watermark_text TEXT, password TEXT,"
+                " issued_at TEXT NOT NULL)")
+            for column in ("student", "source_hash", "issued_at", "output_hash"):
+                self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_issued_{column} ON issued_copies({column})")
+
+    def record(self, copies):
+        """
+        在一个事务中批量记录已发放的文件
+
+        参数:
+            copies: IssuedCopy列表
+
+        返回:
+            int: 写入的行数
+        """
+        rows = [copy.row() for copy in copies]
+        if not rows:
+            return 0
+        with self._conn:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO issued_copies ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})",
+                rows)
+        return len(rows)
+
+    def _query(self, where, params, limit=None):
+        sql = f"SELECT * FROM issued_copies WHERE {where} ORDER BY issued_at DESC, id DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def copies_for_student(self, student, limit=None):
+        """发给某个学生的所有文件，最近的在前"""
+        return self._query("student = ?", (student,), limit)
+
+    def recipients_of_source(self, source_hash, limit=None):
+        """某个源文件（按内容哈希）发给了哪些学生"""
+        return self._query("source_hash = ?", (source_hash,), limit)
+
+    def copies_between(self, start, end, limit=None):
+        """
+        某段时间内发放的文件
+
+        参数:
+            start: 开始日期（含），如 "2026-10-01"
+            end: 结束日期（含），如 "2026-10-31"
+        """
+        day_after = (datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        return self._query("issued_at >= ? AND issued_at < ?", (start, day_after), limit)
+
+    def lookup(self, fingerprint):
+        """按指纹查询，返回记录字典或None"""
+        rows = self._query("fingerprint = ?", (fingerprint,), 1)
+        return rows[0] if rows else None
+
+    def lookup_hash(self, output_hash):
+        """按输出文件的SHA-256查询，返回记录字典或None"""
+        rows = self._query("output_hash = ?", (output_hash,), 1)
+        return rows[0] if rows else None
+
+    def passwords(self):
+        """所有已使用过的密码，按使用次数从多到少排列"""
+        rows = self._conn.execute("SELECT password FROM issued_copies GROUP BY password ORDER BY COUNT(*) DESC")
+        return [row[0] for row in rows if row[0]]
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
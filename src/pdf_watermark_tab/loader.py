@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+PDF输入加载模块，每个输入文件只映射一次，各步骤共享同一块内存
+
+PdfSource把文件以只读方式映射到内存（mmap），PyMuPDF（stream=）和PyPDF2都直接读取这块映射，
+不会各自再读一遍文件，也不复制内容。页面数据由操作系统按需从页缓存中载入，
+多个进程映射同一个文件时共用同一份物理内存。最后一个使用者释放后立即解除映射
+"""
+
+import io
+import mmap
+import threading
+
+import fitz  # PyMuPDF
+
+
+class _BufferReader(io.RawIOBase):
+    """只读的文件对象，直接从内存缓冲区读取，供PyPDF2等需要文件对象的库使用"""
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._buffer = buffer
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, target):
+        chunk = self._buffer[self._position:self._position + len(target)]
+        size = len(chunk)
+        target[:size] = chunk
+        self._position += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+
+class PdfSource:
+    """
+    一个PDF输入，文件映射一次后由各步骤共享
+
+    使用计数从1开始，每多一个使用者调用一次 acquire()，用完调用 release()，
+    计数归零时关闭所有由它打开的文档并解除映射。也可以用作上下文管理器
+
+    参数:
+        path: PDF文件路径
+        data: 已在内存中的PDF内容（bytes），与path二选一，例如上传的文件
+    """
+
+    def __init__(self, path=None, data=None):
+        if (path is None) == (data is None):
+            raise ValueError("path和data必须且只能指定一个")
+        self.path = path
+        self._file = None
+        self._mmap = None
+        self._documents = []
+        self._refs = 1
+        self._lock = threading.Lock()
+
+        if data is not None:
+            self._buffer = memoryview(data)
+            return
+
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._buffer = memoryview(self._mmap)
+        except (OSError, ValueError):
+            # 空文件或不支持映射的文件系统，退回普通读取
+            self._buffer = memoryview(self._file.read())
+            self._file.close()
+            self._file = None
+
+    @property
+    def buffer(self):
+        """整个文件内容的只读memoryview，不复制数据"""
+        if self._buffer is None:
+            raise ValueError("PdfSource已关闭")
+        return self._buffer
+
+    @property
+    def size(self):
+        return len(self.buffer)
+
+    @property
+    def closed(self):
+        return self._buffer is None
+
+    def open_document(self):
+        """
+        从共享缓冲区打开fitz.Document
+
+        返回:
+            fitz.Document: 在release/close时自动关闭，调用方也可以提前关闭
+        """
+        doc = fitz.open(stream=self.buffer, filetype="pdf")
+        self._documents.append(doc)
+        return doc
+
+    def reader_stream(self):
+        """返回直接读取共享缓冲区的文件对象，可传给 PyPDF2.PdfReader"""
+        return _BufferReader(self.buffer)
+
+    def prefetch(self):
+        """按顺序触碰整个文件，让后续步骤读取时数据已在内存中（网络共享目录上尤其明显）"""
+        if self._mmap is None:
+            return  # 内容已在内存中
+        buffer = self.buffer
+        for offset in range(0, len(buffer), mmap.PAGESIZE):
+            buffer[offset]
+
+    def acquire(self):
+        """增加一个使用者"""
+        with self._lock:
+            if self._buffer is None:
+                raise ValueError("PdfSource已关闭")
+            self._refs += 1
+        return self
+
+    def release(self):
+        """减少一个使用者，最后一个使用者释放时关闭"""
+        with self._lock:
+            self._refs -= 1
+            last = self._refs <= 0
+        if last:
+            self.close()
+
+    def close(self):
+        """关闭打开的文档并解除映射，不论还有多少使用者"""
+        with self._lock:
+            self._refs = 0
+            buffer, self._buffer = self._buffer, None
+            documents, self._documents = self._documents, []
+        if buffer is None:
+            return
+        for doc in documents:
+            if not doc.is_closed:
+                doc.close()
+        try:
+            buffer.release()
+            if self._mmap is not None:
+                self._mmap.close()
+        except BufferError:
+            # 仍有外部对象引用缓冲区时无法立即解除映射，交给垃圾回收
+            pass
+        self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
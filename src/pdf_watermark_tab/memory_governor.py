@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+内存感知的并发控制模块
+
+栅格化时每页要分配与页面像素数成正比的内存，A3页面在150DPI下每页就要几十MB，
+多个进程同时处理大文件时很容易耗尽内存。这里根据页面尺寸和DPI估算每个文件的内存峰值，
+结合系统当前可用内存决定能同时处理几个文件：小文件照常满核并行，
+大文件自动减少并发，单个文件就超出预算时独占运行
+"""
+
+import os
+import sys
+import threading
+
+import config
+
+
+# 渲染一页时每个像素的内存峰值（字节），包括渲染结果、混合用的副本、缓存的水印图层和插入时的压缩缓冲，
+# 按实测值留有余量
+_BYTES_PER_PIXEL = {"flat": 32, "mrc": 24}
+# 已完成的页面以压缩后的图像保存在输出文档中，直到加密保存，每个像素约占的字节数
+_OUTPUT_BYTES_PER_PIXEL = {"flat": 1.0, "mrc": 0.2}
+
+
+def available_memory():
+    """
+    系统当前可用的物理内存（字节）
+
+    返回:
+        int: 无法获取时返回None
+    """
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/meminfo", "r") as f:
+                for line in f:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+    elif sys.platform == "win32":
+        try:
+            import ctypes
+
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                            ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                            ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                            ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                            ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return int(status.ullAvailPhys)
+        except (OSError, AttributeError):
+            pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def estimate_job_memory(job, output_format="flat"):
+    """
+    估算处理一个文件时工作进程的内存峰值（字节）
+
+    参数:
+        job: scheduler.PdfJob
+        output_format: "flat" 或 "mrc"，MRC按文字层的分辨率估算
+
+    返回:
+        int: 预计峰值
+    """
+    output_format = output_format if output_format in _BYTES_PER_PIXEL else "flat"
+    # MRC的文字层以更高分辨率渲染
+    scale = 1.0
+    if output_format == "mrc" and job.dpi > 0:
+        scale = (max(job.dpi, config.MRC_MASK_DPI) / job.dpi) ** 2
+    page_pixels = job.max_page_pixels * scale
+    if config.TILE_PIXEL_THRESHOLD > 0 and page_pixels > config.TILE_PIXEL_THRESHOLD:
+        # 超大页面分块渲染，峰值只与块大小有关
+        page_pixels = config.TILE_SIZE ** 2
+    return int(config.WORKER_BASE_MB * 1024 * 1024
+               + page_pixels * _BYTES_PER_PIXEL[output_format]
+               + job.megapixels * scale * 1e6 * _OUTPUT_BYTES_PER_PIXEL[output_format]
+               + 2 * job.file_size)  # 输入文件的映射和解析后的对象
+
+
+class MemoryGovernor:
+    """
+    按预计内存峰值决定是否可以再开始一个文件
+
+    开始时测量一次可用内存，乘以 config.MEMORY_BUDGET_FRACTION 作为预算；
+    所有进行中文件的预计峰值之和不超过预算，并且当前实际可用内存还放得下新文件时才允许开始。
+    没有文件在处理时总是允许，超出预算的大文件因此会独占运行，而不是一直等待
+
+    参数:
+        budget_bytes: 内存预算（字节），默认按当前可用内存计算；无法获取可用内存时不限制
+    """
+
+    def __init__(self, budget_bytes=None):
+        if budget_bytes is None:
+            available = available_memory()
+            budget_bytes = available * config.MEMORY_BUDGET_FRACTION if available else None
+        self.budget_bytes = budget_bytes
+        self.reserved_bytes = 0
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, estimate):
+        """
+        尝试为预计峰值为estimate的文件预留内存
+
+        返回:
+            bool: 是否可以开始处理，返回True后处理完成时必须调用 release(estimate)
+        """
+        with self._lock:
+            if self.running > 0 and self.budget_bytes is not None:
+                if self.reserved_bytes + estimate > self.budget_bytes:
+                    return False
+                available = available_memory()
+                if available is not None and available * config.MEMORY_BUDGET_FRACTION < estimate:
+                    return False
+            self.reserved_bytes += estimate
+            self.running += 1
+            return True
+
+    def release(self, estimate):
+        """文件处理完成，归还预留的内存"""
+        with self._lock:
+            self.reserved_bytes = max(0, self.reserved_bytes - estimate)
+            self.running = max(0, self.running - 1)
+
+    def worker_limit(self, estimates, max_workers):
+        """
+        按一批文件的预计峰值给出建议的进程数（至少为1，不超过max_workers）
+
+        用于创建进程池：大文件较多时少开几个进程，省下的内存留给正在运行的进程
+        """
+        if self.budget_bytes is None or not estimates:
+            return max_workers
+        typical = sorted(estimates)[len(estimates) // 2]
+        return max(1, min(max_workers, int(self.budget_bytes // max(typical, 1))))
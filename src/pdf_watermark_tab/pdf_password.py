@@ -3,12 +3,29 @@
 
 """
 PDF密码保护模块，用于为PDF添加用户密码保护
+
+安装了pikepdf时，加密后的输出同时线性化（快速网页查看）：第一页的对象和提示表放在文件开头，
+其余页面按页序排列，浏览器边下载边显示，不需要等整个文件下载完成。PyMuPDF已不再支持线性化，
+没有pikepdf或关闭 config.LINEARIZE_OUTPUT 时按原方式由PyMuPDF加密保存
 """
 
+import io
 import os
+import re
 import fitz  # PyMuPDF
 from pypinyin import lazy_pinyin
 
+import config
+
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
+
+# 线性化文件的第一个对象是线性化参数字典，/L 为整个文件的长度
+_LINEARIZED_HEADER = re.compile(rb"^%PDF-\d\.\d.*?\d+\s+\d+\s+obj\s*<<(.*?)>>", re.DOTALL)
+_LINEARIZED_LENGTH = re.compile(rb"/L\s+(\d+)")
+
 
 def add_password_to_pdf(input_pdf, output_pdf, password):
     """
@@ -26,30 +43,8 @@ def add_password_to_pdf(input_pdf, output_pdf, password):
         # 打开PDF文件
         doc = fitz.open(input_pdf)
         
-        # 设置PDF权限和密码
-        # 使用兼容不同版本的PyMuPDF的方式设置权限
-        perm = int(
-            fitz.PDF_PERM_ACCESSIBILITY |  # 允许访问性
-            fitz.PDF_PERM_PRINT |          # 允许打印
-            fitz.PDF_PERM_COPY |           # 允许复制内容
-            fitz.PDF_PERM_ANNOTATE |       # 允许注释
-            fitz.PDF_PERM_ASSEMBLE |       # 允许组装
-            fitz.PDF_PERM_FORM |           # 允许填写表单
-            fitz.PDF_PERM_MODIFY           # 允许修改
-        )
-        
         # 应用加密设置并保存
-        # 添加压缩选项以减小文件大小
-        doc.save(
-            output_pdf,
-            encryption=fitz.PDF_ENCRYPT_AES_256,  # 恢复使用AES-256加密
-            user_pw=password,
-            owner_pw=password,
-            permissions=perm,
-            garbage=4,  # 完全垃圾收集
-            deflate=True,  # 使用deflate压缩
-            pretty=False  # 不使用美化格式（减小大小）
-        )
+        write_encrypted_document(doc, output_pdf, password)
         doc.close()
         return True
     except Exception as e:
@@ -57,6 +52,154 @@ def add_password_to_pdf(input_pdf, output_pdf, password):
         return False
 
 
+def save_document_with_password(doc, output_pdf, password):
+    """
+    将已打开的PDF文档加密后保存，不需要先写出未加密的中间文件
+    
+    Args:
+        doc: fitz.Document
+        output_pdf: 输出PDF文件路径
+        password: 用于保护PDF的密码
+    
+    Returns:
+        bool: 是否成功添加密码
+    """
+    try:
+        write_encrypted_document(doc, output_pdf, password)
+        return True
+    except Exception as e:
+        print(f"添加密码时出错: {str(e)}")
+        return False
+
+
+def encrypt_pdf_document(doc, password):
+    """
+    在内存中为已打开的PDF文档加密，返回加密后的PDF内容（不写磁盘）
+    
+    Args:
+        doc: fitz.Document
+        password: 用于保护PDF的密码
+    
+    Returns:
+        bytes: 加密后的PDF内容
+    """
+    if linearization_available():
+        output = io.BytesIO()
+        _save_linearized(doc, output, password)
+        return output.getvalue()
+    return doc.tobytes(**encryption_options(password))
+
+
+def write_encrypted_document(doc, output, password):
+    """
+    将已打开的PDF文档加密后写入文件，出错时抛出异常
+    
+    Args:
+        doc: fitz.Document
+        output: 输出PDF文件路径，或可写的二进制文件对象
+        password: 用于保护PDF的密码
+    """
+    if linearization_available():
+        _save_linearized(doc, output, password)
+    else:
+        doc.save(output, **encryption_options(password))
+
+
+def linearization_available():
+    """是否线性化输出（config.LINEARIZE_OUTPUT 打开且安装了pikepdf）"""
+    return bool(config.LINEARIZE_OUTPUT) and pikepdf is not None
+
+
+def _pikepdf_permissions(perm):
+    """把PyMuPDF的权限位换算为pikepdf.Permissions，两种保存方式写出相同的权限"""
+    return pikepdf.Permissions(
+        accessibility=bool(perm & fitz.PDF_PERM_ACCESSIBILITY),
+        extract=bool(perm & fitz.PDF_PERM_COPY),
+        modify_annotation=bool(perm & fitz.PDF_PERM_ANNOTATE),
+        modify_assembly=bool(perm & fitz.PDF_PERM_ASSEMBLE),
+        modify_form=bool(perm & fitz.PDF_PERM_FORM),
+        modify_other=bool(perm & fitz.PDF_PERM_MODIFY),
+        print_lowres=bool(perm & fitz.PDF_PERM_PRINT),
+        print_highres=bool(perm & fitz.PDF_PERM_PRINT_HQ),
+    )
+
+
+class _StreamWriter(io.RawIOBase):
+    """pikepdf只接受路径或带seek的文件对象，只有write方法的输出（例如网络连接的包装）经此转交，pikepdf只会顺序写出"""
+
+    def __init__(self, target):
+        self._target = target
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._target.write(data)
+        return len(data)
+
+
+def _save_linearized(doc, output, password):
+    """
+    由pikepdf（qpdf）一次完成线性化和加密，直接写入output（路径或可写的二进制文件对象）
+
+    PyMuPDF先不加密地压缩保存到内存，pikepdf按页序重排对象、写入提示表，
+    再使用与 encryption_options 相同的AES-256加密和权限
+    """
+    options = encryption_options(password)
+    data = doc.tobytes(garbage=options["garbage"], deflate=options["deflate"], pretty=options["pretty"])
+    if not isinstance(output, (str, bytes, os.PathLike)) and not hasattr(output, "seek"):
+        output = _StreamWriter(output)
+    # 文件标识的第一项（泄露追踪指纹）保留不变，第二项由qpdf重新生成
+    with pikepdf.open(io.BytesIO(data)) as pdf:
+        pdf.save(output, linearize=True, compress_streams=True,
+                 encryption=pikepdf.Encryption(user=password, owner=password, R=6,
+                                               allow=_pikepdf_permissions(options["permissions"])))
+
+
+def is_linearized(data):
+    """
+    检查PDF内容是否为线性化（快速网页查看）文件，不需要密码也不需要pikepdf
+    
+    Args:
+        data: PDF内容（bytes / memoryview）
+    
+    Returns:
+        bool: 文件开头有线性化参数字典，且其中记录的文件长度与实际一致
+              （线性化之后又被增量保存的文件浏览器不会按线性化处理）
+    """
+    match = _LINEARIZED_HEADER.match(bytes(data[:1024]))
+    if not match or b"/Linearized" not in match.group(1):
+        return False
+    length = _LINEARIZED_LENGTH.search(match.group(1))
+    return length is not None and int(length.group(1)) == len(data)
+
+
+def encryption_options(password):
+    """加密保存时使用的参数（权限、密码和压缩选项）"""
+    # 设置PDF权限和密码
+    # 使用兼容不同版本的PyMuPDF的方式设置权限
+    perm = int(
+        fitz.PDF_PERM_ACCESSIBILITY |  # 允许访问性
+        fitz.PDF_PERM_PRINT |          # 允许打印
+        fitz.PDF_PERM_COPY |           # 允许复制内容
+        fitz.PDF_PERM_ANNOTATE |       # 允许注释
+        fitz.PDF_PERM_ASSEMBLE |       # 允许组装
+        fitz.PDF_PERM_FORM |           # 允许填写表单
+        fitz.PDF_PERM_MODIFY           # 允许修改
+    )
+    
+    # 添加压缩选项以减小文件大小
+    return dict(
+        encryption=fitz.PDF_ENCRYPT_AES_256,  # 恢复使用AES-256加密
+        user_pw=password,
+        owner_pw=password,
+        permissions=perm,
+        garbage=4,  # 完全垃圾收集
+        deflate=True,  # 使用deflate压缩
+        pretty=False  # 不使用美化格式（减小大小）
+    )
+
+
 def get_pinyin_password(chinese_name):
     """
     将中文姓名转换为拼音作为密码
@@ -88,13 +231,16 @@ def secure_pdf_with_password(input_pdf, output_pdf, chinese_name, fallback_passw
     Returns:
         tuple: (是否成功, 使用的密码)
     """
+    password = get_student_password(chinese_name, fallback_password)
+    
+    # 添加密码保护
+    success = add_password_to_pdf(input_pdf, output_pdf, password)
+    return success, password 
+
+def get_student_password(chinese_name, fallback_password="dotrix"):
+    """学生姓名拼音密码，无法获取拼音时使用备用密码"""
     # 生成拼音密码
     password = get_pinyin_password(chinese_name)
     
     # 如果无法获取拼音，使用备用密码
-    if not password:
-        password = fallback_password
-    
-    # 添加密码保护
-    success = add_password_to_pdf(input_pdf, output_pdf, password)
-    return success, password 
\ No newline at end of file
+    return password or fallback_password
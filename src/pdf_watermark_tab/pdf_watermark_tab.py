@@ -7,6 +7,7 @@ PDF水印选项卡模块，包含PDF水印相关的所有功能
 
 import os
 import sys
+import threading
 from PyQt5.QtWidgets import (QWidget, QApplication, QMessageBox, QFileDialog, QListWidgetItem)
 from PyQt5.QtCore import Qt, QDateTime
 import fitz  # PyMuPDF
@@ -14,8 +15,16 @@ from pathlib import Path
 
 # 修改相对导入为绝对导入
 from src.workbench_app.widgets import DropListWidget
-from src.pdf_watermark_tab.watermark_core import add_multiple_watermarks, get_application_path
-from src.pdf_watermark_tab.pdf_password import secure_pdf_with_password  # 导入密码保护功能
+from src.pdf_watermark_tab.watermark_core import get_application_path, build_watermark_text
+from src.pdf_watermark_tab.pipeline import convert_to_secure_pdf
+from src.pdf_watermark_tab.staged_pipeline import StagedPipeline, StagedTask
+from src.pdf_watermark_tab.worker_pool import shared_pool, prewarm_shared_pool
+from src.pdf_watermark_tab.fingerprint import new_fingerprint
+from src.pdf_watermark_tab.ledger import DistributionLedger, IssuedCopy
+from src.pdf_watermark_tab.verify import verify_outputs
+from src.pdf_watermark_tab.size_target import max_bytes_from_mb
+from src.pdf_watermark_tab.preflight import preflight, format_bytes, format_seconds
+from src.pdf_watermark_tab.scheduler import ThroughputStats, EtaTracker, plan_jobs
 from src.workbench_app.ui_pdf_watermark_tab import PDFWatermarkUI
 import config
 
@@ -36,6 +45,12 @@ class PDFWatermarkTab(QWidget):
         self.secure_mode = True
         self.dpi = 150
         
+        # 处理过程中"批量处理"按钮变为"取消"
+        self._running = False
+        self._cancel_event = threading.Event()
+        self._pipeline = None
+        self._prewarmed = False
+        
         # 初始化UI
         self.ui = PDFWatermarkUI()
         self.ui.setup_ui(self)
@@ -144,6 +159,10 @@ class PDFWatermarkTab(QWidget):
         """更新文件计数"""
         count = len(self.pdf_files)
         self.file_count_label.setText(f"已选择: {count} 个文件")
+        # 批处理使用常驻进程池，添加文件时就在后台启动并预热工作进程
+        if count > 0 and not self._prewarmed:
+            self._prewarmed = True
+            prewarm_shared_pool()
     
     def select_output_dir(self):
         """选择输出目录"""
@@ -157,38 +176,54 @@ class PDFWatermarkTab(QWidget):
     
     def convert_to_secure_pdf(self, input_pdf, output_pdf):
         """将PDF转换为图像格式以防止编辑"""
-        try:
-            # 打开输入PDF
-            pdf_doc = fitz.open(input_pdf)
-            # 创建一个新的输出PDF
-            output_doc = fitz.open()
-            
-            # 逐页转换为图像然后添加到新PDF
-            for page_num in range(len(pdf_doc)):
-                # 获取页面
-                page = pdf_doc[page_num]
-                # 计算适当的缩放因子，基于DPI (固定为150)
-                zoom = self.dpi / 72  # 默认PDF分辨率是72 DPI
-                # 创建页面的图像
-                pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
-                
-                # 创建新页面，尺寸与原始页面相同（但会按DPI缩放）
-                new_page = output_doc.new_page(width=pix.width, height=pix.height)
-                # 将图像插入新页面
-                new_page.insert_image(fitz.Rect(0, 0, pix.width, pix.height), pixmap=pix)
-            
-            # 保存输出PDF
-            output_doc.save(output_pdf)
-            output_doc.close()
-            pdf_doc.close()
-            
-            return True
-        except Exception as e:
-            print(f"转换PDF到安全格式时出错: {str(e)}")
-            return False
+        return convert_to_secure_pdf(input_pdf, output_pdf, self.dpi)
+    
+    def cancel_process(self):
+        """取消正在进行的批处理，正在处理的文件在下一页之前停下"""
+        self._cancel_event.set()
+        if self._pipeline is not None:
+            self._pipeline.cancel()
+        self.generate_btn.setEnabled(False)
+        self.generate_btn.setText("正在取消...")
+        self.status_label.setText("正在取消，请稍候...")
+        self.status_label.setStyleSheet("color: orange;")
+    
+    def preflight_batch(self):
+        """预估当前列表的处理耗时、内存、临时磁盘和输出大小"""
+        if not self.pdf_files:
+            QMessageBox.critical(self, "错误", "请添加至少一个PDF文件")
+            return
+        self.status_label.setText("正在预估...")
+        self.status_label.setStyleSheet("color: orange;")
+        QApplication.processEvents()
+        output_format = "mrc" if self.mrc_checkbox.isChecked() else "flat"
+        report = preflight(self.pdf_files, self.dpi, output_format, self.output_dir or None,
+                           max_bytes=max_bytes_from_mb(self.max_size_input.value()))
+        self.status_label.setText("准备就绪")
+        self.status_label.setStyleSheet("color: blue;")
+        
+        # 每个文件一行，耗时最长的在前
+        details = []
+        for item in sorted(report.files, key=lambda item: item.seconds, reverse=True):
+            name = os.path.basename(item.path)
+            if item.error:
+                details.append(f"{name}: {item.error}")
+            else:
+                details.append(f"{name}: {item.pages} 页，{format_seconds(item.seconds)}，"
+                               f"内存 {format_bytes(item.peak_memory)}，输出约 {format_bytes(item.output_size)}")
+        msg = QMessageBox(self)
+        msg.setIcon(QMessageBox.Warning if report.warnings else QMessageBox.Information)
+        msg.setWindowTitle("处理预估")
+        msg.setText(report.describe())
+        msg.setDetailedText("\n".join(details))
+        msg.exec_()
     
     def batch_process(self):
         """批量处理PDF文件"""
+        if self._running:
+            self.cancel_process()
+            return
+        
         # 检查是否已选择所有必要文件
         if not self.pdf_files:
             QMessageBox.critical(self, "错误", "请添加至少一个PDF文件")
@@ -206,116 +241,134 @@ class PDFWatermarkTab(QWidget):
             QMessageBox.critical(self, "错误", "请输入该PDF课件将要交付给的学生实名")
             return
         
+        ledger = None
         try:
-            # 禁用按钮显示处理中
-            self.generate_btn.setEnabled(False)
-            self.generate_btn.setText("处理中...")
+            # 处理过程中按钮用于取消
+            self._running = True
+            self._cancel_event.clear()
+            self.generate_btn.setText("取消")
             self.status_label.setText("正在处理，请稍候...")
             self.status_label.setStyleSheet("color: orange;")
             
             # 更新UI
             QApplication.processEvents()
             
-            total_files = len(self.pdf_files)
-            # 处理步骤现在是三倍文件数，因为每个文件都需要添加水印、安全转换和添加密码三个步骤
-            max_steps = total_files * 3
-            self.progress_bar.setMaximum(max_steps)
-            successful = 0
-            failed = 0
+            # 按页数、页面面积和DPI估算耗时并排序，进度条按预计耗时推进
+            self.status_label.setText("正在分析PDF页数...")
+            QApplication.processEvents()
+            strategy = self.order_combo.currentData() or config.SCHEDULE_STRATEGY
+            stats = ThroughputStats()
+            output_format = "mrc" if self.mrc_checkbox.isChecked() else "flat"
+            max_bytes = max_bytes_from_mb(self.max_size_input.value())
+            # MRC的文字层以更高分辨率渲染，估算耗时时按实际渲染分辨率计算
+            render_dpi = max(self.dpi, config.MRC_MASK_DPI) if output_format == "mrc" else self.dpi
+            jobs = plan_jobs(self.pdf_files, render_dpi, strategy, stats)
+            tracker = EtaTracker(jobs)
+            
+            total_files = len(jobs)
+            progress_steps = 1000
+            self.progress_bar.setMaximum(progress_steps)
+            self.progress_bar.setValue(0)
+            counts = {"successful": 0, "failed": 0, "cancelled": 0}
+            # 各颜色空间渲染的页数，黑白页面自动按灰度渲染
+            render_metrics = {"gray_pages": 0, "rgb_pages": 0}
             
-            step_count = 0
+            def add_metrics(metrics):
+                for key, value in metrics.items():
+                    render_metrics[key] = render_metrics.get(key, 0) + value
             
-            # 处理每个PDF文件
-            for i, input_pdf in enumerate(self.pdf_files):
-                try:
-                    # 更新进度
-                    self.progress_bar.setValue(step_count)
-                    self.status_label.setText(f"处理中: {os.path.basename(input_pdf)} - 添加水印 ({i+1}/{total_files})")
-                    QApplication.processEvents()  # 确保UI更新
-                    
-                    # 创建输出文件路径
-                    base_name = os.path.basename(input_pdf)
-                    name, ext = os.path.splitext(base_name)
-                    
-                    # 使用学生名作为文件后缀，而不是"带水印"
-                    student_name = self.student_input.text().strip()
-                    # 先创建临时文件用于添加水印
-                    temp_output = os.path.join(self.output_dir, f"{name}_temp{ext}")
-                    secure_output = os.path.join(self.output_dir, f"{name}_secure{ext}")
-                    final_output = os.path.join(self.output_dir, f"{name}_{student_name}_可用chrome打开{ext}")
-                    
-                    # 添加网格状水印
-                    add_multiple_watermarks(
-                        input_pdf=input_pdf,
-                        watermark_image=self.watermark_image,
-                        watermark_text=self.watermark_text,
-                        output_pdf=temp_output,
-                        img_scale=config.DEFAULT_IMG_SCALE,
-                        img_opacity=config.DEFAULT_IMG_OPACITY,
-                        font_name=config.DEFAULT_FONT_NAME,
-                        font_size=24,  # 将字体调小为24（默认一般是36）
-                        text_opacity=config.DEFAULT_TEXT_OPACITY,
-                        angle=config.DEFAULT_ANGLE,
-                        on_top=True,
-                        rows=5,   # 5行
-                        cols=3    # 3列
-                    )
-                    
-                    step_count += 1
-                    self.progress_bar.setValue(step_count)
-                    
-                    # 将带水印的PDF转换为图像格式
-                    self.status_label.setText(f"处理中: {os.path.basename(input_pdf)} - 安全转换 ({i+1}/{total_files})")
-                    QApplication.processEvents()
-                    
-                    # 执行安全转换
-                    if self.convert_to_secure_pdf(temp_output, secure_output):
-                        # 删除临时文件
-                        try:
-                            os.remove(temp_output)
-                        except:
-                            pass  # 忽略临时文件删除失败
-                    else:
-                        # 转换失败，使用临时文件作为安全输出
-                        if os.path.exists(temp_output):
-                            secure_output = temp_output
-                    
-                    step_count += 1
-                    self.progress_bar.setValue(step_count)
-                    
-                    # 为安全转换后的PDF添加密码保护
-                    self.status_label.setText(f"处理中: {os.path.basename(input_pdf)} - 添加密码保护 ({i+1}/{total_files})")
+            # 每份输出嵌入唯一指纹，全部处理完成后在一个事务中记入发放台账
+            if config.LEDGER_ENABLED:
+                ledger = DistributionLedger()
+            fingerprints = {}
+            if config.FINGERPRINT_ENABLED:
+                fingerprints = {job.path: new_fingerprint(ledger) for job in jobs}
+            issued = []
+            # 成功写出的文件 (输出文件, 密码, 源文件)，处理完成后统一校验
+            produced = []
+            
+            # 分阶段流水线：读取、多进程计算和写出互相重叠。单个文件同样在工作进程中处理，
+            # 卡在PDF解析或渲染（C代码）中的文件超时后由进程池强制结束，界面不会卡死
+            def on_done(result):
+                job = result.task.tag
+                if result.success:
+                    counts["successful"] += 1
+                    stats.record(job, result.stage_seconds)
+                    add_metrics(result.metrics)
+                    issued.append(IssuedCopy(student_name, job.path, result.task.final_output,
+                                             result.output_hash, result.password, self.watermark_text,
+                                             result.source_hash, result.task.fingerprint))
+                    produced.append((result.task.final_output, result.password, job.path))
+                elif pipeline.cancelled:
+                    counts["cancelled"] += 1
+                else:
+                    # 失败原因（包括超时）已由流水线打印
+                    counts["failed"] += 1
+                tracker.job_finished(job)
+                done = counts["successful"] + counts["failed"] + counts["cancelled"]
+                self.progress_bar.setValue(int(tracker.fraction() * progress_steps))
+                self.eta_label.setText(tracker.describe())
+                self.status_label.setText(f"已完成: {os.path.basename(job.path)} ({done}/{total_files})")
+                QApplication.processEvents()  # 确保UI更新
+            
+            tasks = [StagedTask(job.path, self.output_dir, student_name, self.watermark_text,
+                                self.watermark_image, self.dpi, output_format, tag=job,
+                                fingerprint=fingerprints.get(job.path), max_bytes=max_bytes)
+                     for job in jobs]
+            # 使用整个会话共用的常驻进程池，工作进程已经完成初始化
+            pipeline = StagedPipeline(pool=shared_pool())
+            self._pipeline = pipeline
+            self.status_label.setText(f"处理中: {os.path.basename(jobs[0].path)} (1/{total_files})")
+            # 等待工作进程期间继续处理界面事件，"取消"按钮随时可用
+            pipeline.run(tasks, on_done, idle=QApplication.processEvents)
+            
+            # 保存本次测得的吞吐量，下次估算更准确
+            stats.save()
+            
+            # 重新打开每个输出，确认能用密码打开、页数正确、没有被截断，结果写入输出目录中的校验清单
+            invalid = []
+            if config.VERIFY_OUTPUTS and produced:
+                self.status_label.setText(f"正在校验输出文件 (0/{len(produced)})...")
+                QApplication.processEvents()
+                verified = []
+                
+                def on_verified(result):
+                    verified.append(result)
+                    self.status_label.setText(f"正在校验输出文件 ({len(verified)}/{len(produced)})...")
                     QApplication.processEvents()
-                    
-                    # 使用密码保护方法
-                    success, password = secure_pdf_with_password(secure_output, final_output, student_name)
-                    
-                    # 删除中间文件
-                    if os.path.exists(secure_output) and secure_output != temp_output:
-                        try:
-                            os.remove(secure_output)
-                        except:
-                            pass
-                    
-                    step_count += 1
-                    self.progress_bar.setValue(step_count)
-                    
-                    successful += 1
-                except Exception as e:
-                    print(f"处理文件 {input_pdf} 时出错: {str(e)}")
-                    failed += 1
+                
+                manifest_path = os.path.join(self.output_dir, config.VERIFY_MANIFEST_FILE)
+                for result in verify_outputs(produced, manifest_path, callback=on_verified):
+                    if not result.ok:
+                        print(f"校验 {result.output} 未通过: {result.error}")
+                        invalid.append(result)
+                counts["successful"] -= len(invalid)
+                counts["failed"] += len(invalid)
+            
+            # 未通过校验的文件不记入发放台账
+            if ledger is not None:
+                invalid_outputs = {result.output for result in invalid}
+                ledger.record(copy for copy in issued if copy.output not in invalid_outputs)
             
             # 更新最终进度
-            self.progress_bar.setValue(max_steps)
+            successful = counts["successful"]
+            failed = counts["failed"]
+            cancelled = counts["cancelled"]
+            self.progress_bar.setValue(progress_steps)
+            self.eta_label.setText(f"平均 {tracker.pages_per_second():.1f} 页/秒")
             
-            status_color = "green" if failed == 0 else "orange"
-            self.status_label.setText(f"处理完成! 成功: {successful}, 失败: {failed}")
+            status_color = "green" if failed == 0 and cancelled == 0 else "orange"
+            self.status_label.setText(f"处理完成! 成功: {successful}, 失败: {failed}"
+                                      + (f", 已取消: {cancelled}" if cancelled else ""))
             self.status_label.setStyleSheet(f"color: {status_color};")
             
             QMessageBox.information(
                 self, 
                 "处理完成", 
-                f"批量处理完成!\n已启用防编辑模式，PDF已转换为不可编辑格式\n已添加密码保护，密码为学生姓名拼音\n成功: {successful} 个文件\n失败: {failed} 个文件\n输出目录: {self.output_dir}"
+                f"批量处理完成!\n已启用防编辑模式，PDF已转换为不可编辑格式\n已添加密码保护，密码为学生姓名拼音\n成功: {successful} 个文件\n失败: {failed} 个文件\n"
+                + (f"已取消: {cancelled} 个文件\n" if cancelled else "")
+                + f"灰度渲染: {render_metrics['gray_pages']} 页，彩色渲染: {render_metrics['rgb_pages']} 页\n输出目录: {self.output_dir}"
+                + "".join(f"\n校验未通过: {os.path.basename(result.output)}（{result.error}）" for result in invalid[:10])
             )
         
         except Exception as e:
@@ -323,6 +376,10 @@ class PDFWatermarkTab(QWidget):
             self.status_label.setStyleSheet("color: red;")
             QMessageBox.critical(self, "错误", f"处理时出错: {str(e)}")
         finally:
+            if ledger is not None:
+                ledger.close()
+            self._running = False
+            self._pipeline = None
             # 恢复按钮状态
             self.generate_btn.setEnabled(True)
             self.generate_btn.setText("批量处理")
@@ -340,7 +397,7 @@ class PDFWatermarkTab(QWidget):
         
         # 按照新的格式构建水印文本 - 不包含科目名和第几节
         if student:
-            self.watermark_text = f"小红书号100135317 点线成面DOTRIX {student}同学 {datetime}"
+            self.watermark_text = build_watermark_text(student, datetime)
             # 更新状态
             self.status_label.setText(f"水印文本已更新: {self.watermark_text}")
             self.status_label.setStyleSheet("color: green;")
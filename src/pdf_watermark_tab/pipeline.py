@@ -0,0 +1,498 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+PDF处理流水线模块，不依赖Qt，供选项卡、监控文件夹服务等共同使用
+
+单个文件的处理分为三步：添加水印 -> 安全转换（栅格化） -> 添加密码保护
+"""
+
+import io
+import os
+import hashlib
+import fitz  # PyMuPDF
+import numpy as np
+
+from src.pdf_watermark_tab.watermark_core import add_multiple_watermarks, get_application_path
+from src.pdf_watermark_tab.raster_overlay import get_cached_overlay, TiledWatermarkOverlay
+from src.pdf_watermark_tab.raster_cache import render_page_cached, page_hasher, default_cache
+from src.pdf_watermark_tab.mrc import write_mrc_page, add_mrc_region
+from src.pdf_watermark_tab.tiling import page_pixel_size, needs_tiling, tile_rects, render_region, insert_tile
+from src.pdf_watermark_tab.colorspace import resolve_colorspace, fitz_colorspace, count_page, COLORSPACE_RGB
+from src.pdf_watermark_tab.image_dedup import ImageDeduplicator, uniform_color, count_metric
+from src.pdf_watermark_tab.pdf_password import get_student_password, save_document_with_password
+from src.pdf_watermark_tab.loader import PdfSource
+from src.pdf_watermark_tab.fingerprint import stamp_fingerprint, stamp_pattern_pixels
+from src.pdf_watermark_tab.job_guard import checkpoint, JobAborted
+from src.pdf_watermark_tab.size_target import fit_document
+import config
+
+
+# 流水线的三个步骤名称，用于进度显示
+PIPELINE_STAGES = ("添加水印", "安全转换", "添加密码保护")
+
+
+def check_dpi(dpi):
+    """
+    检查安全转换的渲染分辨率
+
+    DPI为0或负数时渲染失败，流程会退回到没有栅格化的水印文档，输出中仍有可提取的文字，
+    因此所有入口（库接口、HTTP服务、监控文件夹、分片任务）都必须先经过这里
+
+    参数:
+        dpi: 渲染分辨率（整数或可转换为整数的字符串）
+
+    返回:
+        int: 检查后的DPI
+
+    超出 1 到 config.SECURE_MAX_DPI 的范围时抛出 ValueError
+    """
+    dpi = int(dpi)
+    if not 0 < dpi <= config.SECURE_MAX_DPI:
+        raise ValueError(f"DPI必须在1到{config.SECURE_MAX_DPI}之间: {dpi}")
+    return dpi
+
+
+def default_watermark_image():
+    """固定使用dotrix_logo_chn.png作为水印图片"""
+    return os.path.join(get_application_path(), config.PICTURES_DIR, "dotrix_logo_chn.png")
+
+
+def convert_to_secure_pdf(input_pdf, output_pdf, dpi=150, output_format="flat"):
+    """
+    将PDF转换为图像格式以防止编辑
+
+    参数:
+        input_pdf: 输入PDF文件路径
+        output_pdf: 输出PDF文件路径
+        dpi: 渲染分辨率
+        output_format: "flat" 整页RGB图像；"mrc" 高分辨率1位文字层 + 低分辨率JPEG背景
+
+    返回:
+        bool: 是否转换成功
+    """
+    try:
+        with PdfSource(input_pdf) as source:
+            output_doc = convert_document_to_secure(source.open_document(), dpi, output_format)
+        # 保存输出PDF
+        output_doc.save(output_pdf)
+        output_doc.close()
+
+        return True
+    except Exception as e:
+        print(f"转换PDF到安全格式时出错: {str(e)}")
+        return False
+
+
+def convert_document_to_secure(pdf_doc, dpi=150, output_format="flat", colorspace=None, metrics=None,
+                               jpeg_quality=None, fingerprint=None):
+    """
+    convert_to_secure_pdf 的内存版本：输入已打开的文档，返回新建的安全文档，出错时抛出异常
+
+    参数:
+        colorspace: "auto" 黑白页面按灰度渲染 / "rgb" / "gray"，默认 config.RENDER_COLORSPACE，
+                    只对flat格式生效
+        metrics: 统计字典，累计灰度和RGB页数（gray_pages / rgb_pages）、空白页数（blank_pages）
+                 和复用的图像数（reused_images）
+        jpeg_quality: MRC背景JPEG质量，默认 config.MRC_JPEG_QUALITY
+        fingerprint: 写入页面像素的泄露追踪指纹点阵（fingerprint.stamp_pattern_pixels），为空时不写入
+        其余参数同 convert_to_secure_pdf
+
+    返回:
+        fitz.Document: 未保存的输出文档，由调用方负责保存和关闭
+    """
+    # 创建一个新的输出PDF，内容相同的页面图像只保存一份
+    output_doc = fitz.open()
+    dedup = ImageDeduplicator(output_doc, metrics)
+
+    # 逐页转换为图像然后添加到新PDF
+    for page_num in range(len(pdf_doc)):
+        # 超时或取消时在页面之间停下
+        checkpoint()
+        # 获取页面
+        page = pdf_doc[page_num]
+        # 文字层使用更高的分辨率渲染
+        render_dpi = max(dpi, config.MRC_MASK_DPI) if output_format == "mrc" else dpi
+        space = _page_colorspace(page, output_format, colorspace, metrics)
+        width, height = page_pixel_size(page, render_dpi)
+        if needs_tiling(width, height):
+            _write_tiled_page(output_doc, page, render_dpi, width, height, output_format, dedup=dedup,
+                              colorspace=space, jpeg_quality=jpeg_quality, fingerprint=fingerprint)
+            continue
+        if output_format == "mrc":
+            pixels = render_page_cached(page, render_dpi)
+            if fingerprint:
+                stamp_pattern_pixels(pixels, fingerprint, (pixels.shape[1], pixels.shape[0]))
+            write_mrc_page(output_doc, pixels, render_dpi, jpeg_quality=jpeg_quality)
+            continue
+
+        # 计算适当的缩放因子，基于DPI
+        zoom = dpi / 72  # 默认PDF分辨率是72 DPI
+        # 创建页面的图像，黑白页面使用单通道灰度
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz_colorspace(space), alpha=False)
+        pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        if fingerprint:
+            pixels = pixels.copy()
+            stamp_pattern_pixels(pixels, fingerprint, (pix.width, pix.height))
+
+        # 创建新页面，尺寸与原始页面相同（但会按DPI缩放）
+        new_page = output_doc.new_page(width=pix.width, height=pix.height)
+        # 将图像插入新页面，空白页面用纯色填充
+        if _insert_page_image(dedup, new_page, pixels, (0, 0, pix.width, pix.height)):
+            count_metric(metrics, "blank_pages")
+
+    return output_doc
+
+
+def raster_watermark_pdf(input_pdf, output_pdf, watermark_image, watermark_text, dpi=150, cache=None,
+                         output_format="flat"):
+    """
+    在栅格域中添加水印：渲染原始页面（相同页面从缓存读取），再混合预渲染的水印图层
+
+    与"先合并矢量水印再整页渲染"的输出效果相同，但原始页面不含水印，
+    可以在不同文档、不同学生之间共享缓存
+
+    参数:
+        input_pdf: 输入PDF文件路径（不含水印）
+        output_pdf: 输出PDF文件路径
+        watermark_image: 中心水印图片路径
+        watermark_text: 水印文字内容
+        dpi: 渲染分辨率
+        cache: PageRasterCache，为空时不使用缓存
+        output_format: "flat" 整页RGB图像；"mrc" 高分辨率1位文字层 + 低分辨率JPEG背景，
+                       水印同时烧入两层
+
+    返回:
+        bool: 是否转换成功
+    """
+    try:
+        with PdfSource(input_pdf) as source:
+            output_doc = raster_watermark_document(source.open_document(), watermark_image, watermark_text,
+                                                   dpi, cache, output_format)
+        output_doc.save(output_pdf)
+        output_doc.close()
+
+        return True
+    except Exception as e:
+        print(f"栅格水印转换时出错: {str(e)}")
+        return False
+
+
+def raster_watermark_document(pdf_doc, watermark_image, watermark_text, dpi=150, cache=None,
+                              output_format="flat", colorspace=None, metrics=None, jpeg_quality=None,
+                              fingerprint=None):
+    """
+    raster_watermark_pdf 的内存版本：输入已打开的文档，返回新建的安全文档，出错时抛出异常
+
+    参数:
+        pdf_doc: 已打开的原始fitz.Document
+        colorspace: "auto" 黑白页面按灰度渲染 / "rgb" / "gray"，默认 config.RENDER_COLORSPACE，
+                    只对flat格式生效
+        metrics: 统计字典，累计灰度和RGB页数（gray_pages / rgb_pages）、空白页数（blank_pages）
+                 和复用的图像数（reused_images）
+        jpeg_quality: MRC背景JPEG质量，默认 config.MRC_JPEG_QUALITY
+        fingerprint: 写入页面像素的泄露追踪指纹点阵（fingerprint.stamp_pattern_pixels），为空时不写入
+        其余参数同 raster_watermark_pdf
+
+    返回:
+        fitz.Document: 未保存的输出文档，由调用方负责保存和关闭
+    """
+    output_doc = fitz.open()
+    dedup = ImageDeduplicator(output_doc, metrics)
+    hasher = page_hasher(pdf_doc)
+    if output_format == "mrc":
+        # 文字层使用更高的分辨率渲染
+        dpi = max(dpi, config.MRC_MASK_DPI)
+
+    for page_num in range(len(pdf_doc)):
+        checkpoint()
+        # 随机位置的英文LOGO和水平文字：默认每页各自随机；设置了变体数量时几种变体轮流使用，每种只渲染一次
+        variants = config.RASTER_OVERLAY_VARIANTS
+        variant = page_num % variants if variants > 0 else page_num
+
+        page = pdf_doc[page_num]
+        space = _page_colorspace(page, output_format, colorspace, metrics)
+        width, height = page_pixel_size(page, dpi)
+        if needs_tiling(width, height):
+            # 超大页面不渲染整页，也不进入页面缓存
+            watermark = TiledWatermarkOverlay(width, height, dpi, watermark_image, watermark_text, variant)
+            try:
+                _write_tiled_page(output_doc, page, dpi, width, height, output_format, watermark, dedup, space,
+                                  jpeg_quality, fingerprint)
+            finally:
+                watermark.close()
+            continue
+
+        pixels = render_page_cached(page, dpi, cache, hasher, space)
+        height, width = pixels.shape[:2]
+        overlay = get_cached_overlay(width, height, dpi, watermark_image, watermark_text, variant)
+
+        if output_format == "mrc":
+            overlay.blend(pixels)
+            if fingerprint:
+                stamp_pattern_pixels(pixels, fingerprint, (width, height))
+            write_mrc_page(output_doc, pixels, dpi, overlay, jpeg_quality=jpeg_quality)
+            continue
+
+        new_page = output_doc.new_page(width=width, height=height)
+        rect = (0, 0, width, height)
+        key = None
+        color = uniform_color(pixels)
+        if color is not None:
+            # 空白页混合水印后只取决于尺寸、底色和水印变体，第一页混合后其余相同的空白页直接引用
+            key = f"blank|{width}x{height}|{variant}|{color}"
+            count_metric(metrics, "blank_pages")
+            if dedup.place(new_page, rect, key):
+                continue
+        overlay.blend(pixels)
+        if fingerprint:
+            # 点阵在水印之上，同一文档中各页的点阵相同，不影响空白页和重复页面的复用
+            stamp_pattern_pixels(pixels, fingerprint, (width, height))
+        dedup.insert(new_page, pixels, rect, key)
+
+    return output_doc
+
+
+def _page_colorspace(page, output_format, colorspace, metrics):
+    """决定页面的渲染颜色空间并计入统计，MRC输出自身已按颜色分层，始终按RGB渲染"""
+    space = resolve_colorspace(page, colorspace) if output_format != "mrc" else COLORSPACE_RGB
+    count_page(metrics, space)
+    return space
+
+
+def _insert_page_image(dedup, page, pixels, rect):
+    """
+    插入不含栅格水印的页面图像：近乎纯色时用纯色填充，否则按内容去重后插入
+
+    返回:
+        bool: 是否用纯色填充
+    """
+    color = uniform_color(pixels)
+    if color is not None:
+        dedup.fill(page, rect, color)
+        return True
+    dedup.insert(page, pixels, rect)
+    return False
+
+
+def _write_tiled_page(output_doc, page, dpi, width, height, output_format, watermark=None, dedup=None,
+                      colorspace="rgb", jpeg_quality=None, fingerprint=None):
+    """
+    将超大页面分块渲染后写入输出文档，每块单独渲染、混合水印和编码，内存峰值只与块大小有关
+
+    参数:
+        output_doc: 输出的fitz.Document
+        page: 原始页面
+        dpi: 渲染分辨率
+        width, height: 整页的像素尺寸
+        output_format: "flat" 或 "mrc"
+        watermark: TiledWatermarkOverlay，为空时不混合水印（矢量水印已合并在页面中）
+        dedup: ImageDeduplicator，flat格式下用于图像去重和纯色填充
+        colorspace: "rgb" 或 "gray"，MRC格式始终按RGB渲染
+        jpeg_quality: MRC背景JPEG质量，默认 config.MRC_JPEG_QUALITY
+        fingerprint: 写入页面像素的泄露追踪指纹点阵，为空时不写入
+    """
+    if output_format == "mrc":
+        new_page = output_doc.new_page(width=width * 72.0 / dpi, height=height * 72.0 / dpi)
+    else:
+        new_page = output_doc.new_page(width=width, height=height)
+
+    for index, rect in enumerate(tile_rects(width, height)):
+        checkpoint()
+        pixels = render_region(page, dpi, rect, colorspace=fitz_colorspace(colorspace))
+        overlay = watermark.tile(rect) if watermark is not None else None
+        if overlay is not None:
+            overlay.blend(pixels)
+        if fingerprint:
+            stamp_pattern_pixels(pixels, fingerprint, (width, height), rect[:2])
+        if output_format == "mrc":
+            add_mrc_region(output_doc, new_page, pixels, dpi, rect, overlay, jpeg_quality=jpeg_quality,
+                           name=f"MrcFg{index}")
+        elif dedup is None:
+            insert_tile(new_page, pixels, rect)
+        elif overlay is None:
+            _insert_page_image(dedup, new_page, pixels, rect)
+        else:
+            dedup.insert(new_page, pixels, rect)
+
+
+def get_output_paths(input_pdf, output_dir, student_name):
+    """
+    计算单个文件在输出目录中的临时文件和最终文件路径
+
+    返回:
+        tuple: (水印临时文件, 安全转换临时文件, 最终输出文件)
+    """
+    base_name = os.path.basename(input_pdf)
+    name, ext = os.path.splitext(base_name)
+    temp_output = os.path.join(output_dir, f"{name}_temp{ext}")
+    secure_output = os.path.join(output_dir, f"{name}_secure{ext}")
+    final_output = os.path.join(output_dir, f"{name}_{student_name}_可用chrome打开{ext}")
+    return temp_output, secure_output, final_output
+
+
+def build_secure_document(source, watermark_text, watermark_image=None, dpi=150, stage_callback=None,
+                          output_format=None, colorspace=None, metrics=None, fingerprint=None, max_bytes=None):
+    """
+    在内存中完成 水印 -> 安全转换 两步，返回尚未加密的安全文档
+
+    各步骤之间传递的是文档对象和内存缓冲区，不写中间文件
+
+    参数:
+        source: 输入的PdfSource
+        其余参数同 process_pdf
+
+    返回:
+        fitz.Document: 未保存的安全文档，由调用方负责加密保存和关闭
+    """
+    dpi = check_dpi(dpi)
+    if max_bytes:
+        return _fit_secure_document(source, watermark_text, watermark_image, dpi, stage_callback,
+                                    output_format, colorspace, metrics, max_bytes, fingerprint)
+    return _render_secure_document(source, watermark_text, watermark_image, dpi, stage_callback,
+                                   output_format, colorspace, metrics, fingerprint=fingerprint)
+
+
+def _fit_secure_document(source, watermark_text, watermark_image, dpi, stage_callback,
+                         output_format, colorspace, metrics, max_bytes, fingerprint=None):
+    """按大小上限降低DPI和JPEG质量后完成水印和安全转换（size_target）"""
+    if watermark_image is None:
+        watermark_image = default_watermark_image()
+    output_format = output_format or config.SECURE_OUTPUT_FORMAT
+    colorspace = colorspace or config.RENDER_COLORSPACE
+    render_metrics = {}
+
+    def render_sample(doc, sample_dpi, jpeg_quality):
+        # 抽样估算始终走栅格流程，输出大小与矢量水印流程相同
+        return raster_watermark_document(doc, watermark_image, watermark_text, sample_dpi, default_cache(),
+                                         output_format, colorspace, None, jpeg_quality)
+
+    def render(final_dpi, jpeg_quality):
+        render_metrics.clear()
+        return _render_secure_document(source, watermark_text, watermark_image, final_dpi, stage_callback,
+                                       output_format, colorspace, render_metrics, jpeg_quality, fingerprint)
+
+    secure_doc, settings = fit_document(source.open_document(), hashlib.sha256(source.buffer).hexdigest(),
+                                        max_bytes, dpi, output_format, colorspace, render_sample, render)
+    if settings.dpi != dpi or settings.jpeg_quality != config.MRC_JPEG_QUALITY:
+        print(f"按大小上限 {max_bytes / 1048576:.1f} MB 使用 DPI {settings.dpi}"
+              + (f"、JPEG质量 {settings.jpeg_quality}" if output_format == "mrc" else ""))
+    if metrics is not None:
+        metrics.update(render_metrics)
+    return secure_doc
+
+
+def _render_secure_document(source, watermark_text, watermark_image, dpi, stage_callback,
+                            output_format, colorspace, metrics, jpeg_quality=None, fingerprint=None):
+    """build_secure_document 的水印和安全转换部分，指纹点阵在转换时写入页面像素"""
+    if watermark_image is None:
+        watermark_image = default_watermark_image()
+    output_format = output_format or config.SECURE_OUTPUT_FORMAT
+
+    raster_mode = config.SECURE_RENDER_MODE == "raster"
+    if raster_mode:
+        # 水印和安全转换在栅格域中一步完成，失败时退回矢量水印流程
+        if stage_callback:
+            stage_callback(0, PIPELINE_STAGES[0])
+            stage_callback(1, PIPELINE_STAGES[1])
+        raster_metrics = {}
+        try:
+            secure_doc = raster_watermark_document(source.open_document(), watermark_image, watermark_text,
+                                                   dpi, default_cache(), output_format, colorspace, raster_metrics,
+                                                   jpeg_quality, fingerprint)
+            if metrics is not None:
+                metrics.update(raster_metrics)
+            if fingerprint:
+                stamp_fingerprint(secure_doc, fingerprint)
+            return secure_doc
+        except JobAborted:
+            # 超时或取消不是转换方式的问题，不退回矢量水印流程
+            raise
+        except Exception as e:
+            print(f"栅格水印转换时出错: {str(e)}")
+
+    # 添加网格状水印，结果保存在内存中
+    if stage_callback and not raster_mode:
+        stage_callback(0, PIPELINE_STAGES[0])
+    watermarked = io.BytesIO()
+    add_multiple_watermarks(
+        input_pdf=source.reader_stream(),
+        watermark_image=watermark_image,
+        watermark_text=watermark_text,
+        output_pdf=watermarked,
+        img_scale=config.DEFAULT_IMG_SCALE,
+        img_opacity=config.DEFAULT_IMG_OPACITY,
+        font_name=config.DEFAULT_FONT_NAME,
+        font_size=24,  # 将字体调小为24（默认一般是36）
+        text_opacity=config.DEFAULT_TEXT_OPACITY,
+        angle=config.DEFAULT_ANGLE,
+        on_top=True,
+        rows=5,   # 5行
+        cols=3    # 3列
+    )
+
+    # 将带水印的PDF转换为图像格式
+    if stage_callback and not raster_mode:
+        stage_callback(1, PIPELINE_STAGES[1])
+    watermarked_doc = fitz.open(stream=watermarked.getvalue(), filetype="pdf")
+    try:
+        secure_doc = convert_document_to_secure(watermarked_doc, dpi, output_format, colorspace, metrics,
+                                                jpeg_quality, fingerprint)
+    except JobAborted:
+        watermarked_doc.close()
+        raise
+    except Exception as e:
+        # 转换失败，使用带水印的PDF作为安全输出，没有页面像素可写，点阵以矢量方格绘制
+        print(f"转换PDF到安全格式时出错: {str(e)}")
+        if fingerprint:
+            stamp_fingerprint(watermarked_doc, fingerprint, draw_pattern=True)
+        return watermarked_doc
+    watermarked_doc.close()
+    if fingerprint:
+        stamp_fingerprint(secure_doc, fingerprint)
+    return secure_doc
+
+
+def process_pdf(input_pdf, output_dir, student_name, watermark_text, watermark_image=None,
+                dpi=150, stage_callback=None, output_format=None, source=None, colorspace=None, metrics=None,
+                fingerprint=None, max_bytes=None):
+    """
+    对单个PDF执行完整的 水印 -> 安全转换 -> 密码保护 流水线
+
+    参数:
+        input_pdf: 输入PDF文件路径，同时决定输出文件名
+        output_dir: 输出目录
+        student_name: 学生姓名（用于文件名和拼音密码）
+        watermark_text: 水印文字内容
+        watermark_image: 中心水印图片路径，默认使用中文LOGO
+        dpi: 安全转换的渲染分辨率
+        stage_callback: 步骤回调 callback(步骤序号, 步骤名称)，在每一步开始前调用
+        output_format: 安全输出格式 "flat" 或 "mrc"，默认使用 config.SECURE_OUTPUT_FORMAT
+        source: 已加载的PdfSource（例如上传的内容），为空时映射input_pdf；
+                传入的source由本函数释放一次
+        colorspace: 渲染颜色空间 "auto" / "rgb" / "gray"，默认使用 config.RENDER_COLORSPACE
+        metrics: 统计字典，处理后包含灰度和RGB页数（gray_pages / rgb_pages）
+        fingerprint: 嵌入输出的泄露追踪指纹（fingerprint.new_fingerprint），为空时不嵌入
+        max_bytes: 输出文件大小上限（字节），设置后自动降低DPI和JPEG质量（size_target），为空时不限制
+
+    返回:
+        tuple: (最终输出文件路径, 是否成功添加密码, 使用的密码)
+    """
+    final_output = get_output_paths(input_pdf, output_dir, student_name)[2]
+    source = source or PdfSource(input_pdf)
+    try:
+        secure_doc = build_secure_document(source, watermark_text, watermark_image, dpi,
+                                           stage_callback, output_format, colorspace, metrics, fingerprint,
+                                           max_bytes)
+    finally:
+        # 之后的步骤不再读取输入，尽早解除映射
+        source.release()
+
+    # 为安全转换后的PDF添加密码保护
+    if stage_callback:
+        stage_callback(2, PIPELINE_STAGES[2])
+    password = get_student_password(student_name)
+    success = save_document_with_password(secure_doc, final_output, password)
+    secure_doc.close()
+
+    return final_output, success, password
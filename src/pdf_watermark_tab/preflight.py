@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+批处理预估模块，开始处理前快速估算一批PDF的耗时、内存、临时磁盘和输出大小
+
+只解析页面树和抽样页的图片位置，不渲染：
+- 耗时：按页数和栅格化后的像素数，使用历史吞吐量（scheduler.ThroughputStats，每次处理后更新）估算，
+  再按内存预算允许的进程数折算为整批的墙钟时间
+- 内存：每个文件的峰值与 memory_governor 的估算相同，整批峰值为同时处理的几个文件之和
+- 输出和临时磁盘：按每像素压缩后的字节数估算，图片占页面比例越高压缩率越低；
+  临时磁盘包括页面栅格缓存（不超过 config.RASTER_CACHE_MAX_MB）和正在写出的 .part 文件
+"""
+
+import os
+import shutil
+
+import fitz  # PyMuPDF
+
+from src.pdf_watermark_tab.scheduler import ThroughputStats, inspect_pdf
+from src.pdf_watermark_tab.memory_governor import MemoryGovernor, available_memory, estimate_job_memory
+from src.pdf_watermark_tab.size_target import sample_pages
+import config
+
+
+# 输出中每个渲染像素压缩后的字节数 (纯文字页面, 整页图片)，按实测值
+_OUTPUT_BYTES_PER_PIXEL = {"flat": (0.10, 1.5), "mrc": (0.012, 0.06)}
+# 页面栅格缓存以快速压缩保存整页像素，比输出略大
+_CACHE_BYTES_PER_PIXEL = (0.12, 1.8)
+
+
+def image_coverage(path, sample_count=None):
+    """
+    抽样页面中图片覆盖的面积比例
+
+    参数:
+        path: PDF路径
+        sample_count: 抽取的页数，默认 config.PREFLIGHT_SAMPLE_PAGES
+
+    返回:
+        float: 0（纯文字）~ 1（整页图片），无法读取时返回0
+    """
+    try:
+        with fitz.open(path) as doc:
+            covered = 0.0
+            total = 0.0
+            for index in sample_pages(len(doc), sample_count or config.PREFLIGHT_SAMPLE_PAGES):
+                page = doc[index]
+                area = page.rect.width * page.rect.height
+                images = 0.0
+                for info in page.get_image_info():
+                    rect = fitz.Rect(info["bbox"]) & page.rect
+                    if not rect.is_empty:
+                        images += rect.width * rect.height
+                covered += min(images, area)
+                total += area
+            return covered / total if total > 0 else 0.0
+    except Exception as e:
+        print(f"读取图片信息时出错 {path}: {str(e)}")
+        return 0.0
+
+
+def _bytes_per_pixel(rates, coverage):
+    text, image = rates
+    return text + (image - text) * coverage
+
+
+class PreflightFile:
+    """
+    单个文件的预估结果
+
+    属性:
+        path: 文件路径
+        pages: 页数
+        megapixels: 按渲染分辨率栅格化后的总像素数（百万）
+        image_coverage: 图片占页面面积的比例
+        seconds: 预计处理耗时
+        peak_memory: 工作进程的内存峰值（字节）
+        temp_disk: 临时磁盘占用（页面栅格缓存和 .part 文件，字节）
+        output_size: 预计输出大小（字节）
+        error: 无法读取时的原因
+    """
+
+    def __init__(self, path, pages=0, megapixels=0.0, image_coverage=0.0, seconds=0.0, peak_memory=0,
+                 temp_disk=0, output_size=0, error=""):
+        self.path = path
+        self.pages = pages
+        self.megapixels = megapixels
+        self.image_coverage = image_coverage
+        self.seconds = seconds
+        self.peak_memory = peak_memory
+        self.temp_disk = temp_disk
+        self.output_size = output_size
+        self.error = error
+
+    def to_dict(self):
+        return {
+            "path": self.path,
+            "pages": self.pages,
+            "megapixels": round(self.megapixels, 1),
+            "image_coverage": round(self.image_coverage, 3),
+            "seconds": round(self.seconds, 1),
+            "peak_memory_bytes": self.peak_memory,
+            "temp_disk_bytes": self.temp_disk,
+            "output_bytes": self.output_size,
+            "error": self.error,
+        }
+
+
+class PreflightReport:
+    """
+    整批的预估结果
+
+    属性:
+        files: PreflightFile列表（与输入顺序相同）
+        workers: 内存预算允许的同时处理文件数
+        seconds: 预计整批耗时（墙钟时间）
+        peak_memory: 整批的内存峰值（字节）
+        available_memory: 当前可用内存（字节），无法获取时为None
+        temp_disk: 整批的临时磁盘占用（字节）
+        output_size: 整批的输出大小（字节）
+        free_disk: 输出目录所在磁盘的剩余空间（字节），没有指定输出目录时为None
+        warnings: 内存或磁盘不足等提示
+    """
+
+    def __init__(self, files, workers, seconds, peak_memory, available_memory, temp_disk, output_size,
+                 free_disk=None, warnings=None):
+        self.files = files
+        self.workers = workers
+        self.seconds = seconds
+        self.peak_memory = peak_memory
+        self.available_memory = available_memory
+        self.temp_disk = temp_disk
+        self.output_size = output_size
+        self.free_disk = free_disk
+        self.warnings = warnings or []
+
+    def to_dict(self):
+        return {
+            "files": [item.to_dict() for item in self.files],
+            "total": {
+                "files": len(self.files),
+                "pages": sum(item.pages for item in self.files),
+                "workers": self.workers,
+                "seconds": round(self.seconds, 1),
+                "peak_memory_bytes": self.peak_memory,
+                "available_memory_bytes": self.available_memory,
+                "temp_disk_bytes": self.temp_disk,
+                "output_bytes": self.output_size,
+                "free_disk_bytes": self.free_disk,
+            },
+            "warnings": self.warnings,
+        }
+
+    def describe(self):
+        """用于界面显示的多行摘要"""
+        pages = sum(item.pages for item in self.files)
+        lines = [
+            f"共 {len(self.files)} 个文件，{pages} 页，同时处理 {self.workers} 个",
+            f"预计耗时: {format_seconds(self.seconds)}",
+            f"内存峰值: {format_bytes(self.peak_memory)}"
+            + (f"（当前可用 {format_bytes(self.available_memory)}）" if self.available_memory else ""),
+            f"临时磁盘: {format_bytes(self.temp_disk)}",
+            f"输出大小: {format_bytes(self.output_size)}"
+            + (f"（输出目录剩余 {format_bytes(self.free_disk)}）" if self.free_disk is not None else ""),
+        ]
+        lines.extend(f"注意: {warning}" for warning in self.warnings)
+        return "\n".join(lines)
+
+
+def format_bytes(size):
+    """例如 "12.3 MB" """
+    size = float(size or 0)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def format_seconds(seconds):
+    """例如 "1小时05分"、"3分20秒"、"12秒" """
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}小时{minutes:02d}分"
+    if minutes:
+        return f"{minutes}分{seconds:02d}秒"
+    return f"{seconds}秒"
+
+
+def _free_disk(path):
+    """path所在磁盘的剩余空间，path不存在时向上查找已存在的目录"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+
+def preflight(paths, dpi=150, output_format=None, output_dir=None, max_workers=None, stats=None,
+              max_bytes=None):
+    """
+    预估一批PDF的处理耗时、内存、临时磁盘和输出大小
+
+    参数:
+        paths: PDF路径列表
+        dpi: 安全转换的渲染分辨率
+        output_format: "flat" 或 "mrc"，默认使用 config.SECURE_OUTPUT_FORMAT
+        output_dir: 输出目录，提供时检查剩余磁盘空间
+        max_workers: 进程数上限，默认与CPU核心数一致
+        stats: ThroughputStats，为空时读取保存的统计
+        max_bytes: 输出文件大小上限（字节），设置时每个文件的输出不超过该值
+
+    返回:
+        PreflightReport
+    """
+    output_format = output_format or config.SECURE_OUTPUT_FORMAT
+    stats = stats or ThroughputStats()
+    max_workers = max_workers or os.cpu_count() or 1
+    # MRC的文字层以更高分辨率渲染
+    render_dpi = max(dpi, config.MRC_MASK_DPI) if output_format == "mrc" else dpi
+    cache_enabled = config.RASTER_CACHE_MAX_MB > 0
+
+    files = []
+    for path in paths:
+        job = inspect_pdf(path, render_dpi)
+        if job.pages <= 0:
+            files.append(PreflightFile(path, error="无法读取"))
+            continue
+        coverage = image_coverage(path)
+        pixels = job.megapixels * 1e6
+        output_size = int(pixels * _bytes_per_pixel(_OUTPUT_BYTES_PER_PIXEL[output_format], coverage))
+        if max_bytes:
+            output_size = min(output_size, max_bytes)
+        cache_size = int(pixels * _bytes_per_pixel(_CACHE_BYTES_PER_PIXEL, coverage)) if cache_enabled else 0
+        files.append(PreflightFile(path, job.pages, job.megapixels, coverage, stats.predict(job),
+                                   estimate_job_memory(job, output_format), cache_size + output_size,
+                                   output_size))
+
+    readable = [item for item in files if not item.error]
+    estimates = [item.peak_memory for item in readable]
+    governor = MemoryGovernor()
+    workers = max(1, min(governor.worker_limit(estimates, max_workers), len(readable) or 1))
+
+    # 最长的文件决定下限，其余按进程数平分
+    total_seconds = sum(item.seconds for item in readable)
+    seconds = max(total_seconds / workers, max((item.seconds for item in readable), default=0.0))
+
+    # 同时处理最大的几个文件时的峰值，内存预算会限制同时处理的文件数
+    largest = sorted(estimates, reverse=True)
+    peak_memory = sum(largest[:workers])
+    if governor.budget_bytes is not None and largest:
+        peak_memory = max(largest[0], min(peak_memory, int(governor.budget_bytes)))
+
+    output_size = sum(item.output_size for item in readable)
+    cache_total = sum(item.temp_disk - item.output_size for item in readable)
+    cache_total = min(cache_total, config.RASTER_CACHE_MAX_MB * 1024 * 1024)
+    # 写出线程逐个写 .part 文件再重命名
+    temp_disk = cache_total + max((item.output_size for item in readable), default=0)
+
+    available = available_memory()
+    warnings = []
+    unreadable = len(files) - len(readable)
+    if unreadable:
+        warnings.append(f"{unreadable} 个文件无法读取")
+    if available is not None and largest and largest[0] > available:
+        warnings.append(f"最大的文件预计需要 {format_bytes(largest[0])} 内存，超过当前可用内存")
+    free_disk = _free_disk(output_dir) if output_dir else None
+    if free_disk is not None and output_size + temp_disk > free_disk:
+        warnings.append(f"输出目录所在磁盘剩余 {format_bytes(free_disk)}，不足以保存输出和临时文件")
+    if cache_total:
+        cache_free = _free_disk(config.USER_DATA_DIR)
+        if cache_free is not None and cache_total > cache_free:
+            warnings.append(f"用户数据目录所在磁盘剩余 {format_bytes(cache_free)}，不足以保存页面栅格缓存")
+
+    return PreflightReport(files, workers, seconds, peak_memory, available, temp_disk, output_size,
+                           free_disk, warnings)
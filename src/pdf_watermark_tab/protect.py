@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+不依赖Qt的库接口，在内存中完成 水印 -> 安全转换 -> 密码保护 整个流程
+
+输入是PDF内容（bytes或可读的文件对象），输出是加密后的PDF内容或直接写入的文件对象，
+全程不读写临时文件，也不导入任何GUI模块，供服务、脚本和其他程序嵌入使用:
+
+    from src.pdf_watermark_tab.protect import ProtectOptions, protect_pdf
+
+    options = ProtectOptions("张三")
+    secured = protect_pdf(pdf_bytes, options)
+"""
+
+import io
+from datetime import datetime
+
+from src.pdf_watermark_tab.loader import PdfSource
+from src.pdf_watermark_tab.pipeline import build_secure_document, check_dpi, PIPELINE_STAGES
+from src.pdf_watermark_tab.pdf_password import encrypt_pdf_document, get_student_password, write_encrypted_document
+from src.pdf_watermark_tab.watermark_core import build_watermark_text
+
+
+class ProtectOptions:
+    """
+    一次保护处理的参数
+
+    参数:
+        student_name: 学生姓名（用于水印和拼音密码）
+        watermark_text: 水印文字内容，默认按学生姓名和当前时间生成
+        watermark_image: 中心水印图片路径，默认使用中文LOGO
+        dpi: 安全转换的渲染分辨率，必须在1到 config.SECURE_MAX_DPI 之间（否则抛出 ValueError）
+        output_format: 安全输出格式 "flat" 或 "mrc"，默认使用 config.SECURE_OUTPUT_FORMAT
+        colorspace: 渲染颜色空间 "auto" / "rgb" / "gray"，默认使用 config.RENDER_COLORSPACE
+        password: 打开密码，默认使用学生姓名的拼音
+        fingerprint: 嵌入输出的泄露追踪指纹（fingerprint.new_fingerprint），为空时不嵌入
+        max_bytes: 输出文件大小上限（字节），设置后自动降低DPI和JPEG质量，为空时不限制
+    """
+
+    def __init__(self, student_name, watermark_text=None, watermark_image=None, dpi=150,
+                 output_format=None, colorspace=None, password=None, fingerprint=None, max_bytes=None):
+        self.student_name = student_name
+        self.watermark_text = watermark_text or build_watermark_text(
+            student_name, datetime.now().strftime("%Y-%m-%d %H:%M"))
+        self.watermark_image = watermark_image
+        self.dpi = check_dpi(dpi)
+        self.output_format = output_format
+        self.colorspace = colorspace
+        self.password = password or get_student_password(student_name)
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+
+
+def _as_source(data):
+    """把bytes、memoryview、文件对象或PdfSource统一为PdfSource，尽量不复制内容"""
+    if isinstance(data, PdfSource):
+        return data
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return PdfSource(data=data)
+    if isinstance(data, io.BytesIO):
+        # getbuffer 直接引用BytesIO的内部缓冲区，不复制
+        return PdfSource(data=data.getbuffer())
+    if hasattr(data, "read"):
+        return PdfSource(data=data.read())
+    raise TypeError(f"不支持的输入类型: {type(data).__name__}")
+
+
+def _secure_document(data, options, stage_callback, metrics):
+    """完成水印和安全转换，返回未加密的文档；传入的PdfSource由本函数释放一次"""
+    source = _as_source(data)
+    try:
+        return build_secure_document(source, options.watermark_text, options.watermark_image, options.dpi,
+                                     stage_callback, options.output_format, options.colorspace, metrics,
+                                     options.fingerprint, options.max_bytes)
+    finally:
+        source.release()
+
+
+def protect_pdf(data, options, stage_callback=None, metrics=None):
+    """
+    对PDF内容执行完整的保护流程
+
+    参数:
+        data: PDF内容，bytes / memoryview / 可读的文件对象 / PdfSource
+        options: ProtectOptions
+        stage_callback: 步骤回调 callback(步骤序号, 步骤名称)，在每一步开始前调用
+        metrics: 统计字典，处理后包含灰度和RGB页数等渲染统计
+
+    返回:
+        bytes: 加密后的PDF内容，密码为 options.password
+    """
+    secure_doc = _secure_document(data, options, stage_callback, metrics)
+    try:
+        if stage_callback:
+            stage_callback(2, PIPELINE_STAGES[2])
+        return encrypt_pdf_document(secure_doc, options.password)
+    finally:
+        secure_doc.close()
+
+
+def protect_pdf_to(data, output, options, stage_callback=None, metrics=None):
+    """
+    与 protect_pdf 相同，但把加密后的PDF直接写入可写的文件对象，
+    不在内存中保留完整的输出内容（例如写入HTTP响应或网络文件）
+
+    参数:
+        output: 可写的二进制文件对象
+        其余参数同 protect_pdf
+    """
+    secure_doc = _secure_document(data, options, stage_callback, metrics)
+    try:
+        if stage_callback:
+            stage_callback(2, PIPELINE_STAGES[2])
+        write_encrypted_document(secure_doc, output, options.password)
+    finally:
+        secure_doc.close()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+页面栅格缓存模块，跨文档、跨批次复用相同页面的渲染结果
+
+课程资料中封面、课程大纲、附录等页面在很多PDF里完全相同。缓存的键由页面内容流、
+引用的全部资源（字体、图片等，按内容而不是对象编号计算）、页面尺寸、旋转和DPI共同决定，
+所以同一页出现在不同文件中也只渲染一次。缓存保存在磁盘上，超过容量时按最近使用时间淘汰，
+超过 config.RASTER_CACHE_MAX_AGE_DAYS 没有使用的页面同样删除。
+
+缓存中是不含水印的原始页面，不能以明文留在磁盘上。每一项用页面内容哈希派生的密钥加密，
+文件名由同一哈希的另一个派生值决定：只有拿着原始PDF才能算出密钥读取对应的页面，
+而拿着原始PDF的人本来就有干净的副本，单独拷走缓存目录得不到任何页面
+"""
+
+import os
+import re
+import zlib
+import struct
+import time
+import hashlib
+import tempfile
+import threading
+
+import fitz  # PyMuPDF
+import numpy as np
+
+import config
+
+
+# 缓存文件头：宽、高、通道数（与压缩后的像素一起加密）
+_HEADER = struct.Struct("<III")
+_CACHE_SUFFIX = ".raster2"
+# 早期版本以明文保存的缓存文件，打开缓存时删除
+_PLAIN_SUFFIX = ".raster"
+# 常驻服务中同一个缓存实例一直使用，写入时至少每隔这么久（秒）清理一次过期的页面
+_EXPIRY_SWEEP_SECONDS = 3600
+# 间接引用 "编号 代数 R"，代数不一定为0
+_REF_PATTERN = re.compile(rb"(\d+)\s+\d+\s+R(?![A-Za-z])")
+
+
+class _PageHasher:
+    """
+    计算页面内容哈希，同一文档内共享的资源（字体、LOGO图片等）只计算一次
+
+    资源之间的引用替换为被引用对象的哈希，因此与对象编号无关，
+    不同PDF中内容相同的页面得到相同的哈希
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._memo = {}
+
+    def _object_hash(self, xref):
+        if xref in self._memo:
+            return self._memo[xref]
+        self._memo[xref] = b"cycle"  # 防止循环引用导致无限递归
+
+        doc = self.doc
+        h = hashlib.sha1()
+        obj_type = doc.xref_get_key(xref, "Type")
+        if obj_type[1] in ("/Page", "/Pages"):
+            # 注释等对象会引用所在页面，页面本身不属于资源
+            h.update(b"page")
+        else:
+            source = doc.xref_object(xref, compressed=True).encode("latin-1", "replace")
+            h.update(_REF_PATTERN.sub(lambda m: self._object_hash(int(m.group(1))), source))
+            if doc.xref_is_stream(xref):
+                h.update(doc.xref_stream_raw(xref) or b"")
+
+        digest = h.hexdigest().encode("ascii")
+        self._memo[xref] = digest
+        return digest
+
+    def _inline_hash(self, text):
+        """哈希直接写在页面字典中的值，其中的引用同样替换为内容哈希"""
+        source = text.encode("latin-1", "replace")
+        return _REF_PATTERN.sub(lambda m: self._object_hash(int(m.group(1))), source)
+
+    def _page_key_value(self, page, key):
+        """读取页面字典中的键，页面上没有时沿页面树向上查找（Resources可以继承）"""
+        doc = self.doc
+        xref = page.xref
+        while xref:
+            kind, value = doc.xref_get_key(xref, key)
+            if kind != "null":
+                return kind, value
+            parent = doc.xref_get_key(xref, "Parent")
+            xref = int(parent[1].split()[0]) if parent[0] == "xref" else 0
+        return "null", "null"
+
+    def page_hash(self, page, dpi):
+        h = hashlib.sha1()
+        h.update(f"{tuple(page.rect)}|{page.rotation}|{dpi}".encode("ascii"))
+        h.update(page.read_contents())
+        for key in ("Resources", "Annots"):
+            kind, value = self._page_key_value(page, key)
+            h.update(key.encode("ascii"))
+            h.update(self._inline_hash(value))
+        return h.hexdigest()
+
+
+def _keystream_xor(data, secret):
+    """与由secret展开的密钥流逐字节异或（加密和解密相同）"""
+    stream = hashlib.shake_256(secret).digest(len(data))
+    return (np.frombuffer(data, dtype=np.uint8) ^ np.frombuffer(stream, dtype=np.uint8)).tobytes()
+
+
+def _entry_name_and_secret(key):
+    """由页面哈希派生缓存文件名和加密密钥，文件名无法反推出密钥"""
+    key = key.encode("ascii")
+    return hashlib.sha256(b"name|" + key).hexdigest(), hashlib.sha256(b"secret|" + key).digest()
+
+
+class PageRasterCache:
+    """
+    磁盘上的页面栅格缓存（按最近使用时间淘汰，每一项按页面内容加密）
+
+    多个进程可以共用同一个缓存目录：写入时先写临时文件再原子替换，
+    读取命中时更新文件修改时间作为最近使用时间
+
+    参数:
+        cache_dir: 缓存目录，默认为 config.USER_DATA_DIR 下的 config.RASTER_CACHE_DIR
+        max_bytes: 缓存容量上限（字节）
+        max_age_days: 多少天没有使用的页面被删除，默认 config.RASTER_CACHE_MAX_AGE_DAYS，0表示不限制
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_age_days=None):
+        self.cache_dir = cache_dir or os.path.join(config.USER_DATA_DIR, config.RASTER_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else config.RASTER_CACHE_MAX_MB * 1024 * 1024
+        self.max_age_days = config.RASTER_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._remove_expired()
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _expiry_cutoff(self):
+        """最近使用时间早于此时刻的页面已过期，不限制保留天数时返回None"""
+        return time.time() - self.max_age_days * 86400 if self.max_age_days > 0 else None
+
+    def _remove_expired(self):
+        """删除早期版本的明文缓存和超过保留天数没有使用的页面"""
+        self._next_sweep = time.monotonic() + _EXPIRY_SWEEP_SECONDS
+        cutoff = self._expiry_cutoff()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if name.endswith(_PLAIN_SUFFIX) or (
+                        cutoff is not None and name.endswith(_CACHE_SUFFIX) and os.stat(path).st_mtime < cutoff):
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _entries(self):
+        """列出缓存文件 (路径, 大小, 最近使用时间)"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(_CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name + _CACHE_SUFFIX)
+
+    def get(self, key):
+        """
+        读取缓存的页面图像
+
+        返回:
+            numpy.ndarray: 形状为 (H, W, N) 的uint8数组，未命中时返回None
+        """
+        name, secret = _entry_name_and_secret(key)
+        path = self._path(name)
+        try:
+            with open(path, "rb") as f:
+                cutoff = self._expiry_cutoff()
+                if cutoff is not None and os.fstat(f.fileno()).st_mtime < cutoff:
+                    # 尚未清理的过期页面不再使用，也不因命中而延长保留时间
+                    raise ValueError("expired")
+                data = _keystream_xor(f.read(), secret)
+            width, height, channels = _HEADER.unpack_from(data)
+            pixels = np.frombuffer(zlib.decompress(data[_HEADER.size:]), dtype=np.uint8)
+            pixels = pixels.reshape(height, width, channels).copy()
+        except (OSError, ValueError, struct.error, zlib.error):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return pixels
+
+    def put(self, key, pixels):
+        """写入页面图像，超过容量时淘汰最久未使用的页面，并定期清理过期的页面"""
+        height, width, channels = pixels.shape
+        # 压缩级别1：速度接近直接写入，空白较多的讲义页面能压缩到原来的几分之一
+        data = _HEADER.pack(width, height, channels) + zlib.compress(pixels.tobytes(), 1)
+        name, secret = _entry_name_and_secret(key)
+        data = _keystream_xor(data, secret)
+        path = self._path(name)
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"写入页面缓存时出错: {str(e)}")
+            return
+
+        with self._lock:
+            self._total_bytes += len(data)
+            if self._total_bytes > self.max_bytes or time.monotonic() >= self._next_sweep:
+                self._evict()
+
+    def _evict(self):
+        """删除过期的页面；仍超过容量时按最近使用时间从旧到新删除，直到降到容量的90%"""
+        self._remove_expired()
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * 0.9
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+        self._total_bytes = total
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            for path, _, _ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._total_bytes = 0
+
+
+def render_page_cached(page, dpi, cache=None, hasher=None, colorspace="rgb"):
+    """
+    渲染页面为RGB或灰度图像，相同内容的页面直接从缓存读取
+
+    参数:
+        page: fitz.Page
+        dpi: 渲染分辨率
+        cache: PageRasterCache，为空时不使用缓存
+        hasher: 同一文档的 _PageHasher，批量渲染时复用以避免重复计算共享资源
+        colorspace: "rgb" 或 "gray"
+
+    返回:
+        numpy.ndarray: 形状为 (H, W, 3) 或灰度 (H, W, 1) 的uint8数组，可直接修改
+    """
+    key = None
+    if cache is not None:
+        try:
+            key = (hasher or _PageHasher(page.parent)).page_hash(page, dpi)
+            if colorspace == "gray":
+                key += "-gray"
+            pixels = cache.get(key)
+            if pixels is not None:
+                return pixels
+        except Exception as e:
+            # 结构异常的PDF无法计算哈希时直接渲染
+            print(f"计算页面哈希时出错: {str(e)}")
+            key = None
+
+    zoom = dpi / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom),
+                          colorspace=fitz.csGRAY if colorspace == "gray" else fitz.csRGB, alpha=False)
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n).copy()
+    if key is not None:
+        cache.put(key, pixels)
+    return pixels
+
+
+def page_hasher(doc):
+    """为文档创建页面哈希计算器，配合 render_page_cached 使用"""
+    return _PageHasher(doc)
+
+
+_default_cache = None
+
+
+def default_cache():
+    """返回本进程共用的缓存实例，config.RASTER_CACHE_MAX_MB 为0时不使用缓存"""
+    global _default_cache
+    if config.RASTER_CACHE_MAX_MB <= 0:
+        return None
+    if _default_cache is None:
+        try:
+            _default_cache = PageRasterCache()
+        except OSError as e:
+            print(f"无法创建页面缓存目录: {str(e)}")
+            return None
+    return _default_cache
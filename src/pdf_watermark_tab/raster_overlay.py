@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+栅格水印图层模块，将与PDF水印相同的LOGO和文字预渲染为RGBA图层，
+并使用NumPy对整批图像/视频帧做向量化alpha混合
+"""
+
+import io
+import zlib
+import random
+import threading
+from collections import OrderedDict
+
+import fitz  # PyMuPDF
+import numpy as np
+from reportlab.pdfgen import canvas
+
+from src.pdf_watermark_tab.watermark_core import _draw_watermark_page
+from src.pdf_watermark_tab.tiling import render_region
+import config
+
+
+# 按 (宽, 高, DPI, 水印文字, 水印图片, 变体) 缓存的水印图层
+_OVERLAY_CACHE_SIZE = 8
+_overlay_cache = OrderedDict()
+_overlay_lock = threading.Lock()
+
+
+def _watermark_page_pdf(width, height, watermark_image, watermark_text, dpi, img_scale, img_opacity,
+                        font_name, font_size, text_opacity, angle, rows, cols, add_horizontal, seed):
+    """在内存中绘制一页只含水印的PDF，页面尺寸按DPI由像素尺寸换算"""
+    # 按DPI将像素尺寸换算为PDF页面尺寸，使水印比例与PDF路径一致
+    page_width = width * 72.0 / dpi
+    page_height = height * 72.0 / dpi
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=(page_width, page_height))
+    random_state = random.getstate()
+    if seed is not None:
+        random.seed(seed)
+    try:
+        _draw_watermark_page(c, watermark_image, watermark_text, page_width, page_height,
+                             img_scale, img_opacity, font_name, font_size, text_opacity,
+                             angle, rows, cols, add_horizontal)
+    finally:
+        if seed is not None:
+            random.setstate(random_state)
+    c.save()
+    return buffer.getvalue()
+
+
+def render_watermark_overlay(width, height, watermark_image, watermark_text, dpi=150,
+                             img_scale=config.DEFAULT_IMG_SCALE, img_opacity=config.DEFAULT_IMG_OPACITY,
+                             font_name=config.DEFAULT_FONT_NAME, font_size=24,
+                             text_opacity=config.DEFAULT_TEXT_OPACITY, angle=config.DEFAULT_ANGLE,
+                             rows=5, cols=3, add_horizontal=True, seed=None):
+    """
+    将水印渲染为指定像素尺寸的RGBA图层
+
+    参数:
+        width: 图层宽度（像素）
+        height: 图层高度（像素）
+        watermark_image: 中心水印图片路径
+        watermark_text: 水印文字内容
+        dpi: 像素与PDF点的换算分辨率，与安全水印的渲染DPI保持一致
+        seed: 随机位置（英文LOGO、水平文字）的种子，相同种子在不同进程中生成完全相同的图层
+        其余参数同 add_multiple_watermarks
+
+    返回:
+        numpy.ndarray: 形状为 (height, width, 4) 的uint8数组，RGB已按alpha预乘
+    """
+    pdf_bytes = _watermark_page_pdf(width, height, watermark_image, watermark_text, dpi, img_scale,
+                                    img_opacity, font_name, font_size, text_opacity, angle, rows, cols,
+                                    add_horizontal, seed)
+
+    # 以透明背景栅格化，MuPDF输出的带alpha像素为预乘格式
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    zoom = dpi / 72
+    pix = doc[0].get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=True)
+    samples = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    doc.close()
+
+    # 舍入可能导致差一个像素，裁剪或补齐到精确尺寸
+    overlay = np.zeros((height, width, 4), dtype=np.uint8)
+    h = min(height, pix.height)
+    w = min(width, pix.width)
+    overlay[:h, :w] = samples[:h, :w]
+    return overlay
+
+
+def _overlay_seed(width, height, watermark_text, variant):
+    """图层随机位置的种子，同一尺寸、同一变体在任何进程中都得到相同的位置"""
+    seed_text = f"{watermark_text}|{width}x{height}" + (f"|{variant}" if variant else "")
+    return zlib.crc32(seed_text.encode("utf-8"))
+
+
+class WatermarkOverlay:
+    """
+    预计算好的水印图层，可对一批RGB图像做原地alpha混合
+
+    只计算图层中alpha不为0的像素（文字水印通常只覆盖画面的一小部分），
+    混合使用uint16整数运算，避免浮点开销
+    """
+
+    def __init__(self, rgba):
+        self.height, self.width = rgba.shape[:2]
+        alpha = rgba[..., 3].reshape(-1)
+
+        # 记录所有需要混合的像素下标，完全透明的像素不参与计算
+        self.indices = np.flatnonzero(alpha)
+
+        # 预乘颜色和反向alpha，混合公式: out = premul + frame * (255 - a) / 255
+        self.premul = rgba[..., :3].reshape(-1, 3)[self.indices].astype(np.uint16)
+        self.inv_alpha = (255 - alpha[self.indices]).astype(np.uint16)[:, None]
+        self._premul_gray = None
+
+    @property
+    def premul_gray(self):
+        """预乘颜色的亮度，用于混合到灰度图像上（首次使用时计算）"""
+        if self._premul_gray is None:
+            premul = self.premul.astype(np.uint32)
+            gray = (77 * premul[:, 0] + 150 * premul[:, 1] + 29 * premul[:, 2]) >> 8
+            self._premul_gray = gray.astype(np.uint16)[:, None]
+        return self._premul_gray
+
+    def blend(self, frames):
+        """
+        将水印原地混合到图像上
+
+        参数:
+            frames: 形状为 (N, H, W, 3) 或 (H, W, 3) 的C连续uint8数组，会被原地修改；
+                    灰度图像的形状为 (H, W, 1)
+
+        返回:
+            numpy.ndarray: 混合后的frames（与输入为同一数组）
+        """
+        if self.indices.size == 0:
+            return frames
+
+        channels = frames.shape[-1]
+        pixels = frames.reshape(-1, self.height * self.width, channels)
+
+        # 取出需要混合的像素，运算结果为uint16
+        work = pixels[:, self.indices] * self.inv_alpha
+
+        # 整数近似 x / 255: (t + (t >> 8)) >> 8，其中 t = x + 128
+        work += 128
+        work += work >> 8
+        work >>= 8
+        work += self.premul if channels == 3 else self.premul_gray
+
+        pixels[:, self.indices] = work
+        return frames
+
+
+def get_cached_overlay(width, height, dpi, watermark_image, watermark_text, variant=0):
+    """
+    获取指定分辨率的水印图层，相同分辨率只渲染一次
+
+    PyMuPDF不是线程安全的，渲染在锁内进行；缓存按最近使用顺序淘汰
+
+    参数:
+        variant: 随机位置的变体编号，不同变体的英文LOGO和水平文字位置不同
+
+    返回:
+        WatermarkOverlay: 水印图层
+    """
+    key = (width, height, dpi, watermark_text, watermark_image, variant)
+    with _overlay_lock:
+        overlay = _overlay_cache.get(key)
+        if overlay is not None:
+            _overlay_cache.move_to_end(key)
+            return overlay
+
+        seed = _overlay_seed(width, height, watermark_text, variant)
+        rgba = render_watermark_overlay(width, height, watermark_image, watermark_text, dpi=dpi, seed=seed)
+        overlay = WatermarkOverlay(rgba)
+        _overlay_cache[key] = overlay
+        if len(_overlay_cache) > _OVERLAY_CACHE_SIZE:
+            _overlay_cache.popitem(last=False)
+        return overlay
+
+
+class TiledWatermarkOverlay:
+    """
+    超大页面的水印图层：不渲染整页图层，只在需要时渲染与页面某一块对应的部分
+
+    水印的位置和外观与相同尺寸、相同变体的 get_cached_overlay 完全一致
+
+    参数:
+        width, height: 整页的像素尺寸
+        dpi: 像素与PDF点的换算分辨率
+        watermark_image: 中心水印图片路径
+        watermark_text: 水印文字内容
+        variant: 随机位置的变体编号
+    """
+
+    def __init__(self, width, height, dpi, watermark_image, watermark_text, variant=0):
+        self.width = width
+        self.height = height
+        self.dpi = dpi
+        seed = _overlay_seed(width, height, watermark_text, variant)
+        pdf_bytes = _watermark_page_pdf(width, height, watermark_image, watermark_text, dpi,
+                                        config.DEFAULT_IMG_SCALE, config.DEFAULT_IMG_OPACITY,
+                                        config.DEFAULT_FONT_NAME, 24, config.DEFAULT_TEXT_OPACITY,
+                                        config.DEFAULT_ANGLE, 5, 3, True, seed)
+        self._doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+
+    def tile(self, rect):
+        """
+        渲染一块区域的水印图层
+
+        参数:
+            rect: (x0, y0, x1, y1) 整页中的像素坐标
+
+        返回:
+            WatermarkOverlay: 尺寸与该区域相同的图层
+        """
+        return WatermarkOverlay(render_region(self._doc[0], self.dpi, rect, alpha=True))
+
+    def close(self):
+        self._doc.close()
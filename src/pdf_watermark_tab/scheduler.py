@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+批量任务调度模块，根据页数、页面面积和DPI估算每个文件的处理耗时
+
+估算用的各步骤吞吐量会在每次处理后更新并保存，越用越准。调度器据此排序
+（小文件优先让进度尽快推进，大文件优先让多进程更均衡），并给出实时的剩余时间和页/秒
+"""
+
+import os
+import json
+import time
+import threading
+
+import fitz  # PyMuPDF
+
+import config
+
+
+# 排序策略
+STRATEGY_SHORTEST_FIRST = "shortest"   # 小文件优先，单线程批处理时平均等待最短
+STRATEGY_LONGEST_FIRST = "longest"     # 大文件优先，多进程并行时负载更均衡
+STRATEGY_LIST_ORDER = "list"           # 保持列表顺序
+
+STRATEGY_NAMES = {
+    STRATEGY_SHORTEST_FIRST: "小文件优先",
+    STRATEGY_LONGEST_FIRST: "大文件优先",
+    STRATEGY_LIST_ORDER: "列表顺序",
+}
+
+# 没有历史数据时使用的初始吞吐量（秒/页、秒/百万像素）
+# raster模式下水印和安全转换在一次渲染中完成，两步合计记为 raster_per_mpx，不影响vector模式的两项
+_DEFAULT_RATES = {
+    "watermark_per_page": 0.03,
+    "secure_per_mpx": 0.08,
+    "raster_per_mpx": 0.06,
+    "password_per_mpx": 0.02,
+}
+# 新测量值在滑动平均中的权重
+_EMA_WEIGHT = 0.3
+
+
+class PdfJob:
+    """
+    一个待处理的PDF及其估算数据
+
+    属性:
+        path: 文件路径
+        pages: 页数
+        area: 所有页面面积之和（平方点）
+        max_page_area: 最大一页的面积（平方点），决定渲染单页时的内存峰值
+        dpi: 估算使用的渲染分辨率
+        megapixels: 按DPI栅格化后的总像素数（百万）
+        file_size: 文件大小（字节）
+        cost: 预计耗时（秒）
+    """
+
+    def __init__(self, path, pages, area, dpi, max_page_area=0.0, file_size=0):
+        self.path = path
+        self.pages = pages
+        self.area = area
+        self.max_page_area = max_page_area
+        self.dpi = dpi
+        self.megapixels = area * (dpi / 72.0) ** 2 / 1e6
+        self.file_size = file_size
+        self.cost = 0.0
+
+    @property
+    def max_page_pixels(self):
+        """最大一页按DPI栅格化后的像素数"""
+        return self.max_page_area * (self.dpi / 72.0) ** 2
+
+
+def inspect_pdf(path, dpi=150):
+    """
+    读取PDF的页数和页面尺寸（只解析页面树，不渲染）
+
+    返回:
+        PdfJob: 文件无法打开时页数为0
+    """
+    try:
+        doc = fitz.open(path)
+        try:
+            area = 0.0
+            max_page_area = 0.0
+            for page_num in range(len(doc)):
+                rect = doc.page_cropbox(page_num)
+                area += rect.width * rect.height
+                max_page_area = max(max_page_area, rect.width * rect.height)
+            return PdfJob(path, len(doc), area, dpi, max_page_area, os.path.getsize(path))
+        finally:
+            doc.close()
+    except Exception as e:
+        print(f"读取PDF信息时出错 {path}: {str(e)}")
+        return PdfJob(path, 0, 0.0, dpi)
+
+
+class ThroughputStats:
+    """
+    各步骤的历史吞吐量，保存在用户目录下的JSON文件中
+
+    参数:
+        path: 统计文件路径，默认为 config.USER_DATA_DIR 下的 config.THROUGHPUT_STATS_FILE
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(config.USER_DATA_DIR, config.THROUGHPUT_STATS_FILE)
+        self.rates = dict(_DEFAULT_RATES)
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            for key in self.rates:
+                value = saved.get(key)
+                if isinstance(value, (int, float)) and value > 0:
+                    self.rates[key] = float(value)
+        except (OSError, ValueError):
+            pass  # 没有历史数据时使用默认值
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.rates, f, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"保存吞吐量统计时出错: {str(e)}")
+
+    def predict(self, job):
+        """预计单个文件的处理耗时（秒），按 config.SECURE_RENDER_MODE 使用对应的吞吐量"""
+        if config.SECURE_RENDER_MODE == "raster":
+            return job.megapixels * (self.rates["raster_per_mpx"] + self.rates["password_per_mpx"])
+        return (job.pages * self.rates["watermark_per_page"]
+                + job.megapixels * (self.rates["secure_per_mpx"] + self.rates["password_per_mpx"]))
+
+    def record(self, job, stage_seconds):
+        """
+        用一次实际处理的各步骤耗时更新吞吐量
+
+        参数:
+            job: PdfJob
+            stage_seconds: 三个步骤（水印、安全转换、密码保护）的耗时；
+                           raster模式下前两步在一次渲染中完成，两步合计更新 raster_per_mpx
+        """
+        if job.pages <= 0 or job.megapixels <= 0 or len(stage_seconds) != 3:
+            return
+        measured = {"password_per_mpx": stage_seconds[2] / job.megapixels}
+        if config.SECURE_RENDER_MODE == "raster":
+            measured["raster_per_mpx"] = (stage_seconds[0] + stage_seconds[1]) / job.megapixels
+        else:
+            measured["watermark_per_page"] = stage_seconds[0] / job.pages
+            measured["secure_per_mpx"] = stage_seconds[1] / job.megapixels
+        with self._lock:
+            for key, value in measured.items():
+                if value > 0:
+                    self.rates[key] = (1 - _EMA_WEIGHT) * self.rates[key] + _EMA_WEIGHT * value
+
+
+def plan_jobs(paths, dpi=150, strategy=STRATEGY_SHORTEST_FIRST, stats=None):
+    """
+    估算每个文件的耗时并按策略排序
+
+    参数:
+        paths: PDF路径列表
+        dpi: 安全转换的渲染分辨率
+        strategy: 排序策略，见 STRATEGY_NAMES
+        stats: ThroughputStats，为空时读取保存的统计
+
+    返回:
+        list: 排好序的 PdfJob 列表
+    """
+    stats = stats or ThroughputStats()
+    jobs = [inspect_pdf(path, dpi) for path in paths]
+    for job in jobs:
+        job.cost = stats.predict(job)
+    if strategy == STRATEGY_SHORTEST_FIRST:
+        jobs.sort(key=lambda job: job.cost)
+    elif strategy == STRATEGY_LONGEST_FIRST:
+        jobs.sort(key=lambda job: job.cost, reverse=True)
+    return jobs
+
+
+class StageTimer:
+    """
+    记录 process_pdf 各步骤耗时，可直接作为 stage_callback 使用
+
+    参数:
+        callback: 需要继续转发的步骤回调
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._marks = []
+
+    def __call__(self, stage_index, stage_name):
+        self._marks.append(time.monotonic())
+        if self.callback:
+            self.callback(stage_index, stage_name)
+
+    def finish(self):
+        """处理结束时调用，返回各步骤耗时（秒）"""
+        marks = self._marks + [time.monotonic()]
+        return [marks[i + 1] - marks[i] for i in range(len(self._marks))]
+
+
+class EtaTracker:
+    """
+    根据预计耗时和实际进度计算剩余时间和处理速度
+
+    剩余时间 = 剩余预计耗时 × (实际已用时间 / 已完成部分的预计耗时)，
+    这样即使吞吐量估算有偏差，也会随着处理进行逐渐校正
+
+    参数:
+        jobs: 排好序的 PdfJob 列表
+    """
+
+    def __init__(self, jobs):
+        self.total_cost = sum(job.cost for job in jobs) or 1.0
+        self.total_pages = sum(job.pages for job in jobs)
+        self.done_cost = 0.0
+        self.done_pages = 0
+        self.started_at = time.monotonic()
+
+    def job_finished(self, job):
+        self.done_cost += job.cost
+        self.done_pages += job.pages
+
+    def fraction(self, partial_cost=0.0):
+        """按预计耗时加权的总体进度（0~1），partial_cost为当前文件已完成部分的预计耗时"""
+        return min(1.0, (self.done_cost + partial_cost) / self.total_cost)
+
+    def eta_seconds(self, partial_cost=0.0):
+        """预计剩余秒数，还没有进度时返回None"""
+        done = self.done_cost + partial_cost
+        if done <= 0:
+            return None
+        elapsed = time.monotonic() - self.started_at
+        return max(0.0, (self.total_cost - done) * elapsed / done)
+
+    def pages_per_second(self):
+        elapsed = time.monotonic() - self.started_at
+        return self.done_pages / elapsed if elapsed > 0 else 0.0
+
+    def describe(self, partial_cost=0.0):
+        """返回用于界面显示的文字，例如 "剩余约 1分20秒 · 12.5 页/秒" """
+        eta = self.eta_seconds(partial_cost)
+        if eta is None:
+            eta_text = "剩余时间估算中"
+        else:
+            minutes, seconds = divmod(int(round(eta)), 60)
+            eta_text = f"剩余约 {minutes}分{seconds:02d}秒" if minutes else f"剩余约 {seconds}秒"
+        return f"{eta_text} · {self.pages_per_second():.1f} 页/秒"
+
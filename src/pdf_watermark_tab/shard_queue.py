@@ -0,0 +1,483 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+多机分片：通过共享目录把一大批文件分给多台机器处理，只依赖共享文件系统
+
+    队列目录/
+        pending/<任务>.json            等待处理的任务描述
+        claimed/<任务>@<节点>.json     已被某个工作节点领取，节点定期更新修改时间续约
+        claimed/<任务>@<节点>.json.publishing / .revoked
+                                       正在发布结果 / 正在被协调端收回，两者互斥
+        done/<任务>.json               处理结果（成功或失败原因）
+        queue.json                     协调端的设置（租约时长），工作节点据此决定续约间隔
+
+协调端把任务描述写入 pending；任意主机上的工作节点用一次重命名（pending -> claimed）领取任务，
+重命名是原子的，同一个任务只会被一个节点领取。节点在本机多进程处理，输出写到共享的输出目录，
+结果写入 done。协调端按自己的时钟观察租约文件，修改时间长时间没有变化说明节点已经崩溃或失联，
+任务重新放回 pending 由其他节点处理，因此各主机之间不需要时钟同步。
+
+租约只能通过一次重命名离开 claimed：节点发布结果前把它改名为 .publishing，协调端收回前把它改名为 .revoked，
+只有一方的重命名能成功。节点只是处理得慢时，它在协调端收回后就无法再发布结果，
+同一个任务不会发出两份不同指纹的输出，也不会留下互相矛盾的完成记录。
+
+任务描述中的路径尽量保存为相对队列目录的路径，各主机把共享目录挂载在不同位置时也能找到文件
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import hashlib
+import threading
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from src.pdf_watermark_tab.pipeline import get_output_paths, default_watermark_image
+from src.pdf_watermark_tab.loader import PdfSource
+from src.pdf_watermark_tab.protect import ProtectOptions, protect_pdf
+from src.pdf_watermark_tab.scheduler import plan_jobs, STRATEGY_LONGEST_FIRST
+from src.pdf_watermark_tab.job_guard import GuardedPool
+from src.pdf_watermark_tab.worker_pool import warm_up
+import config
+
+
+PENDING_DIR = "pending"
+CLAIMED_DIR = "claimed"
+DONE_DIR = "done"
+QUEUE_SETTINGS_FILE = "queue.json"
+# 租约离开claimed时的两种去向，后缀不是 .json，不会被当作租约列出
+_PUBLISHING_SUFFIX = ".publishing"
+_REVOKED_SUFFIX = ".revoked"
+# 领取任务时从排在最前面的几个中随机挑选，多个节点同时领取时减少冲突
+_CLAIM_WINDOW = 8
+
+
+def _write_json_atomic(path, data):
+    """先写以点开头的临时文件再替换，其他节点不会读到写了一半的内容"""
+    directory, name = os.path.split(path)
+    partial = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(partial, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(partial, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _list_json(directory):
+    try:
+        return sorted(name for name in os.listdir(directory) if name.endswith(".json") and not name.startswith("."))
+    except OSError:
+        return []
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _job_id_of_claim(name):
+    """claimed目录中的文件名 <任务>@<节点>.json 对应的任务编号"""
+    return name[:-len(".json")].partition("@")[0]
+
+
+class ShardResult:
+    """
+    一个分片任务的处理结果
+
+    属性:
+        job: 任务描述（字典）
+        success: 是否成功
+        error: 失败原因
+        output: 输出文件路径
+        password: 使用的密码
+        output_hash: 输出文件的SHA-256
+        source_hash: 输入文件的SHA-256
+        worker: 处理该任务的工作节点
+    """
+
+    def __init__(self, job, success, error="", output="", password="", output_hash="", source_hash="",
+                 worker=""):
+        self.job = job
+        self.success = success
+        self.error = error
+        self.output = output
+        self.password = password
+        self.output_hash = output_hash
+        self.source_hash = source_hash
+        self.worker = worker
+
+
+class ShardQueue:
+    """
+    共享目录中的任务队列，协调端和工作节点共用的路径处理
+
+    参数:
+        queue_dir: 队列目录，位于各主机都能访问的共享目录中
+    """
+
+    def __init__(self, queue_dir):
+        self.queue_dir = os.path.abspath(queue_dir)
+        for name in (PENDING_DIR, CLAIMED_DIR, DONE_DIR):
+            os.makedirs(os.path.join(self.queue_dir, name), exist_ok=True)
+
+    def path(self, *parts):
+        return os.path.join(self.queue_dir, *parts)
+
+    def output_paths(self, job, worker_id):
+        """
+        任务的输出文件，以及工作节点写出过程中使用的临时文件（输出文件旁的 <输出>.<节点>-<分配次数>.part），
+        同一节点再次领取被收回的任务时也不会与上一次的临时文件重名
+
+        返回:
+            tuple: (输出文件路径, 临时文件路径)
+        """
+        input_pdf = self.from_queue_path(job["input"])
+        output = get_output_paths(input_pdf, self.from_queue_path(job["output_dir"]), job["student_name"])[2]
+        return output, f"{output}.{worker_id}-{job.get('attempts', 0)}.part"
+
+    def to_queue_path(self, path):
+        """队列目录之内（含上级共享目录）的路径保存为相对路径，不在同一个盘符时保存绝对路径"""
+        path = os.path.abspath(path)
+        try:
+            return os.path.relpath(path, self.queue_dir).replace(os.sep, "/")
+        except ValueError:
+            return path
+
+    def from_queue_path(self, value):
+        if os.path.isabs(value):
+            return value
+        return os.path.normpath(os.path.join(self.queue_dir, value))
+
+    def lease_seconds_setting(self):
+        """协调端写入的租约时长，没有时使用 config.SHARD_LEASE_SECONDS"""
+        settings = _read_json(self.path(QUEUE_SETTINGS_FILE)) or {}
+        return float(settings.get("lease_seconds", config.SHARD_LEASE_SECONDS))
+
+    def counts(self):
+        """各状态的任务数: (等待, 处理中, 已完成)"""
+        return tuple(len(_list_json(self.path(name))) for name in (PENDING_DIR, CLAIMED_DIR, DONE_DIR))
+
+
+class ShardCoordinator(ShardQueue):
+    """
+    协调端：写入任务、收集结果、收回失联节点的任务
+
+    参数:
+        queue_dir: 队列目录
+        lease_seconds: 租约文件多久没有变化视为节点失联，默认 config.SHARD_LEASE_SECONDS
+        max_attempts: 同一任务因节点失联最多分配的次数，默认 config.SHARD_MAX_ATTEMPTS
+    """
+
+    def __init__(self, queue_dir, lease_seconds=None, max_attempts=None):
+        super().__init__(queue_dir)
+        self.lease_seconds = config.SHARD_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self.max_attempts = config.SHARD_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        _write_json_atomic(self.path(QUEUE_SETTINGS_FILE), {"lease_seconds": self.lease_seconds})
+        self._leases = {}   # 租约文件名 -> (修改时间, 大小, 本机最近一次看到变化的时间)
+        self._jobs = {}     # 本协调端写入的任务编号 -> 任务描述
+        self._collected = set()
+
+    def submit(self, inputs, output_dir, student_name, watermark_text, dpi=150, output_format=None,
+               colorspace=None, fingerprints=None):
+        """
+        把一批文件写入队列，大文件排在前面，各节点负载更均衡
+
+        参数:
+            inputs: 输入PDF路径列表，应位于各主机都能访问的共享目录中
+            output_dir: 输出目录，同样应位于共享目录中
+            fingerprints: {输入路径: 指纹}，为空时不嵌入指纹
+            其余参数同 StagedTask
+
+        返回:
+            list: 任务编号
+        """
+        render_dpi = max(dpi, config.MRC_MASK_DPI) if output_format == "mrc" else dpi
+        jobs = plan_jobs(inputs, render_dpi, STRATEGY_LONGEST_FIRST)
+        batch = uuid.uuid4().hex[:8]
+        job_ids = []
+        for index, job in enumerate(jobs):
+            # 编号按处理顺序排列，工作节点按文件名顺序领取
+            job_id = f"{batch}-{index:05d}"
+            self._jobs[job_id] = {
+                "id": job_id,
+                "input": self.to_queue_path(job.path),
+                "output_dir": self.to_queue_path(output_dir),
+                "student_name": student_name,
+                "watermark_text": watermark_text,
+                "dpi": dpi,
+                "output_format": output_format,
+                "colorspace": colorspace,
+                "fingerprint": (fingerprints or {}).get(job.path),
+                "attempts": 0,
+            }
+            _write_json_atomic(self.path(PENDING_DIR, job_id + ".json"), self._jobs[job_id])
+            job_ids.append(job_id)
+        return job_ids
+
+    def requeue_stale(self):
+        """
+        收回失联节点的任务：租约文件在本机时钟下超过lease_seconds没有变化时放回pending，
+        超过最多分配次数的任务记为失败
+
+        返回:
+            int: 收回的任务数
+        """
+        now = time.monotonic()
+        names = _list_json(self.path(CLAIMED_DIR))
+        self._leases = {name: lease for name, lease in self._leases.items() if name in names}
+        requeued = 0
+        for name in names:
+            claim = self.path(CLAIMED_DIR, name)
+            try:
+                stat = os.stat(claim)
+            except OSError:
+                continue
+            lease = self._leases.get(name)
+            if lease is None or lease[:2] != (stat.st_mtime, stat.st_size):
+                self._leases[name] = (stat.st_mtime, stat.st_size, now)
+                continue
+            if now - lease[2] < self.lease_seconds:
+                continue
+
+            del self._leases[name]
+            # 先把租约改名收回：节点已经开始发布结果时重命名失败，任务留给节点完成
+            revoked = claim + _REVOKED_SUFFIX
+            try:
+                os.rename(claim, revoked)
+            except OSError:
+                continue
+            job_id = _job_id_of_claim(name)
+            job = _read_json(revoked)
+            if job is None or os.path.exists(self.path(DONE_DIR, job_id + ".json")):
+                _remove(revoked)
+                continue
+            worker = name[:-len(".json")].partition("@")[2]
+            # 失联节点留在输出目录中的临时文件；节点只是处理得慢时，它无法再发布结果，也会删除自己的临时文件
+            _remove(self.output_paths(job, worker)[1])
+            job["attempts"] = job.get("attempts", 0) + 1
+            if job["attempts"] >= self.max_attempts:
+                _write_json_atomic(self.path(DONE_DIR, job_id + ".json"), {
+                    "id": job_id, "success": False, "worker": worker,
+                    "error": f"工作节点多次失联（已分配 {job['attempts']} 次）",
+                })
+            else:
+                print(f"工作节点 {worker} 失联，任务 {job_id} 重新放回队列")
+                _write_json_atomic(self.path(PENDING_DIR, job_id + ".json"), job)
+            _remove(revoked)
+            requeued += 1
+        return requeued
+
+    def collect(self, job_ids):
+        """
+        读取新完成的任务结果
+
+        返回:
+            list: 本次新读到的ShardResult
+        """
+        results = []
+        for job_id in job_ids:
+            if job_id in self._collected:
+                continue
+            record = _read_json(self.path(DONE_DIR, job_id + ".json"))
+            if record is None:
+                continue
+            self._collected.add(job_id)
+            job = self._jobs.get(job_id) or {"id": job_id}
+            results.append(ShardResult(job, bool(record.get("success")), record.get("error", ""),
+                                       self.from_queue_path(record["output"]) if record.get("output") else "",
+                                       record.get("password", ""), record.get("output_hash", ""),
+                                       record.get("source_hash", ""), record.get("worker", "")))
+        return results
+
+    def wait(self, job_ids, callback=None, poll_interval=None):
+        """
+        等待一批任务全部完成，期间收回失联节点的任务
+
+        参数:
+            job_ids: submit 返回的任务编号
+            callback: 每完成一个任务调用一次 callback(ShardResult)
+
+        返回:
+            list: 按完成顺序排列的ShardResult
+        """
+        poll_interval = config.SHARD_POLL_SECONDS if poll_interval is None else poll_interval
+        results = []
+        while len(results) < len(job_ids):
+            for result in self.collect(job_ids):
+                results.append(result)
+                if not result.success:
+                    print(f"处理文件 {result.job.get('input', result.job['id'])} 时出错: {result.error}")
+                if callback:
+                    callback(result)
+            if len(results) < len(job_ids):
+                self.requeue_stale()
+                time.sleep(poll_interval)
+        return results
+
+
+def _shard_job(input_pdf, partial_output, student_name, watermark_text, dpi, output_format, colorspace,
+               fingerprint):
+    """
+    工作进程：处理一个任务，加密后的结果写入输出目录中的临时文件
+
+    返回:
+        tuple: (密码, 输出内容的SHA-256, 输入文件的SHA-256)
+    """
+    options = ProtectOptions(student_name, watermark_text, default_watermark_image(), dpi, output_format,
+                             colorspace, fingerprint=fingerprint)
+    source = PdfSource(input_pdf)
+    source_hash = hashlib.sha256(source.buffer).hexdigest()
+    data = protect_pdf(source, options)
+    os.makedirs(os.path.dirname(partial_output) or ".", exist_ok=True)
+    with open(partial_output, "wb") as f:
+        f.write(data)
+    return options.password, hashlib.sha256(data).hexdigest(), source_hash
+
+
+class ShardWorker(ShardQueue):
+    """
+    工作节点：从共享队列领取任务，在本机多进程处理，并定期续约
+
+    参数:
+        queue_dir: 队列目录
+        max_workers: 本机同时处理的任务数，默认与CPU核心数一致
+        worker_id: 节点名称，默认为 主机名-进程号
+        renew_seconds: 续约间隔，默认 config.SHARD_RENEW_SECONDS，且不超过协调端租约时长的1/4
+        poll_interval: 队列为空时的扫描间隔，默认 config.SHARD_POLL_SECONDS
+    """
+
+    def __init__(self, queue_dir, max_workers=None, worker_id=None, renew_seconds=None, poll_interval=None):
+        super().__init__(queue_dir)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.worker_id = (worker_id or f"{socket.gethostname()}-{os.getpid()}").replace("@", "_")
+        self.renew_seconds = config.SHARD_RENEW_SECONDS if renew_seconds is None else renew_seconds
+        self.poll_interval = config.SHARD_POLL_SECONDS if poll_interval is None else poll_interval
+        self.completed = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """请求节点停止：不再领取新任务，处理完已领取的任务后退出"""
+        self._stop_event.set()
+
+    def claim(self):
+        """
+        领取一个任务
+
+        返回:
+            tuple: (任务描述, 租约文件路径)，没有可领取的任务时返回None
+        """
+        names = _list_json(self.path(PENDING_DIR))
+        window = names[:_CLAIM_WINDOW]
+        random.shuffle(window)
+        for name in window + names[_CLAIM_WINDOW:]:
+            job_id = name[:-len(".json")]
+            claim = self.path(CLAIMED_DIR, f"{job_id}@{self.worker_id}.json")
+            try:
+                os.rename(self.path(PENDING_DIR, name), claim)
+            except OSError:
+                continue  # 已被其他节点领取
+            job = _read_json(claim)
+            if job is None or os.path.exists(self.path(DONE_DIR, job_id + ".json")):
+                # 失联后又恢复的节点已经完成了这个任务
+                _remove(claim)
+                continue
+            return job, claim
+        return None
+
+    def _submit(self, pool, job, claim):
+        input_pdf = self.from_queue_path(job["input"])
+        output, partial = self.output_paths(job, self.worker_id)
+        future = pool.submit(_shard_job, input_pdf, partial, job["student_name"], job["watermark_text"],
+                             job.get("dpi", 150), job.get("output_format"), job.get("colorspace"),
+                             job.get("fingerprint"))
+        return future, (job, claim, output, partial, time.monotonic())
+
+    def _publish(self, future, job, claim, output, partial, started_at):
+        """把完成的任务写回共享目录；租约已被收回时放弃结果，由重新领取的节点负责"""
+        record = {"id": job["id"], "worker": self.worker_id, "seconds": round(time.monotonic() - started_at, 2)}
+        error = None
+        try:
+            password, output_hash, source_hash = future.result()
+        except Exception as e:
+            error = str(e)
+
+        # 发布前先把租约改名占住，与协调端的收回互斥；改名失败说明租约已被收回
+        publishing = claim + _PUBLISHING_SUFFIX
+        try:
+            os.rename(claim, publishing)
+        except OSError:
+            print(f"任务 {job['id']} 的租约已被收回，放弃本次结果")
+            _remove(partial)
+            return
+
+        if error is None:
+            try:
+                os.replace(partial, output)
+            except OSError as e:
+                error = str(e)
+        if error is None:
+            record.update(success=True, output=self.to_queue_path(output), password=password,
+                          output_hash=output_hash, source_hash=source_hash)
+        else:
+            _remove(partial)
+            record.update(success=False, error=error)
+            print(f"处理任务 {job['id']}（{job['input']}）时出错: {error}")
+        _write_json_atomic(self.path(DONE_DIR, job["id"] + ".json"), record)
+        _remove(publishing)
+        self.completed += 1
+
+    def run(self, exit_when_idle=False):
+        """
+        运行节点直到调用stop()
+
+        参数:
+            exit_when_idle: 队列中没有等待的任务、本机任务也都完成时退出
+        """
+        print(f"工作节点 {self.worker_id} 已启动（{self.max_workers} 个进程），队列: {self.queue_dir}")
+        in_flight = {}
+        next_renew = 0.0
+        with GuardedPool(self.max_workers, initializer=warm_up) as pool:
+            try:
+                while True:
+                    while not self._stop_event.is_set() and len(in_flight) < self.max_workers:
+                        claimed = self.claim()
+                        if claimed is None:
+                            break
+                        future, item = self._submit(pool, *claimed)
+                        in_flight[future] = item
+
+                    # 更新租约文件的修改时间，协调端据此判断节点仍在工作
+                    now = time.monotonic()
+                    if now >= next_renew:
+                        for item in in_flight.values():
+                            try:
+                                os.utime(item[1])
+                            except OSError:
+                                pass
+                        renew_seconds = min(self.renew_seconds, self.lease_seconds_setting() / 4)
+                        next_renew = now + renew_seconds
+
+                    if in_flight:
+                        timeout = max(0.05, min(self.poll_interval, next_renew - now))
+                        finished, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            self._publish(future, *in_flight.pop(future))
+                    elif self._stop_event.is_set() or (exit_when_idle and not _list_json(self.path(PENDING_DIR))):
+                        break
+                    else:
+                        self._stop_event.wait(self.poll_interval)
+            finally:
+                for future, item in in_flight.items():
+                    # 异常退出时已领取的任务留给协调端在租约过期后收回
+                    future.cancel()
+        print(f"工作节点 {self.worker_id} 已退出，共处理 {self.completed} 个任务")
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按目标文件大小自动选择渲染分辨率和JPEG质量
+
+学生常通过聊天软件接收文件，附件有大小限制。设置大小上限后，每个文档在处理前先做一次搜索:
+从文档中均匀抽取几页，用不同的 (DPI, JPEG质量) 生成安全输出，按页面面积把抽样结果外推到整个文件，
+二分查找不超过上限的最高设置。DPI和质量一起按同一个比例从请求的设置降到下限（config.SIZE_MIN_DPI、
+config.SIZE_MIN_JPEG_QUALITY），flat格式只有DPI起作用，MRC格式的文字层分辨率固定，主要由背景质量决定。
+
+整个文件生成后再核对一次实际大小，外推偏小时按比例再降低DPI。找到的设置按源文件内容的哈希
+保存在用户数据目录中，同一份课件发给全班学生时只搜索一次
+"""
+
+import os
+import json
+import math
+import hashlib
+
+import fitz  # PyMuPDF
+
+import config
+
+
+class SizeSettings:
+    """
+    满足大小上限的渲染设置
+
+    属性:
+        dpi: 渲染分辨率
+        jpeg_quality: MRC背景JPEG质量
+        estimate: 按抽样页外推的文件大小（字节）
+    """
+
+    def __init__(self, dpi, jpeg_quality, estimate=0):
+        self.dpi = dpi
+        self.jpeg_quality = jpeg_quality
+        self.estimate = estimate
+
+
+def max_bytes_from_mb(max_mb=None):
+    """
+    把以MB为单位的大小上限换算为字节
+
+    参数:
+        max_mb: 大小上限（MB），为None时使用 config.MAX_OUTPUT_MB
+
+    返回:
+        int: 字节数，不限制时为None
+    """
+    max_mb = config.MAX_OUTPUT_MB if max_mb is None else float(max_mb)
+    return int(max_mb * 1024 * 1024) if max_mb > 0 else None
+
+
+def _tuning_dir():
+    return os.path.join(config.USER_DATA_DIR, config.SIZE_TUNING_DIR)
+
+
+def _cache_path(key):
+    return os.path.join(_tuning_dir(), key + ".json")
+
+
+def tuning_key(source_hash, max_bytes, dpi, output_format, colorspace):
+    """按源文件内容和影响输出大小的全部参数计算缓存键"""
+    parts = [source_hash, int(max_bytes), dpi, output_format, colorspace, config.SECURE_RENDER_MODE,
+             config.MRC_JPEG_QUALITY, config.MRC_BACKGROUND_DPI]
+    return hashlib.sha1(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def load_settings(key):
+    """读取缓存的设置，没有时返回None"""
+    try:
+        with open(_cache_path(key), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return SizeSettings(int(data["dpi"]), int(data["jpeg_quality"]), int(data.get("estimate", 0)))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_settings(key, settings):
+    """保存设置，先写临时文件再替换，多个工作进程同时写入同一个键也不会留下损坏的文件"""
+    try:
+        os.makedirs(_tuning_dir(), exist_ok=True)
+        partial = f"{_cache_path(key)}.{os.getpid()}.part"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump({"dpi": settings.dpi, "jpeg_quality": settings.jpeg_quality,
+                       "estimate": settings.estimate}, f)
+        os.replace(partial, _cache_path(key))
+    except OSError as e:
+        print(f"保存文件大小设置失败: {str(e)}")
+
+
+def document_size(doc):
+    """文档保存后的大小（字节），与加密保存使用相同的压缩选项"""
+    return len(doc.tobytes(garbage=4, deflate=True))
+
+
+def sample_pages(page_count, count=None):
+    """
+    均匀抽取的页码（包括第一页和最后一页）
+
+    参数:
+        page_count: 文档页数
+        count: 抽取的页数，默认 config.SIZE_SAMPLE_PAGES
+
+    返回:
+        list: 升序的页码
+    """
+    count = min(count or config.SIZE_SAMPLE_PAGES, page_count)
+    if count <= 1:
+        return [0] if page_count else []
+    step = (page_count - 1) / (count - 1)
+    return sorted({int(round(i * step)) for i in range(count)})
+
+
+def _page_area(page):
+    rect = page.rect
+    return max(rect.width * rect.height, 1.0)
+
+
+class SizeSearch:
+    """
+    在一个文档上搜索不超过大小上限的设置
+
+    参数:
+        doc: 已打开的原始fitz.Document
+        max_bytes: 输出文件大小上限（字节）
+        dpi: 请求的渲染分辨率，搜索结果不会超过它
+        render: 生成安全文档的函数 render(doc, dpi, jpeg_quality) -> fitz.Document
+        output_format: "flat" 或 "mrc"，决定哪些设置会影响大小
+        jpeg_quality: 请求的JPEG质量，默认 config.MRC_JPEG_QUALITY
+    """
+
+    def __init__(self, doc, max_bytes, dpi, render, output_format="flat", jpeg_quality=None):
+        self.doc = doc
+        self.max_bytes = max_bytes
+        self.dpi = dpi
+        self.jpeg_quality = jpeg_quality or config.MRC_JPEG_QUALITY
+        self.render = render
+        if output_format == "mrc":
+            # 文字层不低于 config.MRC_MASK_DPI 渲染，更低的DPI不会让文件变小
+            self.min_dpi = min(max(config.SIZE_MIN_DPI, config.MRC_MASK_DPI), dpi)
+            self.min_quality = min(config.SIZE_MIN_JPEG_QUALITY, self.jpeg_quality)
+        else:
+            # flat格式的图像无损压缩，只有DPI影响大小
+            self.min_dpi = min(config.SIZE_MIN_DPI, dpi)
+            self.min_quality = self.jpeg_quality
+        self._sample = None
+        self._scale = 1.0
+        self._estimates = {}
+
+    def settings_at(self, level):
+        """level从0（下限）到1（请求的设置）之间线性插值的设置"""
+        dpi = int(round(self.min_dpi + (self.dpi - self.min_dpi) * level))
+        quality = int(round(self.min_quality + (self.jpeg_quality - self.min_quality) * level))
+        return SizeSettings(dpi, quality)
+
+    def _sample_document(self):
+        """抽样页组成的文档，以及整个文档与抽样页的面积比"""
+        if self._sample is None:
+            pages = sample_pages(len(self.doc))
+            if len(pages) == len(self.doc):
+                # 页数不多时直接使用整个文档，估算就是实际大小
+                self._sample = self.doc
+            else:
+                self._sample = fitz.open()
+                for index in pages:
+                    self._sample.insert_pdf(self.doc, from_page=index, to_page=index)
+                total_area = sum(_page_area(page) for page in self.doc)
+                sample_area = sum(_page_area(self.doc[index]) for index in pages)
+                self._scale = total_area / sample_area
+        return self._sample
+
+    def estimate(self, settings):
+        """按抽样页外推的输出大小（字节）"""
+        key = (settings.dpi, settings.jpeg_quality)
+        if key not in self._estimates:
+            output = self.render(self._sample_document(), settings.dpi, settings.jpeg_quality)
+            try:
+                self._estimates[key] = int(document_size(output) * self._scale)
+            finally:
+                output.close()
+        settings.estimate = self._estimates[key]
+        return settings.estimate
+
+    def search(self, target=None):
+        """
+        二分查找估算大小不超过target的最高设置
+
+        参数:
+            target: 目标大小，默认为上限乘以 config.SIZE_TARGET_MARGIN，给外推误差留出余量
+
+        返回:
+            SizeSettings: 下限设置仍然超出时返回下限设置
+        """
+        target = target or self.max_bytes * config.SIZE_TARGET_MARGIN
+        best = self.settings_at(1.0)
+        if self.estimate(best) <= target:
+            return best
+        low, high = 0.0, 1.0
+        best = self.settings_at(low)
+        if self.estimate(best) > target:
+            print(f"按最低设置估算仍有 {best.estimate / 1048576:.1f} MB，超出大小上限")
+            return best
+        for _ in range(config.SIZE_SEARCH_STEPS):
+            level = (low + high) / 2
+            settings = self.settings_at(level)
+            if self.estimate(settings) <= target:
+                low, best = level, settings
+            else:
+                high = level
+        return best
+
+    def correct(self, settings, actual):
+        """
+        整个文件的实际大小超出上限时，按面积与DPI平方成正比再降低DPI
+
+        返回:
+            SizeSettings: 新的设置；已经是下限时返回None
+        """
+        if settings.dpi <= self.min_dpi and settings.jpeg_quality <= self.min_quality:
+            return None
+        ratio = math.sqrt(self.max_bytes * config.SIZE_TARGET_MARGIN / actual)
+        dpi = max(self.min_dpi, min(settings.dpi - 1, int(settings.dpi * ratio)))
+        quality = max(self.min_quality, min(settings.jpeg_quality, int(settings.jpeg_quality * ratio)))
+        return SizeSettings(dpi, quality)
+
+    def close(self):
+        if self._sample is not None and self._sample is not self.doc:
+            self._sample.close()
+        self._sample = None
+
+
+def fit_document(doc, source_hash, max_bytes, dpi, output_format, colorspace, render_sample, render):
+    """
+    生成不超过大小上限的安全文档
+
+    参数:
+        doc: 已打开的原始fitz.Document
+        source_hash: 源文件内容的SHA-256，用于缓存找到的设置
+        max_bytes: 输出文件大小上限（字节）
+        dpi: 请求的渲染分辨率
+        output_format, colorspace: 与安全转换相同
+        render_sample: 为抽样页生成安全文档的函数 render_sample(doc, dpi, jpeg_quality) -> fitz.Document
+        render: 为整个文件生成安全文档的函数 render(dpi, jpeg_quality) -> fitz.Document
+
+    返回:
+        tuple: (安全文档, SizeSettings)，SizeSettings.estimate为实际大小
+    """
+    key = tuning_key(source_hash, max_bytes, dpi, output_format, colorspace)
+    search = SizeSearch(doc, max_bytes, dpi, render_sample, output_format)
+    try:
+        settings = load_settings(key)
+        cached = settings is not None
+        if not cached:
+            settings = search.search()
+        for attempt in range(config.SIZE_CORRECTIONS + 1):
+            output = render(settings.dpi, settings.jpeg_quality)
+            actual = document_size(output)
+            if actual <= max_bytes:
+                break
+            corrected = search.correct(settings, actual) if attempt < config.SIZE_CORRECTIONS else None
+            if corrected is None:
+                print(f"输出 {actual / 1048576:.1f} MB，无法压缩到 {max_bytes / 1048576:.1f} MB 以内")
+                break
+            output.close()
+            cached = False
+            settings = corrected
+        settings.estimate = actual
+        if not cached:
+            save_settings(key, settings)
+        return output, settings
+    finally:
+        search.close()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+分阶段流水线执行器，让多个文件的读取、计算和写出互相重叠
+
+    读取线程 --(有界队列)--> 计算进程池 --(有界队列)--> 写出线程
+
+读取线程提前映射并预读后面的文件；计算进程在内存中完成水印、栅格化和加密，不写中间文件；
+写出线程负责把结果写到输出目录（网络共享目录上写入很慢），同时计算进程已经开始处理下一个文件。
+各队列都有上限，读得快或写得慢时上游会等待，内存占用不会无限增长。
+每个文件有时间和内存预算（job_guard），超时的文件记为失败，其余文件继续处理
+"""
+
+import os
+import hashlib
+import queue
+import threading
+from contextlib import nullcontext
+from concurrent.futures import wait, FIRST_COMPLETED, CancelledError
+
+from src.pdf_watermark_tab.pipeline import get_output_paths, default_watermark_image
+from src.pdf_watermark_tab.loader import PdfSource
+from src.pdf_watermark_tab.scheduler import StageTimer, PdfJob, inspect_pdf
+from src.pdf_watermark_tab.memory_governor import MemoryGovernor, estimate_job_memory
+from src.pdf_watermark_tab.protect import ProtectOptions, protect_pdf
+from src.pdf_watermark_tab.job_guard import GuardedPool, JobCancelled, memory_budget_mb
+import config
+
+
+class StagedTask:
+    """
+    流水线中的一个文件
+
+    参数:
+        input_pdf: 输入PDF文件路径
+        output_dir: 输出目录
+        student_name: 学生姓名（用于文件名和拼音密码）
+        watermark_text: 水印文字内容
+        watermark_image: 中心水印图片路径，默认使用中文LOGO
+        dpi: 安全转换的渲染分辨率
+        output_format: 安全输出格式 "flat" 或 "mrc"，默认使用 config.SECURE_OUTPUT_FORMAT
+        tag: 调用方附带的任意数据（例如调度器的PdfJob），原样出现在结果中
+        colorspace: 渲染颜色空间 "auto" / "rgb" / "gray"，默认使用 config.RENDER_COLORSPACE
+        fingerprint: 嵌入输出的泄露追踪指纹，为空时不嵌入
+        max_bytes: 输出文件大小上限（字节），为空时不限制
+    """
+
+    def __init__(self, input_pdf, output_dir, student_name, watermark_text, watermark_image=None,
+                 dpi=150, output_format=None, tag=None, colorspace=None, fingerprint=None, max_bytes=None):
+        self.input_pdf = input_pdf
+        self.output_dir = output_dir
+        self.student_name = student_name
+        self.watermark_text = watermark_text
+        self.watermark_image = watermark_image or default_watermark_image()
+        self.dpi = dpi
+        self.output_format = output_format or config.SECURE_OUTPUT_FORMAT
+        self.tag = tag
+        self.colorspace = colorspace or config.RENDER_COLORSPACE
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.final_output = get_output_paths(input_pdf, output_dir, student_name)[2]
+        self.memory_estimate = None
+
+    @property
+    def render_dpi(self):
+        """实际渲染分辨率，MRC的文字层以更高分辨率渲染"""
+        return max(self.dpi, config.MRC_MASK_DPI) if self.output_format == "mrc" else self.dpi
+
+    def estimate_memory(self):
+        """估算处理本文件时工作进程的内存峰值，tag为PdfJob时直接使用其中的页面尺寸"""
+        if self.memory_estimate is None:
+            job = self.tag if isinstance(self.tag, PdfJob) else inspect_pdf(self.input_pdf, self.render_dpi)
+            self.memory_estimate = estimate_job_memory(job, self.output_format)
+        return self.memory_estimate
+
+
+class StagedResult:
+    """
+    单个文件的处理结果
+
+    属性:
+        task: 对应的StagedTask
+        success: 是否成功写出加密后的PDF
+        password: 使用的密码
+        error: 失败原因
+        stage_seconds: 三个步骤（水印、安全转换、密码保护）在工作进程中的耗时
+        metrics: 渲染统计，例如灰度和RGB页数（gray_pages / rgb_pages）
+        output_hash: 输出文件的SHA-256
+        source_hash: 输入文件的SHA-256
+    """
+
+    def __init__(self, task, success, password="", error="", stage_seconds=None, metrics=None, output_hash="",
+                 source_hash=""):
+        self.task = task
+        self.success = success
+        self.password = password
+        self.error = error
+        self.stage_seconds = stage_seconds or []
+        self.metrics = metrics or {}
+        self.output_hash = output_hash
+        self.source_hash = source_hash
+
+
+def _render_task(input_pdf, student_name, watermark_text, watermark_image, dpi, output_format, colorspace,
+                 fingerprint=None, max_bytes=None):
+    """
+    工作进程：在内存中完成 水印 -> 安全转换 -> 加密，返回加密后的PDF内容
+
+    输入文件在工作进程中再映射一次，与读取线程共用操作系统页缓存中的同一份数据，
+    不需要把文件内容通过管道复制给工作进程
+
+    返回:
+        tuple: (加密后的PDF内容, 密码, 各步骤耗时, 渲染统计, 输出内容的SHA-256, 输入文件的SHA-256)
+    """
+    timer = StageTimer()
+    metrics = {}
+    options = ProtectOptions(student_name, watermark_text, watermark_image, dpi, output_format, colorspace,
+                             fingerprint=fingerprint, max_bytes=max_bytes)
+    source = PdfSource(input_pdf)
+    source_hash = hashlib.sha256(source.buffer).hexdigest()
+    data = protect_pdf(source, options, timer, metrics)
+    return data, options.password, timer.finish(), metrics, hashlib.sha256(data).hexdigest(), source_hash
+
+
+def _write_atomic(path, data):
+    """先写临时文件再重命名，其他程序不会读到写了一半的结果"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    partial = path + ".part"
+    with open(partial, "wb") as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+class StagedPipeline:
+    """
+    读取、计算、写出三个阶段重叠执行的批处理器
+
+    同时在内存中的文件数不超过 prefetch + max_workers + write_queue_size。
+    同时计算的文件数还受内存预算限制：按页面尺寸和DPI估算每个文件的内存峰值，
+    预算不足时等待正在处理的文件完成再提交，超出预算的大文件独占运行
+
+    参数:
+        max_workers: 计算进程数上限，默认与CPU核心数一致
+        prefetch: 提前读入的文件数，默认与计算进程数相同
+        write_queue_size: 等待写出的结果数上限
+        governor: MemoryGovernor，默认按当前可用内存创建
+        timeout: 每个文件的处理时间上限（秒），默认 config.JOB_TIMEOUT_SECONDS
+        pool: 使用已有的GuardedPool（例如 worker_pool.shared_pool()），批处理结束后不关闭；
+              为空时每次run创建新的进程池
+    """
+
+    def __init__(self, max_workers=None, prefetch=None, write_queue_size=2, governor=None, timeout=None,
+                 pool=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.prefetch = prefetch or self.max_workers
+        self.write_queue_size = write_queue_size
+        self.governor = governor or MemoryGovernor()
+        self.timeout = timeout
+        self.pool = pool
+        self._cancel_event = threading.Event()
+        self._pool = None
+
+    def cancel(self):
+        """
+        取消本次批处理（可从回调中调用）：尚未开始的文件不再处理，
+        正在处理的文件在下一页之前停下，它们都以"已取消"的失败结果回报
+        """
+        self._cancel_event.set()
+        pool = self._pool
+        if pool is not None:
+            pool.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def _reader(self, tasks, read_queue, done_queue, stop_event):
+        """读取线程：按顺序映射并预读文件，队列满时等待"""
+        for task in tasks:
+            if stop_event.is_set():
+                # 取消后剩下的文件不再读取，直接回报
+                done_queue.put(StagedResult(task, False, error="已取消"))
+                continue
+            try:
+                source = PdfSource(task.input_pdf)
+                source.prefetch()
+                task.estimate_memory()
+            except (OSError, ValueError) as e:
+                done_queue.put(StagedResult(task, False, error=f"读取失败: {str(e)}"))
+                continue
+            read_queue.put((task, source))
+        read_queue.put(None)
+
+    def _writer(self, write_queue, done_queue):
+        """写出线程：把加密后的结果写到输出目录"""
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
+            task, data, password, stage_seconds, metrics, output_hash, source_hash = item
+            try:
+                _write_atomic(task.final_output, data)
+                done_queue.put(StagedResult(task, True, password, stage_seconds=stage_seconds, metrics=metrics,
+                                            output_hash=output_hash, source_hash=source_hash))
+            except OSError as e:
+                done_queue.put(StagedResult(task, False, password, error=f"写出失败: {str(e)}"))
+
+    def run(self, tasks, callback=None, idle=None):
+        """
+        处理全部任务，阻塞直到完成
+
+        参数:
+            tasks: StagedTask列表，按列表顺序读取和提交
+            callback: 每完成一个文件调用一次 callback(StagedResult)，在调用run的线程中执行，
+                      可以直接更新界面
+            idle: 等待期间在调用线程中反复调用的函数（例如界面的 processEvents），为空时不调用
+
+        返回:
+            list: 按完成顺序排列的StagedResult
+        """
+        tasks = list(tasks)
+        read_queue = queue.Queue(maxsize=self.prefetch)
+        write_queue = queue.Queue(maxsize=self.write_queue_size)
+        done_queue = queue.Queue()
+        stop_event = threading.Event()
+        self._cancel_event.clear()
+
+        reader = threading.Thread(target=self._reader, args=(tasks, read_queue, done_queue, stop_event),
+                                  name="dotrix-reader", daemon=True)
+        writer = threading.Thread(target=self._writer, args=(write_queue, done_queue),
+                                  name="dotrix-writer", daemon=True)
+        reader.start()
+        writer.start()
+
+        # 已知页面尺寸的任务（tag为PdfJob）先估算内存，大文件多时少开几个进程
+        known = [task.estimate_memory() for task in tasks if isinstance(task.tag, PdfJob)]
+        max_workers = self.governor.worker_limit(known, self.max_workers)
+
+        results = []
+        in_flight = {}
+        held = None  # 已读入但内存预算不足、等待提交的文件
+        reading_done = False
+        try:
+            # 常驻进程池的工作进程已经预热，不随本批次关闭；同时处理的文件数仍由max_workers限制
+            pool_context = (GuardedPool(max_workers, timeout=self.timeout) if self.pool is None
+                            else nullcontext(self.pool))
+            with pool_context as pool:
+                self._pool = pool
+                while len(results) < len(tasks):
+                    if self._cancel_event.is_set():
+                        stop_event.set()
+                        pool.cancel()
+                    # 进程池有空闲且内存预算足够时提交已读入的文件
+                    while (held or not reading_done) and len(in_flight) < max_workers:
+                        if held is None:
+                            try:
+                                held = read_queue.get(timeout=0.05 if not in_flight else 0)
+                            except queue.Empty:
+                                break
+                            if held is None:
+                                reading_done = True
+                                break
+                        task, source = held
+                        if self._cancel_event.is_set():
+                            held = None
+                            source.release()
+                            done_queue.put(StagedResult(task, False, error="已取消"))
+                            continue
+                        if not self.governor.try_acquire(task.estimate_memory()):
+                            break
+                        held = None
+                        future = pool.submit(_render_task, task.input_pdf,
+                                             task.student_name, task.watermark_text,
+                                             task.watermark_image, task.dpi, task.output_format,
+                                             task.colorspace, task.fingerprint, task.max_bytes,
+                                             timeout=self.timeout,
+                                             memory_mb=memory_budget_mb(task.estimate_memory()))
+                        in_flight[future] = (task, source)
+
+                    # 计算完成的结果交给写出线程，写出队列满时在此等待（反压）
+                    if in_flight:
+                        finished, _ = wait(in_flight, timeout=0.05, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            task, source = in_flight.pop(future)
+                            # 工作进程已经读完输入，解除读取线程的映射
+                            source.release()
+                            self.governor.release(task.estimate_memory())
+                            try:
+                                write_queue.put((task,) + future.result())
+                            except (JobCancelled, CancelledError):
+                                done_queue.put(StagedResult(task, False, error="已取消"))
+                            except Exception as e:
+                                # 超时、超出内存预算的文件同样记为失败并附上原因
+                                done_queue.put(StagedResult(task, False, error=str(e)))
+
+                    # 在调用线程中回报已完成的文件
+                    while True:
+                        try:
+                            result = done_queue.get(timeout=0.05 if not in_flight and reading_done else 0)
+                        except queue.Empty:
+                            break
+                        results.append(result)
+                        if not result.success:
+                            print(f"处理文件 {result.task.input_pdf} 时出错: {result.error}")
+                        if callback:
+                            callback(result)
+                    if idle:
+                        idle()
+        finally:
+            self._pool = None
+            if self.pool is not None:
+                # 清除本批次的取消状态，常驻进程池继续用于下一批
+                self.pool.reset()
+            stop_event.set()
+            # 读取线程可能正阻塞在已满的队列上，清空后它才能退出
+            while reader.is_alive() or not read_queue.empty():
+                try:
+                    item = read_queue.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+                if item is not None:
+                    item[1].release()
+            if held is not None:
+                held[1].release()
+            for task, source in in_flight.values():
+                source.release()
+                self.governor.release(task.estimate_memory())
+            write_queue.put(None)
+            writer.join()
+
+        return results
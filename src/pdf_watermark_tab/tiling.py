@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+超大页面（海报、工程图纸）的分块渲染
+
+A0图纸在150DPI下约5000×7000像素，整页一次渲染需要上百MB的连续内存。
+超过 config.TILE_PIXEL_THRESHOLD 像素的页面改为按 config.TILE_SIZE 分块：
+每块单独渲染（get_pixmap的clip参数）、混合水印、编码，再作为相邻的图像放到输出页面上，
+内存峰值只与块大小有关，与页面尺寸无关
+"""
+
+import fitz  # PyMuPDF
+import numpy as np
+
+import config
+
+
+def page_pixel_size(page, dpi):
+    """页面按DPI渲染后的像素尺寸 (宽, 高)，与get_pixmap的结果一致"""
+    zoom = dpi / 72
+    irect = page.rect.transform(fitz.Matrix(zoom, zoom)).round()
+    return irect.width, irect.height
+
+
+def needs_tiling(width, height):
+    """像素数超过阈值的页面分块渲染，阈值为0时不分块"""
+    threshold = config.TILE_PIXEL_THRESHOLD
+    return threshold > 0 and width * height > threshold
+
+
+def tile_rects(width, height, tile_size=None):
+    """
+    将页面划分为不重叠的块
+
+    返回:
+        list: (x0, y0, x1, y1) 像素坐标，按行从上到下、从左到右排列
+    """
+    tile_size = max(64, tile_size or config.TILE_SIZE)
+    return [(x0, y0, min(x0 + tile_size, width), min(y0 + tile_size, height))
+            for y0 in range(0, height, tile_size)
+            for x0 in range(0, width, tile_size)]
+
+
+def render_region(page, dpi, rect, alpha=False, colorspace=fitz.csRGB):
+    """
+    渲染页面上的一个像素区域，结果与整页渲染后裁剪出的区域逐像素相同
+
+    参数:
+        page: fitz.Page
+        dpi: 渲染分辨率
+        rect: (x0, y0, x1, y1) 整页渲染结果中的像素坐标
+        alpha: 是否以透明背景渲染（输出预乘的RGBA）
+        colorspace: fitz.csRGB 或 fitz.csGRAY
+
+    返回:
+        numpy.ndarray: 形状为 (y1-y0, x1-x0, 通道数) 的uint8数组，可直接修改
+    """
+    x0, y0, x1, y1 = rect
+    zoom = dpi / 72
+    # 向外多渲染一个像素，浮点误差让渲染区域的像素原点向内偏移时也能覆盖整个区域
+    clip = fitz.Rect((x0 - 1) / zoom, (y0 - 1) / zoom, (x1 + 1) / zoom, (y1 + 1) / zoom)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=colorspace, alpha=alpha)
+    samples = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+    # 按像素原点对齐后只复制与请求区域重叠的部分，原点在区域左上角之内或之外都可以，没有覆盖到的像素补齐
+    region = np.full((y1 - y0, x1 - x0, pix.n), 0 if alpha else 255, dtype=np.uint8)
+    left, top = max(x0, pix.x), max(y0, pix.y)
+    right, bottom = min(x1, pix.x + pix.width), min(y1, pix.y + pix.height)
+    if right > left and bottom > top:
+        region[top - y0:bottom - y0, left - x0:right - x0] = \
+            samples[top - pix.y:bottom - pix.y, left - pix.x:right - pix.x]
+    return region
+
+
+def insert_tile(page, pixels, rect):
+    """
+    把一块RGB或灰度像素作为单独的图像放到输出页面上的对应位置（输出页面以像素为单位）
+
+    插入的图像在文档中以未压缩的形式保存到最后保存时才压缩，这里插入后立即压缩，
+    已完成的块不会在内存中累积
+
+    返回:
+        int: 图像的xref
+    """
+    height, width = pixels.shape[:2]
+    gray = pixels.ndim == 2 or pixels.shape[2] == 1
+    data = np.ascontiguousarray(pixels).tobytes()
+    pix = fitz.Pixmap(fitz.csGRAY if gray else fitz.csRGB, width, height, data, 0)
+    xref = page.insert_image(fitz.Rect(*rect), pixmap=pix)
+    page.parent.update_stream(xref, data, compress=True)
+    return xref
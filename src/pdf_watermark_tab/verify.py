@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+输出校验模块，批处理完成后确认每个输出文件确实可用
+
+多进程并行地重新打开每个输出：能用学生密码打开、页数与源文件一致、文件没有被截断
+（结尾有%%EOF，打开时不需要修复），同时计算SHA-256并记录是否线性化（快速网页查看），结果写入输出目录中的校验清单（JSON）。
+再次校验同一目录时，大小和修改时间都没有变化、上次校验通过的文件直接沿用清单中的结果，
+只有新增或变化的文件需要重新打开
+"""
+
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import fitz  # PyMuPDF
+
+from src.pdf_watermark_tab.loader import PdfSource
+from src.pdf_watermark_tab.pdf_password import get_student_password, is_linearized
+import config
+
+
+MANIFEST_VERSION = 1
+
+
+class VerifyResult:
+    """
+    单个输出文件的校验结果
+
+    属性:
+        output: 输出文件路径
+        ok: 是否通过校验
+        error: 未通过的原因
+        pages: 输出文件的页数
+        source_pages: 源文件的页数，没有源文件时为None
+        sha256: 输出文件的SHA-256
+        cached: 是否沿用了校验清单中的结果
+        linearized: 是否为线性化（快速网页查看）文件
+    """
+
+    def __init__(self, output, ok=False, error="", pages=0, source_pages=None, sha256="", cached=False,
+                 linearized=False):
+        self.output = output
+        self.ok = ok
+        self.error = error
+        self.pages = pages
+        self.source_pages = source_pages
+        self.sha256 = sha256
+        self.cached = cached
+        self.linearized = linearized
+
+
+def _stat(path):
+    """文件的 (大小, 修改时间ns)，不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def verify_output(output, password, source=None):
+    """
+    校验一个加密后的输出文件
+
+    参数:
+        output: 输出文件路径
+        password: 打开密码
+        source: 源文件路径，提供时比较页数
+
+    返回:
+        VerifyResult
+    """
+    result = VerifyResult(output)
+    try:
+        with PdfSource(output) as pdf:
+            result.sha256 = hashlib.sha256(pdf.buffer).hexdigest()
+            # 写了一半的文件没有结尾的%%EOF
+            if b"%%EOF" not in bytes(pdf.buffer[-1024:]):
+                result.error = "文件不完整（缺少%%EOF）"
+                return result
+            # 只做记录：没有安装pikepdf的机器和更早生成的输出不是线性化的，但同样可用
+            result.linearized = is_linearized(pdf.buffer)
+            doc = pdf.open_document()
+            if doc.is_repaired:
+                result.error = "文件已损坏（打开时需要修复）"
+                return result
+            # 没有加密的输出正是校验要发现的问题之一（缺少密码保护）
+            if not doc.needs_pass:
+                result.error = "没有加密（打开时不需要密码）"
+                return result
+            if not doc.authenticate(password):
+                result.error = "无法用学生密码打开"
+                return result
+            result.pages = doc.page_count
+            if result.pages == 0:
+                result.error = "没有页面"
+                return result
+            # 加载最后一页，确认页面树完整
+            doc.load_page(result.pages - 1)
+        if source:
+            with fitz.open(source) as source_doc:
+                result.source_pages = source_doc.page_count
+            if result.source_pages != result.pages:
+                result.error = f"页数不一致（源文件 {result.source_pages} 页，输出 {result.pages} 页）"
+                return result
+        result.ok = True
+    except Exception as e:
+        result.error = f"无法打开: {str(e)}"
+    return result
+
+
+class VerifyManifest:
+    """
+    校验清单，记录每个输出文件的大小、修改时间、SHA-256、页数和校验结果
+
+    参数:
+        path: 清单文件路径，默认放在输出目录中（config.VERIFY_MANIFEST_FILE）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.files = data.get("files", {})
+        except (OSError, ValueError):
+            pass
+
+    def _key(self, output):
+        return os.path.relpath(output, os.path.dirname(os.path.abspath(self.path)))
+
+    def cached_result(self, output, source=None):
+        """文件和源文件都没有变化且上次校验通过时，返回清单中的结果，否则返回None"""
+        entry = self.files.get(self._key(output))
+        if not entry or not entry.get("ok"):
+            return None
+        if entry.get("stat") != _stat(output) or entry.get("source_stat") != (_stat(source) if source else None):
+            return None
+        return VerifyResult(output, True, pages=entry.get("pages", 0), source_pages=entry.get("source_pages"),
+                            sha256=entry.get("sha256", ""), cached=True,
+                            linearized=entry.get("linearized", False))
+
+    def update(self, result, source=None):
+        self.files[self._key(result.output)] = {
+            "stat": _stat(result.output),
+            "source": source,
+            "source_stat": _stat(source) if source else None,
+            "sha256": result.sha256,
+            "pages": result.pages,
+            "source_pages": result.source_pages,
+            "linearized": result.linearized,
+            "ok": result.ok,
+            "error": result.error,
+        }
+
+    def save(self):
+        """先写临时文件再替换，中途退出不会留下损坏的清单"""
+        partial = self.path + ".part"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f, ensure_ascii=False, indent=1)
+        os.replace(partial, self.path)
+
+
+def verify_outputs(entries, manifest_path=None, max_workers=None, callback=None):
+    """
+    并行校验一批输出文件，并更新校验清单
+
+    参数:
+        entries: (输出文件, 密码, 源文件或None) 列表
+        manifest_path: 校验清单路径，为空时不使用清单
+        max_workers: 进程数，默认与CPU核心数一致
+        callback: 每校验完一个文件调用一次 callback(VerifyResult)
+
+    返回:
+        list: 与entries顺序一致的VerifyResult
+    """
+    manifest = VerifyManifest(manifest_path) if manifest_path else None
+    results = [None] * len(entries)
+    pending = []
+    for i, (output, password, source) in enumerate(entries):
+        cached = manifest.cached_result(output, source) if manifest else None
+        if cached is not None:
+            results[i] = cached
+            if callback:
+                callback(cached)
+        else:
+            pending.append(i)
+
+    def finish(i, result):
+        results[i] = result
+        if manifest:
+            manifest.update(result, entries[i][2])
+        if callback:
+            callback(result)
+
+    if len(pending) <= 1:
+        # 只有一个文件时不值得启动进程池
+        for i in pending:
+            finish(i, verify_output(*entries[i]))
+    else:
+        workers = min(max_workers or os.cpu_count() or 1, len(pending))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(verify_output, *entries[i]): i for i in pending}
+            # 按完成顺序回报进度
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = VerifyResult(entries[i][0], error=f"校验进程出错: {str(e)}")
+                finish(i, result)
+
+    if manifest and pending:
+        manifest.save()
+    return results
+
+
+def verify_directory(output_dir, source_dir=None, max_workers=None, callback=None):
+    """
+    校验输出目录中的所有输出文件（*_可用chrome打开.pdf）
+
+    学生姓名和源文件名从输出文件名中解析，密码按学生姓名的拼音计算；
+    提供source_dir时同时与源文件比较页数
+
+    返回:
+        list: VerifyResult
+    """
+    suffix = "_可用chrome打开.pdf"
+    entries = []
+    for filename in sorted(os.listdir(output_dir)):
+        if not filename.endswith(suffix):
+            continue
+        name, _, student_name = filename[:-len(suffix)].rpartition("_")
+        source = os.path.join(source_dir, name + ".pdf") if source_dir else None
+        if source and not os.path.isfile(source):
+            source = None
+        entries.append((os.path.join(output_dir, filename), get_student_password(student_name), source))
+    manifest_path = os.path.join(output_dir, config.VERIFY_MANIFEST_FILE)
+    return verify_outputs(entries, manifest_path, max_workers, callback)
@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+监控文件夹服务模块
+
+监控收件目录（Linux下使用inotify，其他系统或网络共享目录使用轮询），
+新放入的PDF写入完成后自动经过 水印 -> 安全转换 -> 密码保护 流水线，
+结果移动到发件目录，无需打开界面手动批量处理。
+
+每个子文件夹可以放置一个 dotrix.json 配置学生名和DPI，例如:
+    {"student_name": "张三", "dpi": 150}
+可选的 "colorspace"（auto / rgb / gray）指定渲染颜色空间，"max_size_mb" 限制输出文件大小。
+未配置的目录沿用上级目录的配置。
+处理失败（包括超时）的源文件移入 .failed，旁边的 .error.txt 记录失败原因。
+"""
+
+import os
+import json
+import time
+import select
+import shutil
+import struct
+import ctypes
+import ctypes.util
+import tempfile
+import threading
+from datetime import datetime
+
+from src.pdf_watermark_tab.watermark_core import build_watermark_text
+from src.pdf_watermark_tab.pipeline import process_pdf, check_dpi
+from src.pdf_watermark_tab.scheduler import ThroughputStats, inspect_pdf
+from src.pdf_watermark_tab.memory_governor import MemoryGovernor, estimate_job_memory
+from src.pdf_watermark_tab.fingerprint import new_fingerprint
+from src.pdf_watermark_tab.size_target import max_bytes_from_mb
+from src.pdf_watermark_tab.ledger import DistributionLedger, IssuedCopy, file_sha256
+from src.pdf_watermark_tab.job_guard import GuardedPool, memory_budget_mb
+from src.pdf_watermark_tab.worker_pool import warm_up
+import config
+
+
+# 每个目录的配置文件名
+FOLDER_CONFIG_NAME = "dotrix.json"
+
+# 收件目录中存放已处理和处理失败源文件的目录（以点开头，不会被再次扫描）
+DONE_DIR_NAME = ".done"
+FAILED_DIR_NAME = ".failed"
+
+# inotify事件掩码
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _InotifyWatcher:
+    """基于ctypes的最小inotify封装，递归监控目录"""
+
+    def __init__(self, root):
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        self._dirs = {}
+        self.add_tree(root)
+
+    def add_tree(self, root):
+        """监控root及其所有未隐藏的子目录"""
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            self._add_watch(dirpath)
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), _WATCH_MASK)
+        if wd >= 0:
+            self._dirs[wd] = path
+
+    def read_events(self, timeout):
+        """
+        等待并读取事件
+
+        返回:
+            tuple: (有变化的文件路径集合, 是否发生队列溢出需要全量扫描)
+        """
+        changed = set()
+        overflow = False
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return changed, overflow
+
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return changed, overflow
+
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+
+            if mask & _IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            if mask & _IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+
+            parent = self._dirs.get(wd)
+            if parent is None or not name:
+                continue
+            path = os.path.join(parent, os.fsdecode(name))
+            if mask & _IN_ISDIR:
+                if not os.path.basename(path).startswith("."):
+                    # 新建的子目录也需要监控，并扫描其中已有的文件
+                    self.add_tree(path)
+                    overflow = True
+            else:
+                changed.add(path)
+        return changed, overflow
+
+    def close(self):
+        os.close(self._fd)
+
+
+def load_folder_config(folder, root):
+    """
+    读取对folder生效的配置，从folder向上查找到root为止的第一个dotrix.json
+
+    返回:
+        dict: 配置内容，未找到时为空字典
+    """
+    folder = os.path.abspath(folder)
+    root = os.path.abspath(root)
+    while True:
+        config_path = os.path.join(folder, FOLDER_CONFIG_NAME)
+        if os.path.exists(config_path):
+            try:
+                with open(config_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"读取配置文件 {config_path} 时出错: {str(e)}")
+                return {}
+            if not isinstance(data, dict):
+                print(f"配置文件 {config_path} 的内容不是JSON对象，已忽略")
+                return {}
+            return data
+        if folder == root or os.path.dirname(folder) == folder:
+            return {}
+        folder = os.path.dirname(folder)
+
+
+def _looks_complete(path):
+    """检查PDF末尾是否已有%%EOF标记，用于排除仍在写入的文件"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(max(0, size - 1024))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+def _deliver(source, target):
+    """
+    把结果文件放入发件目录
+
+    先以临时文件名复制再重命名，发件目录在网络共享上时接收方不会看到写了一半的文件
+    """
+    try:
+        os.replace(source, target)
+    except OSError:
+        partial = target + ".part"
+        shutil.copyfile(source, partial)
+        os.replace(partial, target)
+        os.remove(source)
+
+
+def _run_job(input_pdf, work_dir, student_name, watermark_text, dpi, colorspace=None, fingerprint=None,
+             max_bytes=None):
+    """
+    工作进程：在独立的临时目录中执行完整流水线
+
+    返回:
+        tuple: (输出文件, 渲染统计, 密码, 输出文件的SHA-256, 输入文件的SHA-256)
+    """
+    metrics = {}
+    final_output, success, password = process_pdf(input_pdf, work_dir, student_name, watermark_text, dpi=dpi,
+                                                  colorspace=colorspace, metrics=metrics, fingerprint=fingerprint,
+                                                  max_bytes=max_bytes)
+    if not success:
+        raise RuntimeError("添加密码保护失败")
+    return final_output, metrics, password, file_sha256(final_output), file_sha256(input_pdf)
+
+
+class WatchFolderService:
+    """
+    监控收件目录并自动处理新放入的PDF
+
+    参数:
+        inbox: 收件目录
+        outbox: 发件目录，保持与收件目录相同的子目录结构
+        max_workers: 工作进程数，默认与CPU核心数一致
+        settle_seconds: 文件大小和修改时间保持不变多久后才认为写入完成
+        poll_interval: 轮询模式下的扫描间隔（inotify模式下作为兜底全量扫描间隔的基数）
+        use_inotify: 是否尝试使用inotify，不可用时自动退回轮询
+    """
+
+    def __init__(self, inbox, outbox, max_workers=None, settle_seconds=1.0,
+                 poll_interval=2.0, use_inotify=True):
+        self.inbox = os.path.abspath(inbox)
+        self.outbox = os.path.abspath(outbox)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+
+        self._stop_event = threading.Event()
+        self._candidates = {}   # 路径 -> (大小, 修改时间, 最近一次变化的时间)
+        self._in_flight = {}    # future -> (源文件, 临时目录, 相对目录, 预计内存峰值, 学生名, 水印文字, 指纹)
+        self._waiting = []      # 已写入完成、等待内存预算的文件
+        self._stats = ThroughputStats()
+        self._governor = MemoryGovernor()
+        self._ledger = None
+
+    def stop(self):
+        """请求服务停止（可从其他线程或信号处理函数调用）"""
+        self._stop_event.set()
+
+    def _scan_inbox(self):
+        """全量扫描收件目录，把所有PDF加入候选列表"""
+        for dirpath, dirnames, filenames in os.walk(self.inbox):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for filename in filenames:
+                self._note_change(os.path.join(dirpath, filename))
+
+    def _is_queued(self, path):
+        """文件是否已在等待内存预算或正在处理，全量扫描再次看到时不能重复加入"""
+        return (any(path == item[0] for item in self._waiting)
+                or any(path == job[0] for job in self._in_flight.values()))
+
+    def _note_change(self, path):
+        """记录文件变化，只关心PDF"""
+        if not path.lower().endswith(".pdf") or os.path.basename(path).startswith("."):
+            return
+        if self._is_queued(path):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._candidates.pop(path, None)
+            return
+        previous = self._candidates.get(path)
+        if previous is None or previous[:2] != (stat.st_size, stat.st_mtime):
+            self._candidates[path] = (stat.st_size, stat.st_mtime, time.monotonic())
+
+    def _submit_settled(self, pool):
+        """把写入完成（去抖动后稳定）的文件提交给工作进程"""
+        now = time.monotonic()
+        ready = []
+        for path, (size, mtime, changed_at) in list(self._candidates.items()):
+            if now - changed_at < self.settle_seconds:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self._candidates[path]
+                continue
+            if (stat.st_size, stat.st_mtime) != (size, mtime):
+                self._candidates[path] = (stat.st_size, stat.st_mtime, now)
+                continue
+            if size == 0:
+                continue
+            # 末尾没有%%EOF时多等一会儿，个别PDF结尾带有多余数据，长时间稳定后仍然处理
+            if not _looks_complete(path) and now - changed_at < max(10.0, 10 * self.settle_seconds):
+                continue
+
+            del self._candidates[path]
+            if self._is_queued(path):
+                continue
+            folder_config = load_folder_config(os.path.dirname(path), self.inbox)
+            student_name = str(folder_config.get("student_name", "")).strip()
+            if not student_name:
+                # 留在收件目录中每次全量扫描都会再次看到，与配置错误一样移入 .failed 并记录原因
+                reason = f"目录中没有配置学生名（{FOLDER_CONFIG_NAME}）"
+                print(f"跳过 {path}: {reason}")
+                self._archive_source(path, FAILED_DIR_NAME, reason)
+                continue
+            ready.append((path, folder_config, student_name))
+
+        # 同时就绪多个文件时大文件优先提交，避免最后只剩一个大文件占着一个进程
+        for path, folder_config, student_name in ready:
+            # 配置写错或文件无法读取只影响这一个文件，移入 .failed 并记录原因，服务继续运行
+            try:
+                dpi = check_dpi(folder_config.get("dpi", 150))
+                max_bytes = max_bytes_from_mb(folder_config.get("max_size_mb"))
+                job = inspect_pdf(path, dpi)
+                if job.pages <= 0:
+                    raise ValueError("无法读取PDF")
+            except Exception as e:
+                print(f"处理文件 {path} 时出错: {str(e)}")
+                self._archive_source(path, FAILED_DIR_NAME, str(e))
+                continue
+            self._waiting.append((path, folder_config, student_name, job, dpi, max_bytes))
+        self._waiting.sort(key=lambda item: self._stats.predict(item[3]), reverse=True)
+
+        while self._waiting and len(self._in_flight) < self.max_workers:
+            path, folder_config, student_name, job, dpi, max_bytes = self._waiting[0]
+            estimate = estimate_job_memory(job, config.SECURE_OUTPUT_FORMAT)
+            if not self._governor.try_acquire(estimate):
+                break  # 内存预算不足，等正在处理的文件完成后再提交
+            self._waiting.pop(0)
+            relative_dir = os.path.relpath(os.path.dirname(path), self.inbox)
+            watermark_text = folder_config.get("watermark_text") or build_watermark_text(
+                student_name, datetime.now().strftime("%Y-%m-%d %H:%M"))
+            work_dir = tempfile.mkdtemp(prefix="dotrix_watch_")
+            fingerprint = new_fingerprint(self._ledger) if config.FINGERPRINT_ENABLED else None
+            future = pool.submit(_run_job, path, work_dir, student_name, watermark_text, dpi,
+                                 folder_config.get("colorspace"), fingerprint, max_bytes,
+                                 memory_mb=memory_budget_mb(estimate))
+            self._in_flight[future] = (path, work_dir, relative_dir, estimate, student_name, watermark_text,
+                                       fingerprint)
+            print(f"开始处理: {path}（学生: {student_name}, DPI: {dpi}）")
+
+    def _collect_finished(self):
+        """把已完成任务的结果移动到发件目录，源文件移入 .done 或 .failed，本轮发出的文件一起记入台账"""
+        issued = []
+        for future in [f for f in self._in_flight if f.done()]:
+            (source, work_dir, relative_dir, estimate, student_name, watermark_text,
+             fingerprint) = self._in_flight.pop(future)
+            self._governor.release(estimate)
+            try:
+                final_output, metrics, password, output_hash, source_hash = future.result()
+                target_dir = os.path.normpath(os.path.join(self.outbox, relative_dir))
+                os.makedirs(target_dir, exist_ok=True)
+                target = os.path.join(target_dir, os.path.basename(final_output))
+                _deliver(final_output, target)
+                issued.append(IssuedCopy(student_name, source, target, output_hash, password, watermark_text,
+                                         source_hash, fingerprint))
+                self._archive_source(source, DONE_DIR_NAME)
+                print(f"已完成: {source} -> {target_dir}"
+                      f"（灰度 {metrics.get('gray_pages', 0)} 页，彩色 {metrics.get('rgb_pages', 0)} 页）")
+            except Exception as e:
+                print(f"处理文件 {source} 时出错: {str(e)}")
+                self._archive_source(source, FAILED_DIR_NAME, str(e))
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        if issued and self._ledger is not None:
+            self._ledger.record(issued)
+
+    def _archive_source(self, source, archive_name, reason=None):
+        """将源文件移出收件目录，避免重复处理；提供失败原因时写在旁边的 .error.txt 中"""
+        archive_dir = os.path.join(self.inbox, archive_name, os.path.relpath(os.path.dirname(source), self.inbox))
+        archive_dir = os.path.normpath(archive_dir)
+        try:
+            os.makedirs(archive_dir, exist_ok=True)
+            target = os.path.join(archive_dir, os.path.basename(source))
+            if os.path.exists(target):
+                name, ext = os.path.splitext(os.path.basename(source))
+                target = os.path.join(archive_dir, f"{name}_{datetime.now().strftime('%Y%m%d%H%M%S')}{ext}")
+            shutil.move(source, target)
+            if reason:
+                with open(target + ".error.txt", "w", encoding="utf-8") as f:
+                    f.write(reason + "\n")
+        except OSError as e:
+            print(f"移动源文件 {source} 时出错: {str(e)}")
+
+    def run(self):
+        """运行服务直到调用stop()"""
+        os.makedirs(self.inbox, exist_ok=True)
+        os.makedirs(self.outbox, exist_ok=True)
+        if config.LEDGER_ENABLED:
+            self._ledger = DistributionLedger()
+
+        watcher = None
+        if self.use_inotify and hasattr(os, "O_CLOEXEC"):
+            try:
+                watcher = _InotifyWatcher(self.inbox)
+                print(f"使用inotify监控: {self.inbox}")
+            except (OSError, AttributeError) as e:
+                print(f"inotify不可用（{str(e)}），改用轮询方式")
+        if watcher is None:
+            print(f"使用轮询方式监控: {self.inbox}（间隔 {self.poll_interval} 秒）")
+
+        # 网络共享目录上inotify可能收不到事件，定期全量扫描兜底
+        full_scan_interval = self.poll_interval if watcher is None else max(30.0, self.poll_interval)
+        next_full_scan = 0.0
+
+        # 每个文件有时间和内存预算，卡住的文件超时后记为失败，不会拖住后面的文件
+        with GuardedPool(self.max_workers, initializer=warm_up) as pool:
+            try:
+                while not self._stop_event.is_set():
+                    now = time.monotonic()
+                    if now >= next_full_scan:
+                        self._scan_inbox()
+                        next_full_scan = now + full_scan_interval
+
+                    if watcher is not None:
+                        changed, overflow = watcher.read_events(timeout=0.25)
+                        for path in changed:
+                            self._note_change(path)
+                        if overflow:
+                            next_full_scan = 0.0
+                    else:
+                        self._stop_event.wait(0.25)
+
+                    self._submit_settled(pool)
+                    self._collect_finished()
+            finally:
+                if watcher is not None:
+                    watcher.close()
+                # 等待正在处理的任务完成后再退出
+                while self._in_flight:
+                    time.sleep(0.2)
+                    self._collect_finished()
+                if self._ledger is not None:
+                    self._ledger.close()
+                    self._ledger = None
@@ -1,15 +1,17 @@
 from PIL import Image
 from reportlab.pdfgen import canvas
 import os
-import tempfile
+import io
 import math
 import sys
+import zlib
 import random
 from reportlab.lib.colors import Color
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from PyPDF2 import PdfReader, PdfWriter
 import config
+from src.pdf_watermark_tab.job_guard import checkpoint
 
 
 # 获取可执行文件目录（处理PyInstaller打包的情况）
@@ -61,6 +63,34 @@ if not font_registered:
         print("警告：无法从系统目录加载宋体字体文件，将使用默认字体")
 
 
+# 按 (路径, 修改时间) 缓存的水印图片尺寸，每页都要用到，不需要每页重新解码图片
+_logo_sizes = {}
+
+
+def english_logo_path():
+    """英文LOGO水印图片路径"""
+    return os.path.join(get_application_path(), config.PICTURES_DIR, "dotrix_logo_eng.png")
+
+
+def logo_size(image_path):
+    """
+    水印图片的像素尺寸，同一进程中只读取一次
+
+    参数:
+        image_path: 图片路径
+
+    返回:
+        tuple: (宽, 高)
+    """
+    key = (image_path, os.path.getmtime(image_path))
+    size = _logo_sizes.get(key)
+    if size is None:
+        with Image.open(image_path) as img:
+            size = img.size
+        _logo_sizes[key] = size
+    return size
+
+
 def _add_center_image_watermark(c, watermark_image, page_width, page_height, img_scale, img_opacity):
     """
     在PDF页面中心添加图片水印
@@ -76,16 +106,10 @@ def _add_center_image_watermark(c, watermark_image, page_width, page_height, img
     返回:
         元组 (new_width, new_height): 调整后的图片尺寸
     """
-    # 打开水印图片
-    img = Image.open(watermark_image)
-    if img.mode != 'RGBA':
-        img = img.convert('RGBA')
-    
-    # 调整图片尺寸
-    img_width, img_height = img.size
+    # 调整图片尺寸（图片由drawImage按尺寸缩放，这里只需要原始尺寸）
+    img_width, img_height = logo_size(watermark_image)
     new_width = int(img_width * img_scale)
     new_height = int(img_height * img_scale)
-    img = img.resize((new_width, new_height), Image.LANCZOS)
     
     # 计算图片在页面上的居中位置
     x_centered = (page_width - new_width) / 2
@@ -115,23 +139,16 @@ def _add_english_logo_watermark(c, page_width, page_height, img_scale, img_opaci
         bool: 是否成功添加英文水印
     """
     # 准备英文水印图片
-    app_path = get_application_path()
-    eng_watermark_path = os.path.join(app_path, config.PICTURES_DIR, "dotrix_logo_eng.png")
+    eng_watermark_path = english_logo_path()
     
     if not os.path.exists(eng_watermark_path):
         return False
     
-    # 打开英文水印图片
-    eng_img = Image.open(eng_watermark_path)
-    if eng_img.mode != 'RGBA':
-        eng_img = eng_img.convert('RGBA')
-    
     # 调整英文水印图片尺寸 - 使用更小的缩放比例
-    eng_img_width, eng_img_height = eng_img.size
+    eng_img_width, eng_img_height = logo_size(eng_watermark_path)
     eng_scale = img_scale * 0.2  # 比主水印小80%
     eng_new_width = int(eng_img_width * eng_scale)
     eng_new_height = int(eng_img_height * eng_scale)
-    eng_img = eng_img.resize((eng_new_width, eng_new_height), Image.LANCZOS)
     
     # 生成随机位置，确保图片完全在页面内
     rand_x = random.uniform(eng_new_width/2, page_width - eng_new_width)
@@ -146,6 +163,30 @@ def _add_english_logo_watermark(c, page_width, page_height, img_scale, img_opaci
     return True
 
 
+def _text_form(c, text, font_name, font_size, angle):
+    """
+    把以原点为中心、旋转指定角度的一行文字定义为Form XObject，返回Form名称
+    
+    同一个canvas（即同一个水印文档）中参数相同的文字只定义一次，
+    各页各位置通过doForm引用，内容流中不再重复写入相同的字形。
+    Form中不设置颜色，填充颜色和透明度沿用调用doForm时页面上的设置
+    """
+    key = f"{text}|{font_name}|{font_size}|{angle}"
+    form_name = f"WmText{zlib.crc32(key.encode('utf-8')):08x}"
+    if c.hasForm(form_name):
+        return form_name
+    
+    text_width = c.stringWidth(text, font_name, font_size)
+    # 旋转后的包围盒不超过以文字半长加字号为半径的正方形
+    radius = text_width / 2 + font_size
+    c.beginForm(form_name, lowerx=-radius, lowery=-radius, upperx=radius, uppery=radius)
+    c.setFont(font_name, font_size)
+    c.rotate(angle)
+    c.drawString(-text_width/2, -font_size/2, text)
+    c.endForm()
+    return form_name
+
+
 def _add_grid_text_watermarks(c, watermark_text, page_width, page_height, font_name, font_size, text_opacity, angle, rows, cols):
     """
     在PDF页面添加网格形式的文字水印
@@ -165,10 +206,9 @@ def _add_grid_text_watermarks(c, watermark_text, page_width, page_height, font_n
     # 设置字体和颜色
     watermark_color = Color(0, 0, 0, alpha=text_opacity)
     
-    if font_name in pdfmetrics._fonts:
-        c.setFont(font_name, font_size)
-    else:
-        c.setFont("Helvetica", font_size)  # 默认字体
+    if font_name not in pdfmetrics._fonts:
+        font_name = "Helvetica"  # 默认字体
+    c.setFont(font_name, font_size)
         
     c.setFillColor(watermark_color)
     
@@ -192,6 +232,9 @@ def _add_grid_text_watermarks(c, watermark_text, page_width, page_height, font_n
     row_spacing = page_height / (rows + 1)  # +1 是为了在边缘留出空间
     col_spacing = page_width / (actual_cols + 1)   # +1 是为了在边缘留出空间
     
+    # 旋转后的文字只定义一次为Form XObject，每个网格点按引用放置
+    form_name = _text_form(c, watermark_text, font_name, font_size, angle)
+    
     # 在页面上添加网格状水印
     for i in range(rows):
         y_pos = (i + 1) * row_spacing
@@ -202,17 +245,10 @@ def _add_grid_text_watermarks(c, watermark_text, page_width, page_height, font_n
         for j in range(actual_cols):
             x_pos = offset + (j + 1) * col_spacing
             
-            # 保存状态以便旋转
+            # 将原点移到网格中的每个点后放置水印文字
             c.saveState()
-            
-            # 将原点移到网格中的每个点
             c.translate(x_pos, y_pos)
-            # 旋转指定角度（角度转弧度）
-            c.rotate(angle)
-            # 绘制文字
-            c.drawString(-text_width/2, -text_height/2, watermark_text)
-            
-            # 恢复状态
+            c.doForm(form_name)
             c.restoreState()
     
     return actual_cols
@@ -229,36 +265,74 @@ def _add_horizontal_text_watermarks(c, watermark_text, page_width, page_height,
         page_height: 页面高度
         font_name: 字体名称
     """
-    # 设置小字号，不透明黑色
+    # 设置小字号
     horizontal_size = 7  # 小字号
-    c.setFont(font_name, horizontal_size)
-    c.setFillColor(Color(0, 0, 0, alpha=1.0))  # 不透明黑色
+    if font_name not in pdfmetrics._fonts:
+        font_name = "Helvetica"  # 默认字体
     
     # 生成3个随机位置的水平水印
     horizontal_text_width = c.stringWidth(watermark_text, font_name, horizontal_size)
     
-    for _ in range(3):
-        # 生成随机位置
-        rand_x = random.uniform(horizontal_text_width/2, page_width - horizontal_text_width/2)
-        rand_y = random.uniform(horizontal_size*2, page_height - horizontal_size*2)
-        
-        # 绘制水平文字
-        c.saveState()
-        c.drawString(rand_x - horizontal_text_width/2, rand_y, watermark_text)
-        c.restoreState()
-    
-    # 添加3个白色水平水印
-    c.setFillColor(Color(1, 1, 1, alpha=1.0))  # 不透明白色
-    
-    for _ in range(3):
-        # 生成随机位置（与黑色水印位置不同）
-        rand_x = random.uniform(horizontal_text_width/2, page_width - horizontal_text_width/2)
-        rand_y = random.uniform(horizontal_size*2, page_height - horizontal_size*2)
+    # 水平文字定义一次为Form XObject，黑色和白色的随机位置都按引用放置
+    form_name = _text_form(c, watermark_text, font_name, horizontal_size, 0)
+    
+    for color in (Color(0, 0, 0, alpha=1.0), Color(1, 1, 1, alpha=1.0)):  # 不透明黑色、不透明白色
+        c.setFillColor(color)
         
-        # 绘制水平文字
-        c.saveState()
-        c.drawString(rand_x - horizontal_text_width/2, rand_y, watermark_text)
-        c.restoreState()
+        for _ in range(3):
+            # 生成随机位置（黑色和白色水印位置各不相同）
+            rand_x = random.uniform(horizontal_text_width/2, page_width - horizontal_text_width/2)
+            rand_y = random.uniform(horizontal_size*2, page_height - horizontal_size*2)
+            
+            # 绘制水平文字，Form中的文字以中心为原点
+            c.saveState()
+            c.translate(rand_x, rand_y + horizontal_size/2)
+            c.doForm(form_name)
+            c.restoreState()
+
+
+def _draw_watermark_page(c, watermark_image, watermark_text, page_width, page_height,
+                         img_scale, img_opacity, font_name, font_size, text_opacity,
+                         angle, rows, cols, add_horizontal):
+    """
+    在canvas当前页上绘制全部水印图层（PDF、视频、图片水印共用）
+    
+    参数:
+        c: PDF canvas对象
+        其余参数同 add_multiple_watermarks
+    
+    返回:
+        int: 实际使用的水印列数
+    """
+    # 1. 绘制中心图片水印
+    _add_center_image_watermark(c, watermark_image, page_width, page_height, img_scale, img_opacity)
+    
+    # 2. 添加英文水印图片在随机位置（如果存在）
+    _add_english_logo_watermark(c, page_width, page_height, img_scale, img_opacity)
+    
+    # 3. 绘制多条文字水印以网格形式分布
+    actual_cols = _add_grid_text_watermarks(c, watermark_text, page_width, page_height, 
+                                       font_name, font_size, text_opacity, angle, rows, cols)
+    
+    # 4. 添加随机位置的水平水印（跑马灯效果）
+    if add_horizontal:
+        _add_horizontal_text_watermarks(c, watermark_text, page_width, page_height, font_name)
+    
+    return actual_cols
+
+
+def build_watermark_text(student, datetime_text):
+    """
+    按统一格式构建水印文本
+    
+    参数:
+        student: 学生姓名
+        datetime_text: 日期时间字符串（yyyy-MM-dd HH:mm）
+    
+    返回:
+        str: 水印文本
+    """
+    return f"小红书号100135317 点线成面DOTRIX {student}同学 {datetime_text}"
 
 
 def add_multiple_watermarks(input_pdf, watermark_image, watermark_text, output_pdf, 
@@ -269,10 +343,10 @@ def add_multiple_watermarks(input_pdf, watermark_image, watermark_text, output_p
     在PDF的每一页添加多条文字水印和一个图片水印，以网格形式均匀分布
     
     参数:
-        input_pdf: 输入PDF文件路径
+        input_pdf: 输入PDF文件路径，或可读取的二进制文件对象
         watermark_image: 水印图片路径
         watermark_text: 水印文字内容
-        output_pdf: 输出PDF文件路径
+        output_pdf: 输出PDF文件路径，或可写入的二进制文件对象（例如io.BytesIO）
         img_scale: 图片缩放比例(0-1)
         img_opacity: 图片透明度(0-1)
         font_name: 字体名称
@@ -294,37 +368,31 @@ def add_multiple_watermarks(input_pdf, watermark_image, watermark_text, output_p
     pdf_reader = PdfReader(input_pdf)
     pdf_writer = PdfWriter()
     
-    # 处理每一页
-    for page_num in range(len(pdf_reader.pages)):
-        page = pdf_reader.pages[page_num]
+    # 整个文档的水印画在同一个canvas上（每页一个水印页），
+    # 水印文字Form和图片在文档中只保存一份，各页按引用使用
+    watermark_buffer = io.BytesIO()
+    c = canvas.Canvas(watermark_buffer)
+    actual_cols = cols
+    for page in pdf_reader.pages:
+        checkpoint()
         page_width = float(page.mediabox.width)
         page_height = float(page.mediabox.height)
+        c.setPageSize((page_width, page_height))
         
-        # 创建一个临时PDF作为水印
-        watermark_pdf = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        c = canvas.Canvas(watermark_pdf.name, pagesize=(page_width, page_height))
-        
-        # 1. 绘制中心图片水印
-        _add_center_image_watermark(c, watermark_image, page_width, page_height, img_scale, img_opacity)
-        
-        # 2. 添加英文水印图片在随机位置（如果存在）
-        _add_english_logo_watermark(c, page_width, page_height, img_scale, img_opacity)
-        
-        # 3. 绘制多条文字水印以网格形式分布
-        actual_cols = _add_grid_text_watermarks(c, watermark_text, page_width, page_height, 
-                                           font_name, font_size, text_opacity, angle, rows, cols)
-        
-        # 4. 添加随机位置的水平水印（跑马灯效果）
-        if add_horizontal:
-            _add_horizontal_text_watermarks(c, watermark_text, page_width, page_height, font_name)
-        
-        c.save()
-        
-        # 关闭临时文件
-        watermark_pdf.close()
-        
-        watermark_reader = PdfReader(watermark_pdf.name)
-        watermark_page = watermark_reader.pages[0]
+        # 绘制所有水印图层
+        actual_cols = _draw_watermark_page(c, watermark_image, watermark_text, page_width, page_height,
+                                           img_scale, img_opacity, font_name, font_size, text_opacity,
+                                           angle, rows, cols, add_horizontal)
+        c.showPage()
+    c.save()
+    
+    watermark_reader = PdfReader(io.BytesIO(watermark_buffer.getvalue()))
+    
+    # 处理每一页
+    for page_num in range(len(pdf_reader.pages)):
+        checkpoint()
+        page = pdf_reader.pages[page_num]
+        watermark_page = watermark_reader.pages[page_num]
         
         # 根据on_top参数决定水印是在顶层还是底层
         if on_top:
@@ -335,16 +403,19 @@ def add_multiple_watermarks(input_pdf, watermark_image, watermark_text, output_p
             # 将原始页面合并到水印页面上（水印在底层）
             watermark_page.merge_page(page)
             pdf_writer.add_page(watermark_page)
-        
-        # 清理临时文件
-        os.unlink(watermark_pdf.name)
     
     # 写入输出文件
-    with open(output_pdf, 'wb') as f:
-        pdf_writer.write(f)
+    if hasattr(output_pdf, 'write'):
+        pdf_writer.write(output_pdf)
+    else:
+        with open(output_pdf, 'wb') as f:
+            pdf_writer.write(f)
     
     position = "顶层" if on_top else "底层"
-    print(f"网格状文字水印已添加到{position}，输出文件: {output_pdf}")
+    if hasattr(output_pdf, 'write'):
+        print(f"网格状文字水印已添加到{position}")
+    else:
+        print(f"网格状文字水印已添加到{position}，输出文件: {output_pdf}")
     print(f"使用了 {rows} 行，每行约 {actual_cols} 个水印")
     if add_horizontal:
         print(f"每页添加了3个黑色和3个白色随机位置的水平水印")
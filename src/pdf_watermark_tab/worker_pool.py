@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+常驻的预热工作进程池
+
+新启动的工作进程在处理第一页之前要导入PyMuPDF、reportlab、PyPDF2、Pillow，加载宋体和拼音词典，
+读取两张LOGO。每天大量的小批次处理中，这部分准备时间比处理本身还长。这里在整个程序运行期间
+（界面会话或常驻服务）保留一个进程池，工作进程启动时执行一次 warm_up()，之后的批次直接复用；
+每次取用前做健康检查，每个进程处理 config.WORKER_RECYCLE_JOBS 个文件后替换为新进程
+"""
+
+import io
+import atexit
+import threading
+
+from src.pdf_watermark_tab.job_guard import GuardedPool
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def warm_up():
+    """
+    工作进程初始化：导入处理流程用到的全部库，注册字体，读取LOGO，加载拼音词典，
+    并在内存中绘制一页水印，让reportlab完成字体解析
+    """
+    from reportlab.pdfgen import canvas
+    from src.pdf_watermark_tab.protect import protect_pdf  # noqa: F401  导入fitz、PyPDF2、Pillow
+    from src.pdf_watermark_tab.pipeline import default_watermark_image
+    from src.pdf_watermark_tab.pdf_password import get_pinyin_password
+    from src.pdf_watermark_tab.watermark_core import (_draw_watermark_page, english_logo_path, logo_size,
+                                                      build_watermark_text)
+    import config
+
+    get_pinyin_password("张三")
+    watermark_image = default_watermark_image()
+    for path in (watermark_image, english_logo_path()):
+        try:
+            logo_size(path)
+        except OSError:
+            pass
+
+    c = canvas.Canvas(io.BytesIO(), pagesize=(595, 842))
+    try:
+        _draw_watermark_page(c, watermark_image, build_watermark_text("张三", ""), 595, 842,
+                             config.DEFAULT_IMG_SCALE, config.DEFAULT_IMG_OPACITY, config.DEFAULT_FONT_NAME,
+                             config.DEFAULT_FONT_SIZE, config.DEFAULT_TEXT_OPACITY, config.DEFAULT_ANGLE,
+                             5, 3, True)
+        c.save()
+    except Exception as e:
+        print(f"预热水印绘制失败: {str(e)}")
+
+
+def shared_pool():
+    """
+    取用程序内共享的常驻进程池，第一次调用时创建并预热全部工作进程
+
+    每次取用时做一次健康检查（进程池已损坏或有进程没有响应时重新创建），
+    并清除上一批次留下的取消状态。程序退出时自动关闭
+
+    返回:
+        GuardedPool
+    """
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = GuardedPool(initializer=warm_up)
+            atexit.register(shutdown_shared_pool)
+        pool = _shared_pool
+    pool.check_health()
+    pool.reset()
+    return pool
+
+
+def prewarm_shared_pool():
+    """在后台线程中创建并预热共享进程池，第一次批处理不需要等待工作进程启动"""
+    threading.Thread(target=shared_pool, name="dotrix-prewarm", daemon=True).start()
+
+
+def shutdown_shared_pool():
+    """关闭共享进程池，取消尚未开始的任务"""
+    global _shared_pool
+    with _shared_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
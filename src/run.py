@@ -8,6 +8,7 @@
 import sys
 import os
 import traceback
+import multiprocessing
 from PyQt5.QtWidgets import QApplication, QMessageBox
 from src.workbench_app import WorkbenchApp
 
@@ -35,6 +36,9 @@ def exception_hook(exctype, value, tb):
     msg.exec_()
 
 if __name__ == "__main__":
+    # 打包为exe后，多进程处理需要此调用
+    multiprocessing.freeze_support()
+    
     # 设置全局异常钩子
     from datetime import datetime
     sys.excepthook = exception_hook
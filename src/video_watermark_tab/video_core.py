@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+视频水印核心模块，通过ffmpeg管道流式解码原始帧，按批次混合水印图层后再送回编码器
+
+整个过程只在内存中保留一批帧，内存占用与视频时长无关
+"""
+
+import os
+import re
+import subprocess
+import tempfile
+import zlib
+import numpy as np
+
+from src.pdf_watermark_tab.watermark_core import get_application_path
+from src.pdf_watermark_tab.raster_overlay import render_watermark_overlay, WatermarkOverlay
+import config
+
+
+def find_ffmpeg():
+    """
+    查找ffmpeg可执行文件，优先使用随程序打包的ffmpeg目录
+
+    返回:
+        str: ffmpeg可执行文件路径或命令名
+    """
+    exe_name = "ffmpeg.exe" if os.name == "nt" else "ffmpeg"
+    bundled = os.path.join(get_application_path(), "ffmpeg", exe_name)
+    if os.path.exists(bundled):
+        return bundled
+    return config.FFMPEG_BINARY
+
+
+def popen_kwargs():
+    """Windows下隐藏ffmpeg的控制台窗口"""
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NO_WINDOW}
+    return {}
+
+
+def probe_video(input_video):
+    """
+    读取视频的基本信息（只依赖ffmpeg，不需要ffprobe）
+
+    参数:
+        input_video: 输入视频路径
+
+    返回:
+        dict: width, height, fps, duration(秒), has_audio
+    """
+    result = subprocess.run(
+        [find_ffmpeg(), "-hide_banner", "-i", input_video],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, **popen_kwargs()
+    )
+    info = result.stderr.decode("utf-8", errors="replace")
+
+    video_match = re.search(r"Stream #\S+.*?: Video: .*?, (\d{2,5})x(\d{2,5})", info)
+    if not video_match:
+        raise ValueError(f"无法识别视频流: {input_video}")
+    width, height = int(video_match.group(1)), int(video_match.group(2))
+
+    # 手机拍摄的视频可能带旋转信息，ffmpeg解码时会自动旋转
+    rotation_match = re.search(r"rotation of (-?[\d.]+) degrees", info)
+    if rotation_match and abs(float(rotation_match.group(1))) % 180 == 90:
+        width, height = height, width
+
+    fps = 25.0
+    fps_match = re.search(r"([\d.]+) fps", info) or re.search(r"([\d.]+) tbr", info)
+    if fps_match:
+        fps = float(fps_match.group(1))
+
+    duration = 0.0
+    duration_match = re.search(r"Duration: (\d+):(\d+):([\d.]+)", info)
+    if duration_match:
+        h, m, s = duration_match.groups()
+        duration = int(h) * 3600 + int(m) * 60 + float(s)
+
+    has_audio = re.search(r"Stream #\S+.*?: Audio:", info) is not None
+
+    return {
+        "width": width,
+        "height": height,
+        "fps": fps,
+        "duration": duration,
+        "has_audio": has_audio,
+    }
+
+
+def build_video_overlay(width, height, watermark_image, watermark_text, dpi=config.VIDEO_OVERLAY_DPI):
+    """
+    为指定分辨率的视频生成水印图层（与PDF使用相同的LOGO和学生文字）
+
+    随机位置的种子由水印文字决定，同一学生的各个分段在不同进程中得到完全一致的图层
+
+    返回:
+        WatermarkOverlay: 可直接混合到帧批次上的图层
+    """
+    seed = zlib.crc32(f"{watermark_text}|{width}x{height}".encode("utf-8"))
+    rgba = render_watermark_overlay(width, height, watermark_image, watermark_text, dpi=dpi, seed=seed)
+    return WatermarkOverlay(rgba)
+
+
+def _read_frames(stream, buffer, frame_bytes):
+    """
+    从解码器管道读取尽可能多的整帧到buffer
+
+    返回:
+        int: 读到的完整帧数
+    """
+    view = memoryview(buffer).cast("B")
+    total = len(view)
+    filled = 0
+    while filled < total:
+        n = stream.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return filled // frame_bytes
+
+
+def _read_error_output(stream):
+    """读取保存在临时文件中的ffmpeg错误输出"""
+    stream.seek(0)
+    return stream.read().decode("utf-8", errors="replace").strip()
+
+
+def watermark_video(input_video, output_video, overlay, video_info=None,
+                    batch_frames=config.VIDEO_BATCH_FRAMES, crf=config.VIDEO_CRF,
+                    preset=config.VIDEO_PRESET, progress_callback=None):
+    """
+    流式为视频添加水印
+
+    参数:
+        input_video: 输入视频路径
+        output_video: 输出视频路径（mp4）
+        overlay: WatermarkOverlay 水印图层，尺寸需与视频一致
+        video_info: probe_video 的结果，为空时自动读取
+        batch_frames: 每批处理的帧数
+        crf: x264质量参数
+        preset: x264编码速度预设
+        progress_callback: 进度回调 callback(已处理帧数, 总帧数)
+
+    返回:
+        int: 处理的帧数
+
+    解码或编码失败时抛出 RuntimeError 并删除不完整的输出文件
+    """
+    if video_info is None:
+        video_info = probe_video(input_video)
+    width, height, fps = video_info["width"], video_info["height"], video_info["fps"]
+    total_frames = int(video_info["duration"] * fps) if video_info["duration"] else 0
+
+    ffmpeg = find_ffmpeg()
+    decode_cmd = [
+        ffmpeg, "-hide_banner", "-loglevel", "error",
+        "-i", input_video,
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-",
+    ]
+    encode_cmd = [
+        ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", f"{fps}",
+        "-i", "-",
+        "-i", input_video,
+        "-map", "0:v:0", "-map", "1:a?",
+        "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+        "-c:a", "copy",
+        "-movflags", "+faststart",
+        output_video,
+    ]
+
+    # 管道本身提供背压：编码器处理不过来时写入会阻塞，解码器随之暂停
+    # 错误输出写入临时文件，不占用管道，输出再多也不会让ffmpeg阻塞
+    decoder_errors = tempfile.TemporaryFile()
+    encoder_errors = tempfile.TemporaryFile()
+    decoder = subprocess.Popen(decode_cmd, stdout=subprocess.PIPE, stderr=decoder_errors,
+                               bufsize=0, **popen_kwargs())
+    encoder = subprocess.Popen(encode_cmd, stdin=subprocess.PIPE, stderr=encoder_errors,
+                               bufsize=0, **popen_kwargs())
+
+    frame_bytes = width * height * 3
+    frames = np.empty((batch_frames, height, width, 3), dtype=np.uint8)
+    processed = 0
+
+    try:
+        while True:
+            count = _read_frames(decoder.stdout, frames, frame_bytes)
+            if count == 0:
+                break
+
+            batch = frames[:count]
+            overlay.blend(batch)
+            encoder.stdin.write(memoryview(batch).cast("B"))
+
+            processed += count
+            if progress_callback:
+                progress_callback(processed, total_frames)
+
+            if count < batch_frames:
+                break
+    except BrokenPipeError:
+        # 编码器提前退出，错误信息在下面统一报告
+        pass
+    finally:
+        decoder.stdout.close()
+        decoder.wait()
+        encoder.stdin.close()
+        encoder.wait()
+
+    try:
+        # 编码器先失败时解码器会因管道关闭而退出，优先报告编码器的错误
+        if encoder.returncode != 0:
+            error = f"视频编码失败: {_read_error_output(encoder_errors)}"
+        elif decoder.returncode != 0:
+            # 解码中途失败时编码器已正常收尾，输出的视频是截断的
+            error = f"视频解码失败（已处理 {processed} 帧）: {_read_error_output(decoder_errors)}"
+        else:
+            error = None
+    finally:
+        decoder_errors.close()
+        encoder_errors.close()
+
+    if error:
+        if os.path.exists(output_video):
+            os.remove(output_video)
+        raise RuntimeError(error)
+
+    return processed
+
+
+def add_video_watermark(input_video, output_video, watermark_image, watermark_text,
+                        progress_callback=None):
+    """
+    为单个视频添加水印（探测视频信息、生成图层、流式处理）
+
+    参数:
+        input_video: 输入视频路径
+        output_video: 输出视频路径
+        watermark_image: 中心水印图片路径
+        watermark_text: 水印文字内容
+        progress_callback: 进度回调 callback(已处理帧数, 总帧数)
+
+    返回:
+        int: 处理的帧数
+    """
+    video_info = probe_video(input_video)
+    overlay = build_video_overlay(video_info["width"], video_info["height"], watermark_image, watermark_text)
+    processed = watermark_video(input_video, output_video, overlay, video_info=video_info,
+                                progress_callback=progress_callback)
+    print(f"视频水印已添加，输出文件: {output_video}，共 {processed} 帧")
+    return processed
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+视频分段并行水印模块
+
+在关键帧处将视频无损切分为若干分段，每个分段在独立进程中添加水印并编码，
+最后用concat无需重新编码地拼接回完整视频。支持一个视频同时为多名学生分发，
+所有 (分段, 学生) 任务共享同一个进程池
+"""
+
+import os
+import glob
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from src.video_watermark_tab.video_core import (find_ffmpeg, popen_kwargs, probe_video,
+                                                build_video_overlay, watermark_video)
+
+
+# 工作进程内的水印图层缓存，同一学生的多个分段只渲染一次
+_overlay_cache = {}
+
+
+def default_segment_count():
+    """分段数与CPU核心数一致"""
+    return max(1, os.cpu_count() or 1)
+
+
+def split_at_keyframes(input_video, segment_dir, segment_count, video_info=None):
+    """
+    在关键帧处将视频切分为约 segment_count 段（流复制，不重新编码，不含音轨）
+
+    参数:
+        input_video: 输入视频路径
+        segment_dir: 分段输出目录
+        segment_count: 期望的分段数
+        video_info: probe_video 的结果，为空时自动读取
+
+    返回:
+        list: 按顺序排列的分段文件路径
+    """
+    if video_info is None:
+        video_info = probe_video(input_video)
+
+    duration = video_info["duration"]
+    if segment_count <= 1 or duration <= 0:
+        segment_time = max(duration, 1.0) + 1
+    else:
+        segment_time = duration / segment_count
+
+    # segment复用器只会在请求时间点之后的第一个关键帧处切分
+    cmd = [
+        find_ffmpeg(), "-hide_banner", "-loglevel", "error", "-y",
+        "-i", input_video,
+        "-map", "0:v:0", "-an", "-c", "copy",
+        "-f", "segment", "-segment_time", f"{segment_time:.3f}",
+        "-reset_timestamps", "1",
+        os.path.join(segment_dir, "segment_%04d.mp4"),
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **popen_kwargs())
+    if result.returncode != 0:
+        raise RuntimeError(f"视频分段失败: {result.stderr.decode('utf-8', errors='replace').strip()}")
+
+    return sorted(glob.glob(os.path.join(segment_dir, "segment_*.mp4")))
+
+
+def concat_segments(segment_paths, output_video, audio_source=None):
+    """
+    无需重新编码地拼接分段，并从原视频复制音轨
+
+    参数:
+        segment_paths: 按顺序排列的已编码分段
+        output_video: 输出视频路径
+        audio_source: 提供音轨的原始视频，为空时输出无音轨
+    """
+    list_path = output_video + ".concat.txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in segment_paths:
+            # concat列表中的单引号需要转义
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    cmd = [find_ffmpeg(), "-hide_banner", "-loglevel", "error", "-y",
+           "-f", "concat", "-safe", "0", "-i", list_path]
+    if audio_source:
+        cmd += ["-i", audio_source, "-map", "0:v:0", "-map", "1:a?"]
+    cmd += ["-c", "copy", "-movflags", "+faststart", output_video]
+
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, **popen_kwargs())
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        raise RuntimeError(f"视频拼接失败: {result.stderr.decode('utf-8', errors='replace').strip()}")
+
+
+def _watermark_segment(segment_path, output_path, watermark_image, watermark_text):
+    """
+    工作进程：为单个分段添加水印并编码
+
+    返回:
+        int: 处理的帧数
+    """
+    video_info = probe_video(segment_path)
+    key = (watermark_text, video_info["width"], video_info["height"])
+    overlay = _overlay_cache.get(key)
+    if overlay is None:
+        overlay = build_video_overlay(video_info["width"], video_info["height"], watermark_image, watermark_text)
+        _overlay_cache.clear()  # 只保留最近一个学生的图层，限制内存
+        _overlay_cache[key] = overlay
+    return watermark_video(segment_path, output_path, overlay, video_info=video_info)
+
+
+def add_video_watermark_parallel(input_video, jobs, watermark_image, segment_count=None,
+                                 max_workers=None, progress_callback=None):
+    """
+    分段并行地为一个视频生成一份或多份带水印的副本
+
+    参数:
+        input_video: 输入视频路径
+        jobs: [(output_video, watermark_text), ...]，每名学生一项
+        watermark_image: 中心水印图片路径
+        segment_count: 分段数，默认与CPU核心数一致
+        max_workers: 进程数，默认与CPU核心数一致
+        progress_callback: 进度回调 callback(已完成分段任务数, 分段任务总数)
+
+    返回:
+        dict: {output_video: 是否成功}
+    """
+    if segment_count is None:
+        segment_count = default_segment_count()
+
+    video_info = probe_video(input_video)
+    work_dir = tempfile.mkdtemp(prefix="dotrix_video_")
+    results = {}
+
+    try:
+        segment_dir = os.path.join(work_dir, "segments")
+        os.makedirs(segment_dir)
+        segments = split_at_keyframes(input_video, segment_dir, segment_count, video_info=video_info)
+
+        with ProcessPoolExecutor(max_workers=max_workers or default_segment_count()) as executor:
+            # 按学生提交任务，同一学生的分段在同一批中处理，工作进程可复用图层缓存
+            pending = {}
+            encoded = {}
+            for job_index, (output_video, watermark_text) in enumerate(jobs):
+                encoded[output_video] = []
+                for seg_index, segment_path in enumerate(segments):
+                    out_path = os.path.join(work_dir, f"job{job_index:04d}_seg{seg_index:04d}.mp4")
+                    encoded[output_video].append(out_path)
+                    future = executor.submit(_watermark_segment, segment_path, out_path,
+                                             watermark_image, watermark_text)
+                    pending[future] = output_video
+
+            total_tasks = len(pending)
+            finished = 0
+            failed_outputs = set()
+            while pending:
+                done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    output_video = pending.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(f"处理视频分段时出错 ({output_video}): {str(e)}")
+                        failed_outputs.add(output_video)
+                    finished += 1
+                if progress_callback:
+                    progress_callback(finished, total_tasks)
+
+        # 所有分段完成后逐个拼接，拼接只是流复制，速度很快
+        for output_video, segment_outputs in encoded.items():
+            if output_video in failed_outputs:
+                results[output_video] = False
+                continue
+            try:
+                concat_segments(segment_outputs, output_video,
+                                audio_source=input_video if video_info["has_audio"] else None)
+                results[output_video] = True
+                print(f"视频水印已添加（分段并行），输出文件: {output_video}")
+            except Exception as e:
+                print(f"拼接视频 {output_video} 时出错: {str(e)}")
+                results[output_video] = False
+            for path in segment_outputs:
+                if os.path.exists(path):
+                    os.remove(path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
@@ -2,30 +2,234 @@
 # -*- coding: utf-8 -*-
 
 """
-视频水印选项卡模块，目前显示"开发中"提示
+视频水印选项卡模块，为录播课视频添加与PDF相同的LOGO和学生文字水印
 """
 
-from PyQt5.QtWidgets import QWidget, QLabel, QVBoxLayout
+import os
+import re
+from PyQt5.QtWidgets import QWidget, QApplication, QMessageBox, QFileDialog, QListWidgetItem
 from PyQt5.QtCore import Qt
 
+from src.pdf_watermark_tab.watermark_core import get_application_path, build_watermark_text
+from src.video_watermark_tab.video_core import add_video_watermark
+from src.video_watermark_tab.video_segments import add_video_watermark_parallel
+from src.workbench_app.ui_video_watermark_tab import VideoWatermarkUI
 import config
 
 class VideoWatermarkTab(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
-        
-        self.setup_ui()
-        
-    def setup_ui(self):
-        """初始化视频水印选项卡的UI"""
-        layout = QVBoxLayout(self)
-        layout.setContentsMargins(10, 10, 10, 10)
-        
-        # 创建"开发中"的提示标签
-        developing_label = QLabel("开发中，敬请期待")
-        developing_label.setStyleSheet(config.UI_STYLES["developing_label"])
-        developing_label.setAlignment(Qt.AlignCenter)
-        layout.addWidget(developing_label)
-        
-        # 添加占位空间，使标签垂直居中
-        layout.addStretch(1) 
\ No newline at end of file
+
+        self.video_files = []
+        # 与PDF水印使用相同的中文LOGO
+        app_path = get_application_path()
+        self.watermark_image = os.path.join(app_path, config.PICTURES_DIR, "dotrix_logo_chn.png")
+        self.output_dir = ""
+        self.watermark_text = config.DEFAULT_WATERMARK_TEXT
+
+        # 初始化UI
+        self.ui = VideoWatermarkUI()
+        self.ui.setup_ui(self)
+
+    def add_video_files(self, filepaths):
+        """将视频文件加入列表，返回新增数量"""
+        # 如果有占位符，先清除
+        if self.has_placeholder:
+            self.video_list.clear()
+            self.has_placeholder = False
+
+        new_files_added = 0
+        for filepath in filepaths:
+            if filepath.lower().endswith(config.SUPPORTED_VIDEO_EXTENSIONS) and filepath not in self.video_files:
+                self.video_files.append(filepath)
+                self.video_list.addItem(os.path.basename(filepath))
+                new_files_added += 1
+
+        if new_files_added > 0:
+            self.update_file_count()
+            self.status_label.setText(f"已添加 {new_files_added} 个新视频文件")
+            self.status_label.setStyleSheet("color: green;")
+
+            # 如果还没选择输出目录，自动设置为第一个视频所在的目录
+            if not self.output_dir:
+                self.output_dir = os.path.dirname(self.video_files[0])
+                self.output_label.setText(self.output_dir)
+        else:
+            self.status_label.setText("未发现新的视频文件或文件已存在")
+            self.status_label.setStyleSheet("color: orange;")
+        return new_files_added
+
+    def drag_video(self, files):
+        """处理视频文件拖放，支持多个文件"""
+        self.add_video_files(files)
+
+    def select_video_files(self):
+        """选择多个视频文件"""
+        filepaths, _ = QFileDialog.getOpenFileNames(
+            self,
+            "选择视频文件",
+            "",
+            config.FILE_FILTERS["video"]
+        )
+        if filepaths:
+            self.add_video_files(filepaths)
+
+    def remove_selected_video(self):
+        """移除选中的视频文件"""
+        selected_items = self.video_list.selectedItems()
+        if not selected_items:
+            QMessageBox.information(self, "提示", "请先选择要删除的文件")
+            return
+
+        for item in selected_items:
+            index = self.video_list.row(item)
+            del self.video_files[index]
+            self.video_list.takeItem(index)
+
+        self.update_file_count()
+
+    def clear_video_list(self):
+        """清空视频文件列表"""
+        if not self.video_files:
+            return
+
+        reply = QMessageBox.question(
+            self, '确认', '确定要清空所有文件吗？',
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+        )
+
+        if reply == QMessageBox.Yes:
+            self.video_files.clear()
+            self.video_list.clear()
+            self.update_file_count()
+
+            # 添加回占位符
+            placeholder = QListWidgetItem('将视频文件拖放到此处或点击"添加视频"按钮')
+            placeholder.setFlags(Qt.NoItemFlags)
+            placeholder.setForeground(Qt.gray)
+            self.video_list.addItem(placeholder)
+            self.has_placeholder = True
+
+            self.status_label.setText("已清空文件列表")
+            self.status_label.setStyleSheet("color: blue;")
+
+    def update_file_count(self):
+        """更新文件计数"""
+        count = len(self.video_files)
+        self.file_count_label.setText(f"已选择: {count} 个文件")
+
+    def select_output_dir(self):
+        """选择输出目录"""
+        dirpath = QFileDialog.getExistingDirectory(
+            self,
+            "选择输出目录"
+        )
+        if dirpath:
+            self.output_dir = dirpath
+            self.output_label.setText(self.output_dir)
+
+    def get_student_names(self):
+        """解析学生名输入框，多名学生用逗号、顿号或空格分隔"""
+        text = self.student_input.text().strip()
+        return [name for name in re.split(r"[,，、\s]+", text) if name]
+
+    def batch_process(self):
+        """批量处理视频文件"""
+        if not self.video_files:
+            QMessageBox.critical(self, "错误", "请添加至少一个视频文件")
+            return
+        if not os.path.exists(self.watermark_image):
+            QMessageBox.critical(self, "错误", "水印图片不存在")
+            return
+        if not self.output_dir:
+            QMessageBox.critical(self, "错误", "请选择输出目录")
+            return
+
+        students = self.get_student_names()
+        if not students:
+            QMessageBox.critical(self, "错误", "请输入该视频将要交付给的学生实名")
+            return
+
+        try:
+            self.generate_btn.setEnabled(False)
+            self.generate_btn.setText("处理中...")
+            self.status_label.setText("正在处理，请稍候...")
+            self.status_label.setStyleSheet("color: orange;")
+            QApplication.processEvents()
+
+            total_files = len(self.video_files)
+            # 进度条以千分比显示，文件内部按帧数或分段数计算进度
+            self.progress_bar.setMaximum(total_files * 1000)
+            datetime = self.date_input.dateTime().toString("yyyy-MM-dd HH:mm")
+            parallel = self.parallel_checkbox.isChecked()
+            successful = 0
+            failed = 0
+
+            for i, input_video in enumerate(self.video_files):
+                base_name = os.path.basename(input_video)
+                name, _ = os.path.splitext(base_name)
+                # 每名学生一份输出，水印文字各不相同
+                jobs = [(os.path.join(self.output_dir, f"{name}_{student}.mp4"),
+                         build_watermark_text(student, datetime))
+                        for student in students]
+
+                def on_progress(done, total, i=i, base_name=base_name):
+                    fraction = min(done / total, 1.0) if total else 0.0
+                    self.progress_bar.setValue(int((i + fraction) * 1000))
+                    unit = "个分段" if parallel else "帧"
+                    self.status_label.setText(f"处理中: {base_name} - 已完成 {done} {unit} ({i+1}/{total_files})")
+                    QApplication.processEvents()
+
+                try:
+                    if parallel:
+                        # 所有学生的所有分段共享同一个进程池
+                        results = add_video_watermark_parallel(input_video, jobs, self.watermark_image,
+                                                               progress_callback=on_progress)
+                        successful += sum(1 for ok in results.values() if ok)
+                        failed += sum(1 for ok in results.values() if not ok)
+                    else:
+                        for output_video, watermark_text in jobs:
+                            try:
+                                add_video_watermark(input_video, output_video, self.watermark_image,
+                                                    watermark_text, progress_callback=on_progress)
+                                successful += 1
+                            except Exception as e:
+                                print(f"处理文件 {input_video} 时出错: {str(e)}")
+                                failed += 1
+                except Exception as e:
+                    print(f"处理文件 {input_video} 时出错: {str(e)}")
+                    failed += len(jobs)
+
+                self.progress_bar.setValue((i + 1) * 1000)
+
+            status_color = "green" if failed == 0 else "orange"
+            self.status_label.setText(f"处理完成! 成功: {successful}, 失败: {failed}")
+            self.status_label.setStyleSheet(f"color: {status_color};")
+
+            QMessageBox.information(
+                self,
+                "处理完成",
+                f"批量处理完成!\n成功: {successful} 个文件\n失败: {failed} 个文件\n输出目录: {self.output_dir}"
+            )
+
+        except Exception as e:
+            self.status_label.setText(f"错误: {str(e)}")
+            self.status_label.setStyleSheet("color: red;")
+            QMessageBox.critical(self, "错误", f"处理时出错: {str(e)}")
+        finally:
+            self.generate_btn.setEnabled(True)
+            self.generate_btn.setText("批量处理")
+
+    def update_watermark_text(self):
+        """根据输入参数更新水印文本"""
+        datetime = self.date_input.dateTime().toString("yyyy-MM-dd HH:mm")
+        students = self.get_student_names()
+
+        if students:
+            # 多名学生时预览第一名学生的水印文本
+            self.watermark_text = build_watermark_text(students[0], datetime)
+            self.status_label.setText(f"水印文本已更新: {self.watermark_text}")
+            self.status_label.setStyleSheet("color: green;")
+        else:
+            self.status_label.setText("请输入该视频将要交付给的学生实名")
+            self.status_label.setStyleSheet("color: orange;")
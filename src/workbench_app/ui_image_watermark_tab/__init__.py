@@ -0,0 +1,8 @@
+"""
+Image Watermark Tab UI Package
+Contains UI components for the image watermarking functionality
+"""
+
+from .image_watermark_ui import ImageWatermarkUI
+
+__all__ = ['ImageWatermarkUI']
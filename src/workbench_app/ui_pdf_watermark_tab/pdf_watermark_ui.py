@@ -8,11 +8,12 @@ PDF水印选项卡UI模块，包含PDF水印相关的UI设计
 from PyQt5.QtWidgets import (QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout,
                            QFrame, QFileDialog, QProgressBar, QMessageBox, 
                            QListWidgetItem, QLineEdit,
-                           QGridLayout, QDateTimeEdit)
+                           QGridLayout, QDateTimeEdit, QComboBox, QCheckBox, QSpinBox)
 from PyQt5.QtCore import Qt, QDateTime
 import os
 import config
 from src.workbench_app.widgets import DropListWidget
+from src.pdf_watermark_tab.scheduler import STRATEGY_NAMES
 
 class PDFWatermarkUI:
     def setup_ui(self, parent):
@@ -89,6 +90,11 @@ class PDFWatermarkUI:
         parent.clear_pdf_btn.clicked.connect(parent.clear_pdf_list)
         pdf_btn_layout.addWidget(parent.clear_pdf_btn)
         
+        # 处理前预估耗时、内存和输出大小
+        parent.preflight_btn = QPushButton("预估")
+        parent.preflight_btn.clicked.connect(parent.preflight_batch)
+        pdf_btn_layout.addWidget(parent.preflight_btn)
+        
         parent.file_count_label = QLabel("已选择: 0 个文件")
         pdf_btn_layout.addWidget(parent.file_count_label)
         
@@ -169,6 +175,34 @@ class PDFWatermarkUI:
         parent.student_input.textChanged.connect(parent.update_watermark_text)
         params_layout.addWidget(parent.student_input, 2, 1)
         
+        # 添加处理顺序选择
+        order_label = QLabel("处理顺序:")
+        order_label.setStyleSheet(label_style)
+        params_layout.addWidget(order_label, 3, 0)
+        parent.order_combo = QComboBox()
+        for strategy, name in STRATEGY_NAMES.items():
+            parent.order_combo.addItem(name, strategy)
+        index = parent.order_combo.findData(config.SCHEDULE_STRATEGY)
+        parent.order_combo.setCurrentIndex(max(0, index))
+        params_layout.addWidget(parent.order_combo, 3, 1)
+        
+        # 安全输出格式：MRC文字层更清晰、文件更小
+        parent.mrc_checkbox = QCheckBox("清晰文字模式（高清文字层 + 压缩背景，文件更小）")
+        parent.mrc_checkbox.setChecked(config.SECURE_OUTPUT_FORMAT == "mrc")
+        params_layout.addWidget(parent.mrc_checkbox, 4, 0, 1, 2)
+        
+        # 输出文件大小上限：超出时自动降低DPI和压缩质量
+        size_label = QLabel("大小上限:")
+        size_label.setStyleSheet(label_style)
+        params_layout.addWidget(size_label, 5, 0)
+        parent.max_size_input = QSpinBox()
+        parent.max_size_input.setRange(0, 2048)
+        parent.max_size_input.setSuffix(" MB")
+        parent.max_size_input.setSpecialValueText("不限制")
+        parent.max_size_input.setValue(int(config.MAX_OUTPUT_MB))
+        parent.max_size_input.setToolTip("每个输出文件的大小上限（例如聊天软件的附件限制），超出时自动降低分辨率")
+        params_layout.addWidget(parent.max_size_input, 5, 1)
+        
         # 确保标签列有合适的宽度
         params_layout.setColumnMinimumWidth(0, 80)
         
@@ -187,4 +221,9 @@ class PDFWatermarkUI:
         parent.progress_bar.setFixedHeight(config.PROGRESS_BAR_HEIGHT)
         progress_layout.addWidget(parent.progress_bar)
         
+        # 剩余时间和处理速度
+        parent.eta_label = QLabel("")
+        parent.eta_label.setStyleSheet("color: #666666;")
+        progress_layout.addWidget(parent.eta_label)
+        
         return progress_layout 
\ No newline at end of file
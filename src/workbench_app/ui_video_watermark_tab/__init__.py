@@ -0,0 +1,8 @@
+"""
+Video Watermark Tab UI Package
+Contains UI components for the video watermarking functionality
+"""
+
+from .video_watermark_ui import VideoWatermarkUI
+
+__all__ = ['VideoWatermarkUI']
@@ -13,6 +13,7 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QPixmap, QIcon
 
 from src.pdf_watermark_tab import PDFWatermarkTab
+from image_watermark_tab.image_watermark_tab import ImageWatermarkTab
 from video_watermark_tab.video_watermark_tab import VideoWatermarkTab
 from about_tab.about_tab import AboutTab
 # 所有PDF相关功能都从watermark_core.py导入
@@ -51,6 +52,10 @@ class WorkbenchApp(QMainWindow):
         pdf_tab = PDFWatermarkTab()
         self.tab_widget.addTab(pdf_tab, config.TAB_NAMES["pdf"])
         
+        # 添加图片水印选项卡
+        image_tab = ImageWatermarkTab()
+        self.tab_widget.addTab(image_tab, config.TAB_NAMES["image"])
+        
         # 添加视频水印选项卡
         video_tab = VideoWatermarkTab()
         self.tab_widget.addTab(video_tab, config.TAB_NAMES["video"])
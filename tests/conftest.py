@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""测试公共设置：与 src/cli.py 相同，把项目根目录和 src 加入导入路径"""
+
+import os
+import sys
+
+import fitz  # PyMuPDF
+import pytest
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _path in (os.path.join(_ROOT, "src"), _ROOT):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+
+def make_pdf(path, pages=1, text="DOTRIX"):
+    """生成一个每页带一行文字的小PDF"""
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=300, height=400)
+        page.insert_text((40, 60), f"{text} {i + 1}")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture
+def pdf_factory(tmp_path):
+    """在临时目录中生成PDF: pdf_factory(name, pages=1)"""
+    def factory(name, pages=1, directory=None):
+        directory = directory or tmp_path
+        os.makedirs(directory, exist_ok=True)
+        return make_pdf(os.path.join(str(directory), name), pages)
+    return factory
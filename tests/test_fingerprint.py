@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fitz  # PyMuPDF
+import pytest
+
+import config
+from src.pdf_watermark_tab.fingerprint import trace_pdf
+from src.pdf_watermark_tab.protect import ProtectOptions, protect_pdf
+
+FINGERPRINT = 0x5A3C0FF1E2D4
+
+
+class _Ledger:
+    """只含追踪所需接口的台账"""
+
+    def lookup_hash(self, output_hash):
+        return None
+
+    def lookup(self, fingerprint):
+        return {"fingerprint": fingerprint} if fingerprint == FINGERPRINT else None
+
+    def passwords(self):
+        return []
+
+
+def _strip_traces(data, password):
+    """去掉文件标识和每页除第一个以外的内容流，模拟持有密码的学生手工删除指纹"""
+    doc = fitz.open("pdf", data)
+    assert doc.authenticate(password)
+    doc.xref_set_key(-1, "ID", "null")
+    for page in doc:
+        contents = page.get_contents()
+        doc.xref_set_key(page.xref, "Contents", f"{contents[0]} 0 R")
+    stripped = doc.tobytes()
+    doc.close()
+    return stripped
+
+
+@pytest.mark.parametrize("mode, output_format", [("raster", "flat"), ("vector", "flat"), ("raster", "mrc")])
+def test_pattern_survives_removing_id_and_extra_streams(monkeypatch, tmp_path, pdf_factory, mode, output_format):
+    monkeypatch.setattr(config, "SECURE_RENDER_MODE", mode)
+    monkeypatch.setattr(config, "RASTER_CACHE_MAX_MB", 0)
+    with open(pdf_factory("lecture.pdf", pages=2), "rb") as f:
+        data = f.read()
+    options = ProtectOptions("张三", dpi=150, output_format=output_format, fingerprint=FINGERPRINT)
+    secured = protect_pdf(data, options)
+
+    result = trace_pdf(_strip_traces(secured, options.password), _Ledger(), [options.password])
+    assert result.method == "pattern"
+    assert result.fingerprint == FINGERPRINT
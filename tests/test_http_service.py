@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import os
+import socket
+
+import fitz  # PyMuPDF
+import pytest
+
+import config
+from src.pdf_watermark_tab.http_service import HttpError, WatermarkHttpService
+from src.pdf_watermark_tab.protect import ProtectOptions
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_symlink_out_of_allowed_root_is_rejected(tmp_path, pdf_factory):
+    allowed = tmp_path / "allowed"
+    allowed.mkdir()
+    secret = pdf_factory("secret.pdf", directory=tmp_path / "private")
+    os.symlink(secret, allowed / "link.pdf")
+    service = WatermarkHttpService(allowed_roots=[str(allowed)])
+
+    body = json.dumps({"path": str(allowed / "link.pdf"), "student": "张三"}).encode("utf-8")
+    with pytest.raises(HttpError) as error:
+        service._parse_job("/watermark", {"content-type": "application/json"}, body)
+    assert error.value.status == 400
+
+
+@pytest.mark.parametrize("dpi", ["0", "-5", "100000", "abc"])
+def test_out_of_range_dpi_is_bad_request(pdf_factory, dpi):
+    pdf = open(pdf_factory("lecture.pdf"), "rb").read()
+    with pytest.raises(HttpError) as error:
+        WatermarkHttpService()._parse_job(f"/watermark?student=x&dpi={dpi}", {}, pdf)
+    assert error.value.status == 400
+
+
+def test_protect_options_reject_zero_dpi():
+    with pytest.raises(ValueError):
+        ProtectOptions("张三", dpi=0)
+
+
+def test_non_numeric_content_length_is_bad_request():
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"POST /watermark HTTP/1.1\r\nContent-Length: abc\r\n\r\n")
+        reader.feed_eof()
+        return await WatermarkHttpService()._read_request(reader)
+
+    with pytest.raises(HttpError) as error:
+        asyncio.run(read())
+    assert error.value.status == 400
+
+
+def test_watermark_request_returns_encrypted_pdf(monkeypatch, tmp_path, pdf_factory):
+    monkeypatch.setattr(config, "LEDGER_ENABLED", False)
+    monkeypatch.setattr(config, "USER_DATA_DIR", str(tmp_path / "data"))
+    pdf = open(pdf_factory("lecture.pdf", pages=2), "rb").read()
+    port = _free_port()
+    service = WatermarkHttpService(port=port, max_workers=1)
+
+    async def request():
+        server = asyncio.create_task(service.serve())
+        for _ in range(100):
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                break
+            except OSError:
+                await asyncio.sleep(0.1)
+        writer.write(b"POST /watermark?student=%E5%BC%A0%E4%B8%89&dpi=72 HTTP/1.1\r\n"
+                     + f"Content-Length: {len(pdf)}\r\n\r\n".encode("latin-1") + pdf)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
+        return response
+
+    response = asyncio.run(asyncio.wait_for(request(), 120))
+    head, _, body = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 200")
+    assert f"Content-Length: {len(body)}".encode("latin-1") in head
+    with fitz.open("pdf", body) as doc:
+        assert doc.authenticate("zhangsan")
+        assert doc.page_count == 2
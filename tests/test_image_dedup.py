@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fitz  # PyMuPDF
+import numpy as np
+
+import config
+from src.pdf_watermark_tab.image_dedup import ImageDeduplicator, uniform_color
+from src.pdf_watermark_tab.pipeline import (convert_document_to_secure, default_watermark_image,
+                                            raster_watermark_document)
+
+
+def _repeated_and_blank_document():
+    """3页内容相同的页面和2页空白页"""
+    doc = fitz.open()
+    for _ in range(3):
+        page = doc.new_page(width=300, height=400)
+        page.insert_text((40, 60), "DOTRIX handout")
+    for _ in range(2):
+        doc.new_page(width=300, height=400)
+    return doc
+
+
+def _image_xrefs(page):
+    return [image[0] for image in page.get_images(full=True)]
+
+
+def test_repeated_pages_share_one_image_and_blank_pages_are_filled():
+    metrics = {}
+    with _repeated_and_blank_document() as source:
+        output = convert_document_to_secure(source, dpi=72, metrics=metrics)
+    xrefs = [_image_xrefs(page) for page in output]
+
+    assert xrefs[0] == xrefs[1] == xrefs[2] and len(xrefs[0]) == 1
+    # 空白页用纯色矩形填充，不嵌入整页图像
+    assert xrefs[3] == [] and xrefs[4] == []
+    assert metrics["reused_images"] == 2
+    assert metrics["blank_pages"] == 2
+    output.close()
+
+
+def test_raster_blank_pages_reuse_one_watermarked_image(monkeypatch):
+    # 固定一种水印变体，内容相同的页面混合水印后仍然相同
+    monkeypatch.setattr(config, "RASTER_OVERLAY_VARIANTS", 1)
+    metrics = {}
+    with _repeated_and_blank_document() as source:
+        output = raster_watermark_document(source, default_watermark_image(), "张三 测试", dpi=72, metrics=metrics)
+    xrefs = [_image_xrefs(page) for page in output]
+
+    assert xrefs[0] == xrefs[1] == xrefs[2]
+    assert xrefs[3] == xrefs[4] and xrefs[3] != xrefs[0]
+    assert len({xref for page in xrefs for xref in page}) == 2
+    assert metrics["blank_pages"] == 2
+    output.close()
+
+
+def test_deduplicator_keys_on_content_and_shape():
+    doc = fitz.open()
+    dedup = ImageDeduplicator(doc)
+    pixels = np.zeros((4, 6, 3), dtype=np.uint8)
+    pixels[1, 2] = 200
+    assert dedup.content_key(pixels) == dedup.content_key(pixels.copy())
+    assert dedup.content_key(pixels) != dedup.content_key(pixels.reshape(6, 4, 3))
+    assert uniform_color(np.full((4, 4, 3), 250, dtype=np.uint8)) == (250, 250, 250)
+    assert uniform_color(pixels) is None
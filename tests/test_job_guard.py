@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+
+import pytest
+
+from src.pdf_watermark_tab.job_guard import (GuardedPool, JobMemoryExceeded, JobTimeout, checkpoint,
+                                             job_deadline)
+
+
+# 工作进程中执行的函数必须定义在模块顶层才能pickle
+def _square(value):
+    return value * value
+
+
+def _hang(seconds):
+    """卡在一次调用中，不经过检查点"""
+    time.sleep(seconds)
+    return "finished"
+
+
+def _loop_with_checkpoints():
+    while True:
+        checkpoint()
+        time.sleep(0.01)
+
+
+def _allocate(mb):
+    return len(bytearray(mb * 1024 * 1024))
+
+
+def _crash_after(seconds):
+    time.sleep(seconds)
+    os._exit(1)
+
+
+def _sleep_and_return(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+def test_checkpoint_raises_after_deadline():
+    with job_deadline(0.05):
+        checkpoint()
+        time.sleep(0.1)
+        with pytest.raises(JobTimeout):
+            checkpoint()
+    # 离开后不再限制
+    checkpoint()
+
+
+def test_job_past_deadline_is_killed_and_pool_recovers():
+    with GuardedPool(1, timeout=0.5, kill_grace=0.3, memory_mb=0, recycle_jobs=0) as pool:
+        started = time.monotonic()
+        with pytest.raises(JobTimeout, match="强制结束"):
+            pool.submit(_hang, 60).result(timeout=30)
+        assert time.monotonic() - started < 20
+        # 被结束的工作进程所在的进程池已经重建
+        assert pool.submit(_square, 7).result(timeout=30) == 49
+
+
+def test_cooperative_timeout_does_not_kill_worker():
+    with GuardedPool(1, timeout=0.3, kill_grace=30, memory_mb=0, recycle_jobs=0) as pool:
+        pid = pool.submit(os.getpid).result(timeout=30)
+        with pytest.raises(JobTimeout):
+            pool.submit(_loop_with_checkpoints).result(timeout=30)
+        assert pool.submit(os.getpid).result(timeout=30) == pid
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="内存预算只在Linux/macOS上生效")
+def test_job_over_memory_budget_fails_without_breaking_pool():
+    with GuardedPool(1, timeout=0, memory_mb=64, recycle_jobs=0) as pool:
+        pid = pool.submit(os.getpid).result(timeout=30)
+        with pytest.raises(JobMemoryExceeded):
+            pool.submit(_allocate, 1024).result(timeout=30)
+        # 同一个工作进程继续处理，限制已经恢复
+        assert pool.submit(_allocate, 16).result(timeout=30) == 16 * 1024 * 1024
+        assert pool.submit(_allocate, 256, memory_mb=0).result(timeout=30) == 256 * 1024 * 1024
+        assert pool.submit(os.getpid).result(timeout=30) == pid
+
+
+def test_crashing_job_is_isolated_in_quarantine():
+    with GuardedPool(2, timeout=0, memory_mb=0, recycle_jobs=0) as pool:
+        # 两个任务同时在处理时其中一个让工作进程崩溃，无法确定是哪一个
+        good = pool.submit(_sleep_and_return, 1.5, "ok")
+        bad = pool.submit(_crash_after, 0.5)
+        with pytest.raises(RuntimeError, match="异常退出"):
+            bad.result(timeout=60)
+        # 没有问题的文件在隔离进程中重试后正常完成
+        assert good.result(timeout=60) == "ok"
+        assert pool.submit(_square, 3).result(timeout=30) == 9
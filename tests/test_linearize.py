@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import re
+
+import fitz  # PyMuPDF
+import pytest
+
+import config
+from src.pdf_watermark_tab import pdf_password
+from src.pdf_watermark_tab.pdf_password import (encrypt_pdf_document, get_pinyin_password, is_linearized,
+                                                write_encrypted_document)
+from src.pdf_watermark_tab.protect import ProtectOptions, protect_pdf, protect_pdf_to
+from src.pdf_watermark_tab.verify import verify_output
+
+pytest.importorskip("pikepdf")
+
+
+@pytest.fixture
+def linearize(monkeypatch):
+    monkeypatch.setattr(config, "LINEARIZE_OUTPUT", True)
+
+
+class _WriteOnly:
+    """只有write方法的输出，例如HTTP连接"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+
+def _permissions(data):
+    return re.search(rb"/P\s*(-?\d+)", data).group(1)
+
+
+def test_output_is_linearized_and_opens_with_pinyin_password(linearize, pdf_factory):
+    source = open(pdf_factory("lecture.pdf", pages=3), "rb").read()
+    data = protect_pdf(source, ProtectOptions("张三", dpi=72))
+
+    assert is_linearized(data)
+    with fitz.open("pdf", data) as doc:
+        assert doc.needs_pass
+        assert doc.authenticate(get_pinyin_password("张三"))
+        assert doc.page_count == 3
+
+
+def test_streamed_output_is_linearized(linearize, pdf_factory):
+    source = open(pdf_factory("lecture.pdf", pages=2), "rb").read()
+    output = _WriteOnly()
+    protect_pdf_to(source, output, ProtectOptions("张三", dpi=72))
+
+    assert is_linearized(bytes(output.data))
+    with fitz.open("pdf", bytes(output.data)) as doc:
+        assert doc.authenticate("zhangsan")
+
+
+def test_linearized_output_keeps_permissions(monkeypatch):
+    doc = fitz.open()
+    doc.new_page()
+    monkeypatch.setattr(config, "LINEARIZE_OUTPUT", False)
+    plain = encrypt_pdf_document(doc, "zhangsan")
+    monkeypatch.setattr(config, "LINEARIZE_OUTPUT", True)
+    linearized = encrypt_pdf_document(doc, "zhangsan")
+
+    assert not is_linearized(plain)
+    assert is_linearized(linearized)
+    assert _permissions(linearized) == _permissions(plain)
+
+
+def test_appended_data_is_not_linearized(linearize):
+    doc = fitz.open()
+    doc.new_page()
+    data = encrypt_pdf_document(doc, "zhangsan")
+    assert not is_linearized(data + b"\n")
+
+
+def test_verify_accepts_outputs_without_linearization(monkeypatch, tmp_path):
+    monkeypatch.setattr(pdf_password, "pikepdf", None)
+    doc = fitz.open()
+    doc.new_page()
+    output = str(tmp_path / "out.pdf")
+    write_encrypted_document(doc, output, "zhangsan")
+
+    result = verify_output(output, "zhangsan")
+    assert result.ok, result.error
+    assert not result.linearized
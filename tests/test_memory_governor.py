@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from src.pdf_watermark_tab import memory_governor
+from src.pdf_watermark_tab.memory_governor import MemoryGovernor
+
+MB = 1024 * 1024
+
+
+@pytest.fixture(autouse=True)
+def plenty_of_memory(monkeypatch):
+    # 预算由测试指定，实际可用内存不参与判断
+    monkeypatch.setattr(memory_governor, "available_memory", lambda: 1 << 40)
+
+
+def test_acquire_and_release_track_reserved_memory():
+    governor = MemoryGovernor(budget_bytes=100 * MB)
+    assert governor.try_acquire(40 * MB)
+    assert governor.try_acquire(40 * MB)
+    assert (governor.reserved_bytes, governor.running) == (80 * MB, 2)
+    # 第三个文件会超出预算
+    assert not governor.try_acquire(40 * MB)
+    assert (governor.reserved_bytes, governor.running) == (80 * MB, 2)
+
+    governor.release(40 * MB)
+    assert (governor.reserved_bytes, governor.running) == (40 * MB, 1)
+    assert governor.try_acquire(40 * MB)
+    governor.release(40 * MB)
+    governor.release(40 * MB)
+    assert (governor.reserved_bytes, governor.running) == (0, 0)
+
+
+def test_oversized_job_runs_alone():
+    governor = MemoryGovernor(budget_bytes=100 * MB)
+    # 没有文件在处理时，超出预算的文件也允许开始，否则会一直等待
+    assert governor.try_acquire(300 * MB)
+    assert not governor.try_acquire(1 * MB)
+    governor.release(300 * MB)
+    assert governor.try_acquire(1 * MB)
+
+
+def test_low_available_memory_blocks_second_job(monkeypatch):
+    governor = MemoryGovernor(budget_bytes=100 * MB)
+    assert governor.try_acquire(10 * MB)
+    monkeypatch.setattr(memory_governor, "available_memory", lambda: 1 * MB)
+    assert not governor.try_acquire(10 * MB)
+
+
+def test_unknown_available_memory_does_not_limit(monkeypatch):
+    monkeypatch.setattr(memory_governor, "available_memory", lambda: None)
+    governor = MemoryGovernor()
+    assert governor.budget_bytes is None
+    assert all(governor.try_acquire(1 << 40) for _ in range(3))
+    assert governor.worker_limit([1 << 40], 4) == 4
+
+
+def test_worker_limit_follows_typical_estimate():
+    governor = MemoryGovernor(budget_bytes=100 * MB)
+    assert governor.worker_limit([], 4) == 4
+    assert governor.worker_limit([10 * MB] * 5, 4) == 4
+    # 按中位数估算，个别大文件不会拉低进程数
+    assert governor.worker_limit([30 * MB, 30 * MB, 400 * MB], 8) == 3
+    assert governor.worker_limit([60 * MB] * 3, 8) == 1
+    assert governor.worker_limit([500 * MB] * 3, 8) == 1
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+import config
+from src.pdf_watermark_tab.mrc import text_mask
+from src.pdf_watermark_tab.protect import ProtectOptions, protect_pdf
+
+
+@pytest.mark.parametrize("mode", ["raster", "vector"])
+def test_mrc_output_has_mask_and_jpeg_background(monkeypatch, pdf_factory, mode):
+    monkeypatch.setattr(config, "SECURE_RENDER_MODE", mode)
+    monkeypatch.setattr(config, "RASTER_CACHE_MAX_MB", 0)
+    with open(pdf_factory("lecture.pdf", pages=2), "rb") as f:
+        data = f.read()
+    secured = protect_pdf(data, ProtectOptions("张三", output_format="mrc"))
+
+    with fitz.open("pdf", secured) as doc:
+        assert doc.needs_pass
+        assert doc.authenticate("zhangsan")
+        assert doc.page_count == 2
+        for page in doc:
+            assert page.get_text().strip() == ""
+            images = page.get_images(full=True)
+            masks = [image for image in images if doc.xref_get_key(image[0], "ImageMask") == ("bool", "true")]
+            backgrounds = [image for image in images if image[8] == "DCTDecode"]
+            assert len(masks) == 1 and len(backgrounds) == 1
+            mask_xref, _, mask_width = masks[0][:3]
+            assert doc.xref_get_key(mask_xref, "BitsPerComponent") == ("int", "1")
+            # 文字层按 MRC_MASK_DPI 渲染，背景分辨率低得多
+            assert mask_width == round(page.rect.width * config.MRC_MASK_DPI / 72)
+            assert backgrounds[0][2] < mask_width / 2
+
+
+def test_text_mask_keeps_colored_text_in_background():
+    pixels = np.full((2, 3, 3), 255, dtype=np.uint8)
+    pixels[0, 0] = (20, 20, 20)     # 黑色文字
+    pixels[0, 1] = (200, 20, 20)    # 红色文字
+    pixels[0, 2] = (170, 170, 170)  # 浅灰底色
+    mask = text_mask(pixels)
+    assert mask.tolist() == [[True, False, False], [False, False, False]]
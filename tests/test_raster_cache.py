@@ -0,0 +1,65 @@
+import os
+
+import fitz  # PyMuPDF
+import numpy as np
+
+from src.pdf_watermark_tab import raster_cache
+from src.pdf_watermark_tab.raster_cache import PageRasterCache, _PageHasher
+
+
+def test_cached_pages_are_not_stored_in_plain(tmp_path):
+    cache = PageRasterCache(str(tmp_path / "cache"), max_bytes=1 << 24)
+    pixels = np.full((64, 48, 3), 200, dtype=np.uint8)
+    cache.put("abc", pixels)
+
+    names = os.listdir(cache.cache_dir)
+    assert len(names) == 1 and "abc" not in names[0]
+    with open(os.path.join(cache.cache_dir, names[0]), "rb") as f:
+        data = f.read()
+    # 文件头（宽、高）不能以明文出现
+    assert not data.startswith((48).to_bytes(4, "little"))
+    assert np.array_equal(cache.get("abc"), pixels)
+    assert cache.get("abd") is None
+
+
+def test_plain_and_expired_entries_are_removed(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    (cache_dir / "old.raster").write_bytes(b"plain")
+    cache = PageRasterCache(str(cache_dir), max_bytes=1 << 24, max_age_days=7)
+    cache.put("abc", np.zeros((4, 4, 3), dtype=np.uint8))
+    path = os.path.join(cache.cache_dir, os.listdir(cache.cache_dir)[0])
+    os.utime(path, (0, 0))
+
+    PageRasterCache(str(cache_dir), max_bytes=1 << 24, max_age_days=7)
+    assert os.listdir(cache_dir) == []
+
+
+def test_references_with_nonzero_generation_are_followed():
+    hashes = []
+    for content in (b"0 0 1 rg", b"1 0 0 rg"):
+        doc = fitz.open()
+        xref = doc.get_new_xref()
+        doc.update_object(xref, "<< /Length 0 >>")
+        doc.update_stream(xref, content)
+        hashes.append(_PageHasher(doc)._inline_hash(f"<< /X1 {xref} 1 R >>"))
+        doc.close()
+    # 引用的对象内容不同，哈希必须不同（不能因为代数不是0就只比较对象编号）
+    assert hashes[0] != hashes[1]
+
+
+def test_long_lived_cache_expires_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(raster_cache, "_EXPIRY_SWEEP_SECONDS", 0)
+    cache = PageRasterCache(str(tmp_path / "cache"), max_bytes=1 << 24, max_age_days=7)
+    pixels = np.zeros((4, 4, 3), dtype=np.uint8)
+    cache.put("old", pixels)
+    old_path = os.path.join(cache.cache_dir, os.listdir(cache.cache_dir)[0])
+    os.utime(old_path, (0, 0))
+
+    # 过期后即使还没清理也不再命中
+    assert cache.get("old") is None
+    # 同一个实例之后的写入会清理过期的页面
+    cache.put("new", pixels)
+    assert not os.path.exists(old_path)
+    assert len(os.listdir(cache.cache_dir)) == 1
+    assert np.array_equal(cache.get("new"), pixels)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+import config
+from src.pdf_watermark_tab.scheduler import PdfJob, ThroughputStats
+
+
+@pytest.fixture
+def stats(tmp_path):
+    return ThroughputStats(str(tmp_path / "stats.json"))
+
+
+def _job():
+    # 10页A4，150 DPI约合2.2百万像素/页
+    return PdfJob("a.pdf", 10, 10 * 595 * 842, 150)
+
+
+def test_raster_run_does_not_teach_vector_rates(stats, monkeypatch):
+    monkeypatch.setattr(config, "SECURE_RENDER_MODE", "raster")
+    job = _job()
+    vector_rates = (stats.rates["watermark_per_page"], stats.rates["secure_per_mpx"])
+
+    # raster模式下前两步的回调紧挨着触发，水印一步几乎为0
+    stats.record(job, [0.0001, 4.0, 0.5])
+
+    assert (stats.rates["watermark_per_page"], stats.rates["secure_per_mpx"]) == vector_rates
+    expected = 0.7 * 0.06 + 0.3 * 4.0001 / job.megapixels
+    assert stats.rates["raster_per_mpx"] == pytest.approx(expected)
+
+
+def test_prediction_follows_render_mode(stats, monkeypatch):
+    job = _job()
+    monkeypatch.setattr(config, "SECURE_RENDER_MODE", "vector")
+    stats.record(job, [1.0, 4.0, 0.5])
+    vector_prediction = stats.predict(job)
+    assert vector_prediction == pytest.approx(
+        job.pages * stats.rates["watermark_per_page"]
+        + job.megapixels * (stats.rates["secure_per_mpx"] + stats.rates["password_per_mpx"]))
+
+    monkeypatch.setattr(config, "SECURE_RENDER_MODE", "raster")
+    assert stats.predict(job) == pytest.approx(
+        job.megapixels * (stats.rates["raster_per_mpx"] + stats.rates["password_per_mpx"]))
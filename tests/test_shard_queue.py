@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+import fitz  # PyMuPDF
+
+from src.pdf_watermark_tab import shard_queue
+from src.pdf_watermark_tab.shard_queue import CLAIMED_DIR, DONE_DIR, PENDING_DIR, ShardCoordinator, ShardWorker
+
+
+def test_requeue_removes_partial_output_of_lost_worker(tmp_path, pdf_factory):
+    source = pdf_factory("doc5.pdf", directory=tmp_path / "share" / "input")
+    output_dir = tmp_path / "share" / "output"
+    coordinator = ShardCoordinator(str(tmp_path / "share" / "queue"), lease_seconds=0)
+    job_id, = coordinator.submit([source], str(output_dir), "张三", "张三 测试")
+
+    # 节点A领取任务后在写出过程中被结束
+    claim = coordinator.path(CLAIMED_DIR, f"{job_id}@A.json")
+    os.rename(coordinator.path(PENDING_DIR, job_id + ".json"), claim)
+    output, partial = coordinator.output_paths(coordinator._jobs[job_id], "A")
+    os.makedirs(output_dir, exist_ok=True)
+    with open(partial, "wb") as f:
+        f.write(b"%PDF-1.7 partial")
+
+    coordinator.requeue_stale()  # 第一次只记录租约
+    assert coordinator.requeue_stale() == 1
+
+    assert not os.path.exists(partial)
+    assert not os.path.exists(claim)
+    assert os.path.exists(coordinator.path(PENDING_DIR, job_id + ".json"))
+    assert os.listdir(output_dir) == []
+
+
+def _read_done(coordinator, job_id):
+    with open(coordinator.path(DONE_DIR, job_id + ".json"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_slow_worker_cannot_publish_after_requeue(tmp_path, pdf_factory):
+    source = pdf_factory("doc1.pdf", directory=tmp_path / "share" / "input")
+    output_dir = tmp_path / "share" / "output"
+    coordinator = ShardCoordinator(str(tmp_path / "share" / "queue"), lease_seconds=0)
+    job_id, = coordinator.submit([source], str(output_dir), "张三", "张三 测试")
+
+    # 节点A领取后处理得很慢，协调端认为它已失联并收回任务
+    slow = ShardWorker(coordinator.queue_dir, max_workers=1, worker_id="A", poll_interval=0.05)
+    job, claim = slow.claim()
+    output, partial = slow.output_paths(job, "A")
+    coordinator.requeue_stale()
+    assert coordinator.requeue_stale() == 1
+
+    # 节点B处理重新放回的任务
+    ShardWorker(coordinator.queue_dir, max_workers=1, worker_id="B", poll_interval=0.05).run(exit_when_idle=True)
+    assert _read_done(coordinator, job_id)["worker"] == "B"
+    with open(output, "rb") as f:
+        published = f.read()
+
+    # 节点A这时才处理完，不能再发布结果
+    os.makedirs(output_dir, exist_ok=True)
+    with open(partial, "wb") as f:
+        f.write(b"%PDF-1.7 late")
+    late = Future()
+    late.set_result(("zhangsan", "0" * 64, "0" * 64))
+    slow._publish(late, job, claim, output, partial, 0.0)
+
+    assert slow.completed == 0
+    assert not os.path.exists(partial)
+    assert _read_done(coordinator, job_id)["worker"] == "B"
+    with open(output, "rb") as f:
+        assert f.read() == published
+
+
+def test_two_workers_process_queue_end_to_end(tmp_path, pdf_factory):
+    inputs = [pdf_factory(f"doc{i}.pdf", pages=2, directory=tmp_path / "share" / "input") for i in range(4)]
+    coordinator = ShardCoordinator(str(tmp_path / "share" / "queue"))
+    job_ids = coordinator.submit(inputs, str(tmp_path / "share" / "output"), "张三", "张三 测试", dpi=72)
+
+    workers = [ShardWorker(coordinator.queue_dir, max_workers=1, worker_id=name, poll_interval=0.05)
+               for name in ("A", "B")]
+    threads = [threading.Thread(target=worker.run, kwargs={"exit_when_idle": True}) for worker in workers]
+    for thread in threads:
+        thread.start()
+    results = coordinator.wait(job_ids, poll_interval=0.05)
+    for thread in threads:
+        thread.join(60)
+
+    assert sorted(result.job["id"] for result in results) == sorted(job_ids)
+    assert all(result.success for result in results)
+    assert sum(worker.completed for worker in workers) == len(job_ids)
+    assert coordinator.counts() == (0, 0, len(job_ids))
+    for result in results:
+        with fitz.open(result.output) as doc:
+            assert doc.authenticate(result.password)
+            assert doc.page_count == 2
+    assert not [name for name in os.listdir(tmp_path / "share" / "output") if name.endswith(".part")]
+
+
+def test_requeue_during_publish_leaves_result_with_worker(tmp_path, pdf_factory, monkeypatch):
+    source = pdf_factory("doc1.pdf", directory=tmp_path / "share" / "input")
+    output_dir = tmp_path / "share" / "output"
+    coordinator = ShardCoordinator(str(tmp_path / "share" / "queue"), lease_seconds=0)
+    job_id, = coordinator.submit([source], str(output_dir), "张三", "张三 测试")
+
+    worker = ShardWorker(coordinator.queue_dir, max_workers=1, worker_id="A")
+    job, claim = worker.claim()
+    output, partial = worker.output_paths(job, "A")
+    os.makedirs(output_dir, exist_ok=True)
+    with open(partial, "wb") as f:
+        f.write(b"%PDF-1.7 done")
+    coordinator.requeue_stale()  # 第一次只记录租约
+
+    # 协调端恰好在节点发布结果的过程中检查租约
+    replace = os.replace
+    requeued = []
+
+    def replace_during_requeue(src, dst):
+        if src == partial:
+            requeued.append(coordinator.requeue_stale())
+        return replace(src, dst)
+
+    monkeypatch.setattr(shard_queue.os, "replace", replace_during_requeue)
+    finished = Future()
+    finished.set_result(("zhangsan", "0" * 64, "0" * 64))
+    worker._publish(finished, job, claim, output, partial, 0.0)
+
+    assert requeued == [0]
+    assert _read_done(coordinator, job_id)["success"] is True
+    assert coordinator.counts() == (0, 0, 1)
+    assert os.path.exists(output)
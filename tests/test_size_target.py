@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+
+import config
+from src.pdf_watermark_tab import size_target
+from src.pdf_watermark_tab.protect import ProtectOptions, protect_pdf
+from src.pdf_watermark_tab.size_target import SizeSearch, SizeSettings, tuning_key
+
+
+class _FakeOutput:
+    """大小与DPI平方成正比的"安全文档"，不实际渲染"""
+
+    def __init__(self, size):
+        self.size = size
+
+    def tobytes(self, **kwargs):
+        return bytes(self.size)
+
+    def close(self):
+        pass
+
+
+def _fake_render(bytes_per_dpi2):
+    calls = []
+
+    def render(doc, dpi, jpeg_quality):
+        calls.append((dpi, jpeg_quality))
+        return _FakeOutput(int(bytes_per_dpi2 * dpi * dpi * len(doc)))
+    return render, calls
+
+
+def _image_pdf(path, pages):
+    """每页一张随机噪点图片，几乎无法压缩"""
+    rng = np.random.default_rng(1)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page(width=300, height=400)
+        noise = rng.integers(0, 256, (50, 38, 3), dtype=np.uint8)
+        pix = fitz.Pixmap(fitz.csRGB, 38, 50, noise.tobytes(), False)
+        page.insert_image(page.rect, pixmap=pix)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture
+def tuning_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "USER_DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.setattr(config, "RASTER_CACHE_MAX_MB", 0)
+    return tmp_path / "data"
+
+
+def test_search_finds_highest_dpi_under_target():
+    doc = fitz.open()
+    for _ in range(2):
+        doc.new_page()
+    render, calls = _fake_render(1.0)
+    search = SizeSearch(doc, max_bytes=20000 * 2, dpi=300, render=render)
+    settings = search.search(target=20000 * 2)
+
+    # 2页 × dpi² ≤ 40000 → dpi ≤ 141；二分5次的精度为 (300-72)/32 ≈ 7 DPI
+    assert settings.estimate <= 40000
+    assert 141 - 8 <= settings.dpi <= 141
+    assert len(calls) == 2 + config.SIZE_SEARCH_STEPS
+
+
+def test_search_returns_requested_settings_when_they_fit():
+    doc = fitz.open()
+    doc.new_page()
+    render, calls = _fake_render(0.01)
+    settings = SizeSearch(doc, max_bytes=10 ** 9, dpi=150, render=render).search()
+    assert settings.dpi == 150
+    assert calls == [(150, config.MRC_JPEG_QUALITY)]
+
+
+def test_correct_scales_dpi_by_area_and_stops_at_minimum():
+    doc = fitz.open()
+    doc.new_page()
+    search = SizeSearch(doc, max_bytes=1000, dpi=200, render=None)
+    corrected = search.correct(SizeSettings(200, config.MRC_JPEG_QUALITY), actual=4000)
+    # 面积与DPI平方成正比，4倍大小 → DPI约减半（再乘以余量）
+    assert corrected.dpi == int(200 * (1000 * config.SIZE_TARGET_MARGIN / 4000) ** 0.5)
+    assert search.correct(SizeSettings(search.min_dpi, search.min_quality), actual=4000) is None
+
+
+def test_tuning_key_depends_on_every_size_parameter():
+    base = ("a" * 64, 1000, 150, "flat", "auto")
+    key = tuning_key(*base)
+    assert key == tuning_key(*base)
+    for index, value in enumerate(("b" * 64, 2000, 200, "mrc", "gray")):
+        changed = list(base)
+        changed[index] = value
+        assert tuning_key(*changed) != key
+
+
+def test_image_heavy_pdf_fits_max_bytes(tuning_dir, tmp_path):
+    with open(_image_pdf(str(tmp_path / "scan.pdf"), pages=6), "rb") as f:
+        data = f.read()
+    full = len(protect_pdf(data, ProtectOptions("张三", dpi=150)))
+    max_bytes = full * 2 // 3
+
+    secured = protect_pdf(data, ProtectOptions("张三", dpi=150, max_bytes=max_bytes))
+    assert len(secured) <= max_bytes
+    with fitz.open("pdf", secured) as doc:
+        assert doc.authenticate("zhangsan")
+        assert doc.page_count == 6
+
+
+def test_second_run_reads_cached_settings(tuning_dir, tmp_path, monkeypatch):
+    with open(_image_pdf(str(tmp_path / "scan.pdf"), pages=6), "rb") as f:
+        data = f.read()
+    max_bytes = len(protect_pdf(data, ProtectOptions("张三", dpi=150))) // 2
+    protect_pdf(data, ProtectOptions("张三", dpi=150, max_bytes=max_bytes))
+
+    loaded = []
+    load_settings = size_target.load_settings
+
+    def spy(key):
+        settings = load_settings(key)
+        loaded.append(settings)
+        return settings
+
+    def no_search(self, target=None):
+        raise AssertionError("第二次处理不应重新搜索")
+
+    monkeypatch.setattr(size_target, "load_settings", spy)
+    monkeypatch.setattr(SizeSearch, "search", no_search)
+    secured = protect_pdf(data, ProtectOptions("李四", dpi=150, max_bytes=max_bytes))
+    assert len(loaded) == 1 and loaded[0] is not None and loaded[0].dpi < 150
+    assert len(secured) <= max_bytes
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fitz  # PyMuPDF
+import numpy as np
+
+import config
+from src.pdf_watermark_tab.pipeline import convert_document_to_secure
+from src.pdf_watermark_tab.tiling import page_pixel_size, render_region, tile_rects
+
+DPI = 100
+
+
+def _poster():
+    """带文字、线条和渐变色块的大页面"""
+    doc = fitz.open()
+    page = doc.new_page(width=1200, height=900)
+    for i in range(12):
+        page.draw_rect(fitz.Rect(i * 97, i * 71, i * 97 + 160, i * 71 + 90), color=(0, 0, 1),
+                       fill=(i / 12, 0.5, 1 - i / 12), width=2)
+        page.insert_text((30 + i * 90, 40 + i * 65), f"Tile seam {i}", fontsize=18 + i)
+    page.draw_line((0, 0), (1200, 900), color=(1, 0, 0), width=3)
+    return doc
+
+
+def _full_render(page):
+    zoom = DPI / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+
+
+def test_tiles_match_untiled_render():
+    with _poster() as doc:
+        page = doc[0]
+        full = _full_render(page)
+        width, height = page_pixel_size(page, DPI)
+        assert full.shape[:2] == (height, width)
+
+        assembled = np.zeros_like(full)
+        for x0, y0, x1, y1 in tile_rects(width, height, tile_size=257):
+            assembled[y0:y1, x0:x1] = render_region(page, DPI, (x0, y0, x1, y1))
+        # 文字抗锯齿在分块边缘附近可能相差几个灰度级
+        difference = np.abs(assembled.astype(np.int16) - full.astype(np.int16))
+        assert difference.max() <= 48
+        assert difference.mean() < 0.05 and (difference > 8).mean() < 0.001
+
+
+class _ShiftedPage:
+    """get_pixmap返回的像素原点比请求的区域偏移若干像素，模拟浮点误差"""
+
+    def __init__(self, page, shift):
+        self.page = page
+        self.shift = shift
+
+    def get_pixmap(self, matrix, clip, **kwargs):
+        offset = self.shift / matrix.a
+        clip = fitz.Rect(clip.x0 + offset, clip.y0 + offset, clip.x1 + offset, clip.y1 + offset)
+        return self.page.get_pixmap(matrix=matrix, clip=clip, **kwargs)
+
+
+def test_region_with_shifted_pixmap_origin():
+    with _poster() as doc:
+        full = _full_render(doc[0])
+        x0, y0, x1, y1 = 300, 200, 420, 290
+        for shift in (-3, 3):
+            region = render_region(_ShiftedPage(doc[0], shift), DPI, (x0, y0, x1, y1))
+            assert region.shape == (y1 - y0, x1 - x0, 3)
+            # 多渲染的一个像素抵消不了3个像素的偏移，没有覆盖到的2行2列补为白色，其余与整页渲染一致
+            covered = slice(2, None) if shift > 0 else slice(None, -2)
+            missing = slice(None, 2) if shift > 0 else slice(-2, None)
+            expected = full[y0:y1, x0:x1][covered, covered].astype(np.int16)
+            assert np.abs(region[covered, covered].astype(np.int16) - expected).mean() < 0.5
+            assert (region[missing] == 255).all() and (region[:, missing] == 255).all()
+
+
+def test_tiled_secure_page_matches_untiled(monkeypatch):
+    with _poster() as doc:
+        untiled = convert_document_to_secure(doc, dpi=DPI)
+        monkeypatch.setattr(config, "TILE_PIXEL_THRESHOLD", 100000)
+        monkeypatch.setattr(config, "TILE_SIZE", 300)
+        tiled = convert_document_to_secure(doc, dpi=DPI)
+
+    assert len(tiled[0].get_images()) > 1
+    assert len(untiled[0].get_images()) == 1
+    a = tiled[0].get_pixmap(alpha=False)
+    b = untiled[0].get_pixmap(alpha=False)
+    assert (a.width, a.height) == (b.width, b.height)
+    pixels_a = np.frombuffer(a.samples, dtype=np.uint8).astype(np.int16)
+    pixels_b = np.frombuffer(b.samples, dtype=np.uint8).astype(np.int16)
+    assert np.abs(pixels_a - pixels_b).mean() < 1.0
+    tiled.close()
+    untiled.close()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import fitz  # PyMuPDF
+
+from src.pdf_watermark_tab.pdf_password import write_encrypted_document
+from src.pdf_watermark_tab.verify import verify_output, verify_outputs
+
+
+def _encrypted(path, password, pages=1):
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page()
+    write_encrypted_document(doc, str(path), password)
+    doc.close()
+    return str(path)
+
+
+def test_unencrypted_output_fails(tmp_path, pdf_factory):
+    result = verify_output(pdf_factory("plain.pdf"), "zhangsan")
+    assert not result.ok
+    assert "没有加密" in result.error
+
+
+def test_wrong_password_fails(tmp_path):
+    result = verify_output(_encrypted(tmp_path / "out.pdf", "lisi"), "zhangsan")
+    assert not result.ok
+
+
+def test_parallel_verification_keeps_entry_order(tmp_path, pdf_factory):
+    entries = [(_encrypted(tmp_path / f"out{i}.pdf", "zhangsan", pages=i + 1), "zhangsan", None)
+               for i in range(3)]
+    entries.append((pdf_factory("plain.pdf"), "zhangsan", None))
+    reported = []
+    results = verify_outputs(entries, max_workers=2, callback=reported.append)
+
+    assert [r.output for r in results] == [entry[0] for entry in entries]
+    assert [r.ok for r in results] == [True, True, True, False]
+    assert [r.pages for r in results[:3]] == [1, 2, 3]
+    assert sorted(r.output for r in reported) == sorted(entry[0] for entry in entries)
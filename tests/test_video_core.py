@@ -0,0 +1,50 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from src.pdf_watermark_tab.pipeline import default_watermark_image
+from src.video_watermark_tab import video_core
+
+
+ffmpeg = shutil.which("ffmpeg")
+pytestmark = pytest.mark.skipif(ffmpeg is None, reason="需要ffmpeg")
+
+
+@pytest.fixture
+def sample_video(tmp_path):
+    path = str(tmp_path / "sample.mp4")
+    subprocess.run([ffmpeg, "-loglevel", "error", "-y", "-f", "lavfi", "-i", "testsrc=size=64x48:rate=10",
+                    "-t", "3", "-pix_fmt", "yuv420p", path], check=True)
+    return path
+
+
+def test_decoder_failure_is_reported(tmp_path, sample_video, monkeypatch):
+    # 解码器输出1秒的帧后报错退出，模拟视频中途损坏
+    wrapper = tmp_path / "ffmpeg"
+    wrapper.write_text(
+        "#!/bin/sh\n"
+        'for last; do :; done\n'
+        'if [ "$last" = "-" ]; then\n'
+        f'  "{ffmpeg}" "$@" -t 1 || exit 1\n'
+        '  echo "corrupt packet at 1s" >&2\n'
+        "  exit 1\n"
+        "fi\n"
+        f'exec "{ffmpeg}" "$@"\n'
+    )
+    wrapper.chmod(0o755)
+    monkeypatch.setattr(video_core, "find_ffmpeg", lambda: str(wrapper))
+
+    output = str(tmp_path / "out.mp4")
+    overlay = video_core.build_video_overlay(64, 48, default_watermark_image(), "张三", dpi=72)
+    with pytest.raises(RuntimeError, match="corrupt packet"):
+        video_core.watermark_video(sample_video, output, overlay, batch_frames=4)
+    assert not os.path.exists(output)
+
+
+def test_successful_run_returns_all_frames(tmp_path, sample_video):
+    output = str(tmp_path / "out.mp4")
+    overlay = video_core.build_video_overlay(64, 48, default_watermark_image(), "张三", dpi=72)
+    assert video_core.watermark_video(sample_video, output, overlay, batch_frames=4) == 30
+    assert os.path.getsize(output) > 0
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+from concurrent.futures import Future
+
+from src.pdf_watermark_tab.memory_governor import MemoryGovernor
+from src.pdf_watermark_tab.watch_folder import FOLDER_CONFIG_NAME, WatchFolderService
+
+
+class _PendingPool:
+    """记录提交的任务，任务一直不完成（模拟正在处理）"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted.append(args[0])
+        return Future()
+
+
+def test_rescan_does_not_queue_waiting_files_again(tmp_path, pdf_factory):
+    inbox = tmp_path / "inbox"
+    for i in range(6):
+        pdf_factory(f"doc{i}.pdf", pages=i + 1, directory=inbox)
+    (inbox / FOLDER_CONFIG_NAME).write_text(json.dumps({"student_name": "张三"}), encoding="utf-8")
+
+    service = WatchFolderService(str(inbox), str(tmp_path / "outbox"), max_workers=1, settle_seconds=0)
+    service._governor = MemoryGovernor(budget_bytes=None)
+    pool = _PendingPool()
+    for _ in range(5):
+        service._scan_inbox()
+        service._submit_settled(pool)
+
+    waiting = [item[0] for item in service._waiting]
+    assert len(pool.submitted) == 1
+    assert len(waiting) == 5
+    assert sorted(waiting + pool.submitted) == sorted(str(inbox / f"doc{i}.pdf") for i in range(6))
+
+
+def test_bad_folder_config_and_unreadable_pdf_are_quarantined(tmp_path, pdf_factory):
+    inbox = tmp_path / "inbox"
+    pdf_factory("good.pdf", directory=inbox / "good")
+    (inbox / "good" / FOLDER_CONFIG_NAME).write_text(json.dumps({"student_name": "张三"}), encoding="utf-8")
+    pdf_factory("bad_dpi.pdf", directory=inbox / "bad_dpi")
+    (inbox / "bad_dpi" / FOLDER_CONFIG_NAME).write_text(
+        json.dumps({"student_name": "张三", "dpi": "high"}), encoding="utf-8")
+    (inbox / "good" / "broken.pdf").write_bytes(b"not a pdf %%EOF")
+
+    service = WatchFolderService(str(inbox), str(tmp_path / "outbox"), max_workers=4, settle_seconds=0)
+    pool = _PendingPool()
+    service._scan_inbox()
+    service._submit_settled(pool)
+
+    assert pool.submitted == [str(inbox / "good" / "good.pdf")]
+    assert (inbox / ".failed" / "bad_dpi" / "bad_dpi.pdf.error.txt").exists()
+    assert (inbox / ".failed" / "good" / "broken.pdf").exists()
+
+
+def test_pdf_without_student_name_is_archived_once(tmp_path, pdf_factory, capsys):
+    inbox = tmp_path / "inbox"
+    pdf_factory("anonymous.pdf", directory=inbox / "unconfigured")
+
+    service = WatchFolderService(str(inbox), str(tmp_path / "outbox"), max_workers=1, settle_seconds=0)
+    pool = _PendingPool()
+    for _ in range(3):
+        service._scan_inbox()
+        service._submit_settled(pool)
+
+    assert pool.submitted == []
+    assert capsys.readouterr().out.count("没有配置学生名") == 1
+    assert not (inbox / "unconfigured" / "anonymous.pdf").exists()
+    assert (inbox / ".failed" / "unconfigured" / "anonymous.pdf.error.txt").exists()